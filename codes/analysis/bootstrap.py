@@ -0,0 +1,257 @@
+#! python3
+
+# ?? This script computes bootstrap standard errors and confidence intervals
+# ?? of the summary statistics of the cleaned panels (as printed by
+# ?? SIPP_summary in codes/clean/aSIPP.py) and of the transition matrices
+# ?? (see codes/analysis/transitions.py), resampling individuals ("indid")
+# ?? with replacement within each panel, as an individual contributes several
+# ?? months and spells.
+
+# &? Resampled datasets are never materialized: a replication is a vector of
+# &? multinomial draws (how many times each individual is drawn), and each
+# &? statistic is a sum over individuals (or spells) of its contributions,
+# &? scaled by the draws of their individual:
+# &?     summary statistics: draws @ per-individual counts,
+# &?     transition matrices: np.bincount of the spell weights times the draws
+# &?                          of their individual, by triple.
+# &? Replications run in blocks in a process pool. Block b draws from its own
+# &? seed np.random.SeedSequence(seed).spawn(n_blocks)[b], so the results only
+# &? depend on seed and n_reps, not on the number of workers.
+
+import numpy as np
+import pandas as pd
+
+from analysis.spells import notions, spell_table
+from analysis.transitions import transition_matrix, switch_rates
+from analysis.transitions import mobility_rates
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. contributions of each individual
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def person_metrics(temp: pd.DataFrame) -> tuple:
+    """
+    This function returns the individuals of a cleaned panel (codes 0, 1, ...
+    in order of first appearance) and a DataFrame of their contributions to
+    each statistic printed by SIPP_summary (one row per individual), so that
+    a statistic is the column sum.
+    """
+
+    person = pd.factorize(temp["indid"])[0]
+    n_persons = person.max() + 1 if len(person) else 0
+
+    def total(flags):
+        return np.bincount(person, weights=flags, minlength=n_persons)
+
+    def first(col, flags=None):
+        spell_no = temp[col] if flags is None else temp[col].where(flags)
+        return (spell_no.notna() & ~spell_no.duplicated()).to_numpy()
+
+    has_occ = (
+        temp["source_occ_raw"].notna() & temp["destination_occ_raw"].notna()
+    )
+    empl = (temp["empl"] == 1).to_numpy()
+
+    metrics = pd.DataFrame(
+        {
+            "num_ubar_spell_no": total(first("ubar_spell_no")),
+            "num_ustar_spell_no": total(first("ustar_spell_no")),
+            "num_u_spell_no": total(first("u_spell_no")),
+            "num_indid_ubar": total(first("ubar_spell_no")) > 0,
+            "num_indid_ustar": total(first("ustar_spell_no")) > 0,
+            "num_indid_u": total(first("u_spell_no")) > 0,
+            "no_firmid": total(empl & temp["firmid"].isna().to_numpy()),
+            "no_occraw": total(empl & temp["occ_raw"].isna().to_numpy()),
+            "num_ubar_occ": total(first("ubar_spell_no", has_occ)),
+            "num_ustar_occ": total(first("ustar_spell_no", has_occ)),
+            "num_u_occ": total(first("u_spell_no", has_occ)),
+        }
+    ).astype("float64")
+
+    return person, metrics
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. replications
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+# &? data shared by the replications of a worker process (set by _init)
+_data = {}
+
+
+def _init(data: dict):
+    _data.update(data)
+
+
+def draw_persons(rng, strata: np.ndarray, n_reps: int) -> np.ndarray:
+    """
+    This function draws n_reps bootstrap replications of individuals within
+    strata (e.g., panels): row r holds how many times each individual is
+    drawn in replication r, and each stratum keeps its number of individuals.
+    """
+
+    draws = np.zeros((n_reps, len(strata)))
+    for stratum in np.unique(strata):
+        members = np.flatnonzero(strata == stratum)
+        draws[:, members] = rng.multinomial(
+            len(members), np.full(len(members), 1 / len(members)), n_reps
+        )
+
+    return draws
+
+
+def _replicate(seed, n_reps: int) -> dict:
+    """
+    This function runs one block of n_reps replications, and returns the
+    statistics of each replication: the summary statistics, and the weights
+    of the triples of each transition matrix.
+    """
+
+    rng = np.random.default_rng(seed)
+    draws = draw_persons(rng, _data["strata"], n_reps)
+
+    result = {"metrics": draws @ _data["metrics"]}
+    for notion, (pair, person, weight, n_triples) in _data["spells"].items():
+        kept = pair >= 0
+        scaled = draws[:, person[kept]] * weight[kept]
+        flat = (np.arange(n_reps)[:, None] * n_triples + pair[kept]).ravel()
+        result[notion] = np.bincount(
+            flat, weights=scaled.ravel(), minlength=n_reps * n_triples
+        ).reshape(n_reps, n_triples)
+
+    return result
+
+
+def group_sums(reps: np.ndarray, groups: np.ndarray, n_groups: int):
+    """
+    This function sums the columns of reps (one row per replication) by
+    group, column i being in group groups[i], and returns one row per
+    replication and one column per group.
+    """
+
+    n_reps = len(reps)
+    flat = (np.arange(n_reps)[:, None] * n_groups + groups).ravel()
+
+    return np.bincount(
+        flat, weights=reps.ravel(), minlength=n_reps * n_groups
+    ).reshape(n_reps, n_groups)
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 3. bootstrap
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def intervals(estimate, reps: np.ndarray, alpha: float = 0.05) -> dict:
+    """
+    This function returns the estimate, the bootstrap standard error, and the
+    percentile confidence interval (level 1 - alpha) of statistics, given
+    their replications (one row per replication). Replications where a
+    statistic is undefined (missing) are skipped.
+    """
+
+    return {
+        "estimate": np.asarray(estimate),
+        "se": np.nanstd(reps, axis=0, ddof=1),
+        "lower": np.nanquantile(reps, alpha / 2, axis=0),
+        "upper": np.nanquantile(reps, 1 - alpha / 2, axis=0),
+    }
+
+
+def bootstrap(
+    temp: pd.DataFrame,
+    notions: list = notions,
+    by: list = ["panel"],
+    n_reps: int = 999,
+    seed: int = 0,
+    n_workers: int = None,
+    block: int = 50,
+    alpha: float = 0.05,
+) -> dict:
+    """
+    This function bootstraps the summary statistics and the transition
+    matrices (by the cell variables in by) of a cleaned panel, resampling
+    individuals within panels, with n_reps replications in n_workers parallel
+    processes (by default, one per CPU core). It returns a dictionary of
+    DataFrames with the estimate, standard error ("se"), and confidence
+    interval ("lower", "upper") of each statistic:
+        "metrics":               the statistics printed by SIPP_summary,
+        "switch_rates_{notion}": switch_rates of each cell,
+        "rates_{notion}":        mobility_rates of each triple.
+    """
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    person, metrics = person_metrics(temp)
+    strata = temp["panel"].to_numpy("int64")[
+        np.unique(person, return_index=True)[1]
+    ]
+
+    matrices, spells = {}, {}
+    for notion in notions:
+        table = spell_table(temp, notion)
+        matrices[notion] = transition_matrix(table, by)
+        first = temp[f"{notion}_spell_no"]
+        first = (first.notna() & ~first.duplicated()).to_numpy()
+        spells[notion] = (
+            matrices[notion]["pair"],
+            person[first],
+            table["weight"].to_numpy("float64"),
+            len(matrices[notion]["weight"]),
+        )
+
+    # -? replications, in blocks of at most block replications
+    sizes = [block] * (n_reps // block)
+    if n_reps % block:
+        sizes.append(n_reps % block)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    data = {"strata": strata, "metrics": metrics.to_numpy(), "spells": spells}
+    with ProcessPoolExecutor(
+        max_workers=n_workers, initializer=_init, initargs=(data,)
+    ) as pool:
+        blocks = list(pool.map(_replicate, seeds, sizes))
+
+    reps = {
+        key: np.concatenate([result[key] for result in blocks], axis=0)
+        for key in blocks[0]
+    }
+
+    # -? estimates and intervals
+    results = {
+        "metrics": pd.DataFrame(
+            intervals(metrics.sum(axis=0), reps["metrics"], alpha),
+            index=metrics.columns,
+        )
+    }
+    for notion, matrix in matrices.items():
+        weights = reps[notion]
+        n_codes = len(matrix["codes"])
+        n_cells = len(matrix["cells"])
+        switch = matrix["source"] != matrix["destination"]
+        rows = matrix["cell"] * n_codes + matrix["source"]
+
+        # &? statistics of all replications at once: rows of weights are
+        # &? replications, summed by cell or row (see group_sums)
+        cell = matrix["cell"]
+        _, row_ids = np.unique(rows, return_inverse=True)
+        n_rows = row_ids.max() + 1 if len(rows) else 0
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rep_switch = group_sums(weights * switch, cell, n_cells) / (
+                group_sums(weights, cell, n_cells)
+            )
+            rep_rates = (
+                weights / group_sums(weights, row_ids, n_rows)[:, row_ids]
+            )
+
+        estimate = switch_rates(matrix)
+        results[f"switch_rates_{notion}"] = estimate.assign(
+            **intervals(estimate["switch_rate"], rep_switch, alpha)
+        )
+        estimate = mobility_rates(matrix)
+        results[f"rates_{notion}"] = estimate.assign(
+            **intervals(estimate["rate"], rep_rates, alpha)
+        )
+
+    return results
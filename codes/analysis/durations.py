@@ -0,0 +1,220 @@
+#! python3
+
+# ?? This script estimates the duration of nonemployment spells of the cleaned
+# ?? panels: weighted ("pweights") Kaplan-Meier survival, monthly exit hazards,
+# ?? and occupation switching hazards by spell length, for each notion of
+# ?? unemployment ("ubar", "ustar", "u"), by panel and demographic cell.
+
+# &? E(UBAR)E spells are only the nonemployment runs with an employed month
+# &? on both sides within a continuous spell ("cont_spell_no"). The other runs
+# &? are rebuilt here from "empl":
+# &?     left-censored:  the run starts in the first month of a continuous
+# &?                     spell (no "start_of_ubar"), so its start is not
+# &?                     observed and its length counts from the first month;
+# &?                     the months before are unknown, so such a run looks
+# &?                     shorter than it is and cannot enter the risk set at
+# &?                     its elapsed length: left out of the survival tables
+# &?                     unless left_censored=True,
+# &?     right-censored: the run ends in the last month of a continuous spell
+# &?                     (no "end_of_ubar"), so it is still going on when last
+# &?                     observed; it enters the risk set until then but does
+# &?                     not count as an exit.
+# &? Runs that are neither are exactly the E(UBAR)E spells (with the same
+# &? length as "len_ubar_spell"). The notions of a run follow step 6 of
+# &? SIPP_spells: any run is "ubar", a run with at least one month of
+# &? "unempl" is "ustar", and a run with "unempl" in all months is "u".
+
+# &? All tabulations are np.bincount over the combined key cell * L + length
+# &? (L: the longest run plus one), so the estimates of all cells come out of
+# &? a few passes over the runs.
+
+import numpy as np
+import pandas as pd
+
+from analysis.spells import notions
+from util.cells import cell_index
+from util.funcsforpandas import segments
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. nonemployment runs
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def nonemployment_runs(temp: pd.DataFrame, occ: str = "raw") -> pd.DataFrame:
+    """
+    This function collapses a cleaned panel (sorted by "indid" and "ym") into
+    one row per run of nonemployed months within a continuous spell, with the
+    individual, the first month, the length, whether the run is left- or
+    right-censored, its number of "unempl" months, the source and destination
+    occupations of E(UBAR)E spells ("source_occ_" and "destination_occ_"
+    followed by occ), the weight ("pweights" of the first month), and the
+    demographic variables of the first month.
+    """
+
+    new_cont = segments(temp, ["indid", "cont_spell_no"])
+    nonempl = temp["empl"].to_numpy("int64") != 1
+
+    # -? a run starts at a nonemployed month after an employed month, or at
+    # -? the first month of a continuous spell
+    start = nonempl & (new_cont | ~np.r_[False, nonempl[:-1]])
+    rows = np.flatnonzero(nonempl)
+    run = (np.cumsum(start) - 1)[rows]
+
+    first = np.flatnonzero(start)
+    length = np.bincount(run, minlength=len(first))
+    last = first + length - 1
+    end_cont = np.r_[new_cont[1:], True]
+
+    unempl = temp["unempl"].to_numpy("int64")[rows]
+    runs = temp.iloc[first, :]
+
+    return pd.DataFrame(
+        {
+            "indid": runs["indid"].to_numpy(),
+            "panel": runs["panel"].to_numpy("int64"),
+            "ym": runs["ym"].to_numpy(),
+            "length": length,
+            "left": new_cont[first],
+            "right": end_cont[last],
+            "unempl_months": np.bincount(
+                run, weights=unempl, minlength=len(first)
+            ).astype(np.int64),
+            "source": runs[f"source_occ_{occ}"].astype("Int64").array,
+            "destination": runs[f"destination_occ_{occ}"]
+            .astype("Int64")
+            .array,
+            "weight": runs["pweights"].to_numpy("float64"),
+            "edu": runs["edu"].to_numpy(),
+            "male": runs["male"].to_numpy(),
+            "race": runs["race"].to_numpy(),
+            "age": runs["age"].to_numpy(),
+        }
+    )
+
+
+def in_notion(runs: pd.DataFrame, notion: str = "ubar") -> np.ndarray:
+    """
+    This function flags the runs of a notion of unemployment ("ubar",
+    "ustar", or "u").
+    """
+
+    if notion == "ubar":
+        return np.ones(len(runs), dtype=bool)
+    if notion == "ustar":
+        return (runs["unempl_months"] > 0).to_numpy()
+    if notion == "u":
+        return (runs["unempl_months"] == runs["length"]).to_numpy()
+
+    raise ValueError(f"unknown notion of unemployment: {notion}")
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. survival and hazards
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def survival(
+    runs: pd.DataFrame,
+    notion: str = "ubar",
+    by: list = ["panel"],
+    left_censored: bool = False,
+) -> pd.DataFrame:
+    """
+    This function estimates, for each cell of the variables in by and each
+    spell length (in months), the weighted Kaplan-Meier survival of the runs
+    of a notion, with columns:
+        "count":         number of runs at risk,
+        "at_risk":       weight of the runs at risk (length >= this length),
+        "exits":         weight of the runs ending into employment,
+        "censored":      weight of the right-censored runs,
+        "hazard":        exits / at_risk,
+        "survival":      share still nonemployed after this length,
+        "switch_hazard": weight of the exits into another occupation /
+                         at_risk,
+        "switch_share":  share of the exits with both occupations that
+                         switch occupation.
+    Left-censored runs are left out unless left_censored=True: their months
+    before the start of the continuous spell are not observed, so counting
+    them as new spells from their first observed month would bias the
+    survival down and the hazards up.
+    """
+
+    keep = in_notion(runs, notion)
+    if not left_censored:
+        keep = keep & ~runs["left"].to_numpy()
+    runs = runs.loc[keep, :]
+    cell, cells = cell_index(runs, by)
+    runs = runs.loc[cell >= 0, :]
+    cell = cell[cell >= 0]
+
+    length = runs["length"].to_numpy()
+    weight = runs["weight"].to_numpy("float64")
+    exit_ = ~runs["right"].to_numpy()
+    source = runs["source"].to_numpy("float64", na_value=np.nan)
+    destination = runs["destination"].to_numpy("float64", na_value=np.nan)
+    known = exit_ & ~np.isnan(source) & ~np.isnan(destination)
+    switch = known & (source != destination)
+
+    # -? tabulate by (cell, length)
+    n_cells = len(cells)
+    n_lengths = int(length.max()) + 1 if len(length) else 1
+    key = cell * n_lengths + length
+
+    def table(weights=None):
+        return np.bincount(
+            key, weights=weights, minlength=n_cells * n_lengths
+        ).reshape(n_cells, n_lengths)
+
+    def from_length(values):
+        return values[:, ::-1].cumsum(axis=1)[:, ::-1]
+
+    ends = table(weight)
+    exits = table(weight * exit_)
+    switched = table(weight * switch)
+    at_risk = from_length(ends)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hazard = exits / at_risk
+        switch_hazard = switched / at_risk
+        switch_share = switched / table(weight * known)
+    still = np.cumprod(1 - np.nan_to_num(hazard), axis=1)
+
+    # -? tidy table: one row per cell and length with runs at risk
+    count = from_length(table())
+    cell_ids, lengths = np.nonzero(count[:, 1:] > 0)
+    lengths = lengths + 1
+    at = (cell_ids, lengths)
+
+    estimates = cells.iloc[cell_ids, :].reset_index(drop=True)
+
+    return estimates.assign(
+        length=lengths,
+        count=count[at].astype(np.int64),
+        at_risk=at_risk[at],
+        exits=exits[at],
+        censored=(ends - exits)[at],
+        hazard=hazard[at],
+        survival=still[at],
+        switch_hazard=switch_hazard[at],
+        switch_share=switch_share[at],
+    )
+
+
+def durations(
+    temp: pd.DataFrame,
+    notions: list = notions,
+    by: list = ["panel"],
+    occ: str = "raw",
+    left_censored: bool = False,
+) -> dict:
+    """
+    This function estimates the survival tables (see survival) of a cleaned
+    panel for each notion of unemployment in notions.
+    """
+
+    runs = nonemployment_runs(temp, occ)
+
+    return {
+        notion: survival(runs, notion, by, left_censored)
+        for notion in notions
+    }
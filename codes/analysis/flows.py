@@ -0,0 +1,161 @@
+#! python3
+
+# ?? This script computes weighted ("pweights") monthly labor market flows of
+# ?? the cleaned panels: transition counts and rates between employment (E),
+# ?? unemployment (U), and nonparticipation (N) from one month to the next,
+# ?? for every month ("ym") and demographic cell (see codes/util/cells.py).
+
+# &? The state of a month is an integer code (0: "empl", 1: "unempl", 2:
+# &? "outlf"), and a flow links two adjacent months of the same individual
+# &? (the months of an individual are contiguous rows, sorted by "ym"). All
+# &? flows are counted by one np.bincount over the combined key
+# &?     ((month * C + cell) * 3 + origin) * 3 + destination
+# &? with C cells, dated and weighted by the origin month.
+
+# &? The flows of a panel are cached in the cache folder (see
+# &? codes/util/paths.py), one pickle file per panel and cell variables, and
+# &? recomputed when the fingerprint of tempdata/temp`panel'.dta changes.
+
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from util.cells import cell_index
+from util.checkpoint import fingerprint
+from util.paths import cache, tempdata
+
+states = ["E", "U", "N"]
+
+flow_vars = ["indid", "ym", "pweights", "empl", "unempl", "outlf"]
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. flows of a cleaned panel
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def state_codes(temp: pd.DataFrame) -> np.ndarray:
+    """
+    This function returns the labor market state of each month: 0 if
+    employed, 1 if unemployed, 2 if out of the labor force.
+    """
+
+    state = np.full(len(temp), 2, dtype=np.int64)
+    state[temp["unempl"].to_numpy("int64") == 1] = 1
+    state[temp["empl"].to_numpy("int64") == 1] = 0
+
+    return state
+
+
+def flows(temp: pd.DataFrame, by: list = ["panel"]) -> pd.DataFrame:
+    """
+    This function returns the monthly flows of a cleaned panel (sorted by
+    "indid" and "ym"), one row per month ("ym", the origin month), cell of
+    the variables in by, origin state, and destination state with at least
+    one flow, with the number of flows ("count"), their weight ("weight"),
+    and the rate ("rate": weight over the weight of all flows from the origin
+    state in that month and cell).
+    """
+
+    month = temp["ym"].to_numpy().astype("datetime64[M]").astype(np.int64)
+    person = temp["indid"].to_numpy()
+    state = state_codes(temp)
+
+    # -? origin rows: the next row is the next month of the same individual
+    linked = np.zeros(len(temp), dtype=bool)
+    linked[:-1] = (person[1:] == person[:-1]) & (month[1:] == month[:-1] + 1)
+    rows = np.flatnonzero(linked)
+
+    cell, cells = cell_index(temp.iloc[rows, :], by)
+    rows, cell = rows[cell >= 0], cell[cell >= 0]
+
+    first_month = month.min() if len(month) else 0
+    n_months = int(month.max() - first_month) + 1 if len(month) else 1
+    n_cells = len(cells)
+    key = (
+        ((month[rows] - first_month) * n_cells + cell) * 3 + state[rows]
+    ) * 3 + state[rows + 1]
+
+    size = n_months * n_cells * 9
+    weight = np.bincount(
+        key,
+        weights=temp["pweights"].to_numpy("float64")[rows],
+        minlength=size,
+    )
+    count = np.bincount(key, minlength=size)
+    totals = weight.reshape(-1, 3).sum(axis=1).repeat(3)
+
+    observed = np.flatnonzero(count)
+    result = cells.iloc[observed // 9 % n_cells, :].reset_index(drop=True)
+    ym = (observed // (9 * n_cells) + first_month).astype("datetime64[M]")
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rate = weight[observed] / totals[observed]
+
+    return result.assign(
+        ym=ym.astype(temp["ym"].dtype),
+        origin=np.asarray(states)[observed // 3 % 3],
+        destination=np.asarray(states)[observed % 3],
+        count=count[observed],
+        weight=weight[observed],
+        rate=rate,
+    )
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. cached flows of the panels
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def panel_flows(
+    panel: int, by: list = ["panel"], refresh: bool = False
+) -> pd.DataFrame:
+    """
+    This function returns the flows (see flows) of the cleaned panel in
+    tempdata/temp`panel'.dta, from the cache if it is up to date (unless
+    refresh=True).
+    """
+
+    source = tempdata(f"temp{panel}.dta")
+    stamp = fingerprint(source)
+    path = cache(f"flows{panel}_{'_'.join(by)}.pkl")
+
+    if not refresh and os.path.exists(path):
+        with open(path, "rb") as f:
+            cached = pickle.load(f)
+        if cached["fingerprint"] == stamp:
+            return cached["flows"]
+
+    columns = flow_vars + [
+        "age" if var == "age_bin" else var
+        for var in by
+        if var not in flow_vars
+    ]
+    temp = pd.read_stata(source, columns=columns, convert_categoricals=False)
+    result = flows(temp, by)
+
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(
+            {"fingerprint": stamp, "flows": result},
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(path + ".tmp", path)
+
+    return result
+
+
+def flow_rates(
+    panels: list, by: list = ["panel"], refresh: bool = False
+) -> pd.DataFrame:
+    """
+    This function stacks the flows (see flows) of the cleaned panels in
+    panels, in panel order.
+    """
+
+    return pd.concat(
+        [panel_flows(panel, by, refresh) for panel in panels],
+        axis=0,
+        ignore_index=True,
+    )
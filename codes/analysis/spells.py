@@ -0,0 +1,72 @@
+#! python3
+
+# ?? This script stores functions to load the cleaned person-month panels
+# ?? (tempdata/temp`panel'.dta) and to collapse them into spell tables, one row
+# ?? per E(UBAR)E, E(USTAR)E, or E(U)E spell, used by the analysis modules.
+
+# &? Cleaned panels are sorted by "indid" and "ym" (as exported by
+# &? SIPP_cleaning), so the months of a spell are contiguous and its first row
+# &? is its first month.
+
+import pandas as pd
+
+from util.paths import tempdata
+
+notions = ["ubar", "ustar", "u"]
+
+
+def read_temp(panels: list, columns: list = None) -> pd.DataFrame:
+    """
+    This function reads the cleaned person-month panels (only the variables
+    in columns, if given) and stacks them in panel order.
+    """
+
+    return pd.concat(
+        [
+            pd.read_stata(
+                tempdata(f"temp{panel}.dta"),
+                columns=columns,
+                convert_categoricals=False,
+            )
+            for panel in panels
+        ],
+        axis=0,
+        ignore_index=True,
+    )
+
+
+def spell_table(
+    temp: pd.DataFrame, notion: str = "ubar", occ: str = "raw"
+) -> pd.DataFrame:
+    """
+    This function collapses a cleaned panel into one row per spell of a notion
+    ("ubar", "ustar", or "u"), with the spell id, the individual, the first
+    month, the length, the source and destination occupations ("source_occ_"
+    and "destination_occ_" followed by occ, e.g., "raw" or "1990dd"), the
+    weight ("pweights" of the first month), and the demographic variables of
+    the first month.
+    """
+
+    spell_no = temp[f"{notion}_spell_no"]
+    first = (spell_no.notna() & ~spell_no.duplicated()).to_numpy()
+    spells = temp.loc[first, :]
+
+    return pd.DataFrame(
+        {
+            "spell_no": spells[f"{notion}_spell_no"].to_numpy("int64"),
+            "indid": spells["indid"].to_numpy(),
+            "panel": spells["panel"].to_numpy("int64"),
+            "ym": spells["ym"].to_numpy(),
+            "length": spells[f"len_{notion}_spell"].to_numpy("int64"),
+            "source": spells[f"source_occ_{occ}"].astype("Int64").array,
+            "destination": spells[f"destination_occ_{occ}"]
+            .astype("Int64")
+            .array,
+            "weight": spells["pweights"].to_numpy("float64"),
+            "edu": spells["edu"].to_numpy(),
+            "male": spells["male"].to_numpy(),
+            "race": spells["race"].to_numpy(),
+            "age": spells["age"].to_numpy(),
+        }
+    )
+
@@ -0,0 +1,235 @@
+#! python3
+
+# ?? This script stores functions to export the cleaned person-month panels
+# ?? and their spell tables (see codes/analysis/spells.py) into one SQLite
+# ?? database (tempdata/panels.sqlite by default), and to select individuals,
+# ?? months, or spells from it without loading the whole panels.
+
+# &? The database has two tables:
+# &?     "months": the cleaned panels, one row per individual and month,
+# &?     "spells": the spell tables of all notions, with the notion in
+# &?               column "notion".
+# &? Dates ("ym") are stored as ISO text ("2001-03-01"), so they sort and
+# &? compare as dates. Rows are inserted by executemany in one transaction per
+# &? chunk of rows, and the indexes (individual, individual and month, spell
+# &? ids, source and destination occupations) are created after the inserts.
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from analysis.spells import notions, read_temp, spell_table
+from util.paths import tempdata
+
+chunk_rows = 200_000
+
+# -? indexes of each table: {index name: columns}
+indexes = {
+    "months": {
+        "months_indid": ["indid"],
+        "months_indid_ym": ["indid", "ym"],
+        "months_panel": ["panel"],
+        "months_ubar": ["ubar_spell_no"],
+        "months_ustar": ["ustar_spell_no"],
+        "months_u": ["u_spell_no"],
+    },
+    "spells": {
+        "spells_notion_spell_no": ["notion", "spell_no"],
+        "spells_indid": ["indid"],
+        "spells_source": ["source"],
+        "spells_destination": ["destination"],
+    },
+}
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. export
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    """
+    This function opens the database (tempdata/panels.sqlite by default).
+    """
+
+    return sqlite3.connect(path or tempdata("panels.sqlite"))
+
+
+def sql_type(col: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(col) or pd.api.types.is_integer_dtype(col):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(col):
+        return "REAL"
+    return "TEXT"
+
+
+def sql_values(col: pd.Series) -> list:
+    """
+    This function converts a column to a list of Python values for sqlite3:
+    dates to ISO text, whole-number spell ids to int, and missing values to
+    None.
+    """
+
+    missing = col.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(col):
+        values = col.dt.strftime("%Y-%m-%d").to_numpy(dtype=object)
+    elif col.name.endswith("_spell_no"):
+        values = col.to_numpy("float64", na_value=0).astype(np.int64)
+        values = values.astype(object)
+    else:
+        values = col.to_numpy(dtype=object)
+    values[missing] = None
+
+    return values.tolist()
+
+
+def table_columns(con: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in con.execute(f"PRAGMA table_info({table})")}
+
+
+def insert(con: sqlite3.Connection, table: str, frame: pd.DataFrame):
+    """
+    This function appends the rows of a DataFrame to a table, creating the
+    table, or adding the columns it does not have yet.
+    """
+
+    types = {
+        col: "INTEGER" if col.endswith("_spell_no") else sql_type(frame[col])
+        for col in frame.columns
+    }
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {table} "
+        f"({', '.join(f'{col} {kind}' for col, kind in types.items())})"
+    )
+    existing = table_columns(con, table)
+    for col, kind in types.items():
+        if col not in existing:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {col} {kind}")
+
+    statement = (
+        f"INSERT INTO {table} ({', '.join(frame.columns)}) "
+        f"VALUES ({', '.join('?' * len(frame.columns))})"
+    )
+    for start in range(0, len(frame), chunk_rows):
+        chunk = frame.iloc[start : start + chunk_rows]
+        with con:
+            con.executemany(
+                statement,
+                zip(*[sql_values(chunk[col]) for col in chunk.columns]),
+            )
+
+
+def create_indexes(con: sqlite3.Connection):
+    for table, table_indexes in indexes.items():
+        existing = table_columns(con, table)
+        for name, cols in table_indexes.items():
+            if set(cols) <= existing:
+                con.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} "
+                    f"ON {table} ({', '.join(cols)})"
+                )
+    con.commit()
+
+
+def export_panel(
+    temp: pd.DataFrame, panel: int, path: str = None, notions: list = notions
+):
+    """
+    This function writes a cleaned panel and its spell tables into the
+    database, replacing the rows of the panel if it was exported before.
+    """
+
+    con = connect(path)
+    con.execute("PRAGMA synchronous = OFF")
+    try:
+        for table in indexes:
+            if table_columns(con, table):
+                with con:
+                    con.execute(
+                        f"DELETE FROM {table} WHERE panel = ?", (panel,)
+                    )
+
+        insert(con, "months", temp)
+        insert(
+            con,
+            "spells",
+            pd.concat(
+                [
+                    spell_table(temp, notion).assign(notion=notion)
+                    for notion in notions
+                ],
+                axis=0,
+                ignore_index=True,
+            ),
+        )
+        create_indexes(con)
+    finally:
+        con.close()
+
+
+def export_panels(panels: list, path: str = None):
+    """
+    This function exports the cleaned panels in tempdata/temp`panel'.dta into
+    the database.
+    """
+
+    for panel in panels:
+        export_panel(read_temp([panel]), panel, path)
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. queries
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def query(sql: str, params: tuple = (), path: str = None) -> pd.DataFrame:
+    """
+    This function runs a SELECT statement on the database, and returns the
+    result with "ym" converted back to dates.
+    """
+
+    con = connect(path)
+    try:
+        result = pd.read_sql_query(sql, con, params=params)
+    finally:
+        con.close()
+
+    if "ym" in result.columns:
+        result["ym"] = pd.to_datetime(result["ym"])
+
+    return result
+
+
+def select(
+    table: str = "months",
+    columns: list = None,
+    path: str = None,
+    **conditions,
+) -> pd.DataFrame:
+    """
+    This function selects the rows of a table ("months" or "spells") that
+    match all conditions, given as column=value or column=[values], e.g.,
+        select("months", indid=["...", "..."]),
+        select("months", ubar_spell_no=200100012),
+        select("spells", notion="ubar", source=433, destination=95).
+    Dates can be given as "2001-03-01". Rows of "months" are sorted by
+    "indid" and "ym".
+    """
+
+    where, params = [], []
+    for col, value in conditions.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        values = [
+            v.strftime("%Y-%m-%d") if isinstance(v, pd.Timestamp) else v
+            for v in values
+        ]
+        where.append(f"{col} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+
+    sql = f"SELECT {', '.join(columns) if columns else '*'} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if table == "months":
+        sql += " ORDER BY indid, ym"
+
+    return query(sql, tuple(params), path)
@@ -0,0 +1,192 @@
+#! python3
+
+# ?? This script builds weighted occupational transition matrices (source
+# ?? occupation x destination occupation) over the E(UBAR)E, E(USTAR)E, and
+# ?? E(U)E spells of the cleaned panels, by panel and demographic cell, and
+# ?? the mobility rates derived from them.
+
+# &? A transition matrix is stored sparsely, as the observed (cell, source,
+# &? destination) triples only, in a dictionary:
+# &?     "by":          the cell variables (see codes/util/cells.py),
+# &?     "cells":       DataFrame of the cells (row i: the values of cell i),
+# &?     "codes":       the occupation codes (index k: code of occupation k),
+# &?     "cell", "source", "destination":
+# &?                    indices of the observed triples,
+# &?     "weight":      sum of the spell weights ("pweights") of each triple,
+# &?     "count":       number of spells of each triple,
+# &?     "pair":        the triple of each spell of the spell table (-1 for
+# &?                    spells without source or destination occupation).
+# &? Triples are counted by np.bincount over the flattened triple index
+# &? ((cell * K + source) * K + destination, with K occupations), so the
+# &? counts never need a dense cells x K x K array.
+
+import numpy as np
+import pandas as pd
+
+from analysis.spells import notions, spell_table
+from util.cells import cell_index
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. build transition matrices
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def transition_matrix(
+    spells: pd.DataFrame, by: list = ["panel"], weight: str = "weight"
+) -> dict:
+    """
+    This function builds the transition matrix of a spell table (see
+    codes/analysis/spells.py) by the cell variables in by. Spells without a
+    source or destination occupation are left out.
+    """
+
+    source = spells["source"].to_numpy("float64", na_value=np.nan)
+    destination = spells["destination"].to_numpy("float64", na_value=np.nan)
+    keep = ~np.isnan(source) & ~np.isnan(destination)
+    cell, cells = cell_index(spells.loc[keep, :], by)
+    keep[keep] = cell >= 0
+    cell = cell[cell >= 0]
+
+    codes = np.unique(np.r_[source[keep], destination[keep]])
+    codes = codes.astype(np.int64)
+    n_codes = len(codes)
+    flat = (
+        cell * n_codes + np.searchsorted(codes, source[keep])
+    ) * n_codes + np.searchsorted(codes, destination[keep])
+
+    triples, pair = np.unique(flat, return_inverse=True)
+    spell_pair = np.full(len(spells), -1, dtype=np.int64)
+    spell_pair[keep] = pair
+
+    return {
+        "by": list(by),
+        "cells": cells,
+        "codes": codes,
+        "cell": triples // (n_codes * n_codes),
+        "source": triples // n_codes % n_codes,
+        "destination": triples % n_codes,
+        "weight": np.bincount(
+            pair,
+            weights=spells[weight].to_numpy("float64")[keep],
+            minlength=len(triples),
+        ),
+        "count": np.bincount(pair, minlength=len(triples)),
+        "pair": spell_pair,
+    }
+
+
+def transition_matrices(
+    temp: pd.DataFrame,
+    notions: list = notions,
+    by: list = ["panel"],
+    occ: str = "raw",
+) -> dict:
+    """
+    This function builds the transition matrices of a cleaned panel for each
+    spell notion in notions, with source and destination occupations
+    "source_occ_" and "destination_occ_" followed by occ (e.g., "raw", or
+    "1990dd" after recoding with codes/util/occ.py).
+    """
+
+    return {
+        notion: transition_matrix(spell_table(temp, notion, occ), by)
+        for notion in notions
+    }
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. mobility rates
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def mobility_rates(matrix: dict) -> pd.DataFrame:
+    """
+    This function returns the row-normalized transition rates of a transition
+    matrix: for each observed triple, the weighted share of the spells from
+    the source occupation (in that cell) that end in the destination
+    occupation.
+    """
+
+    n_codes = len(matrix["codes"])
+    rows = matrix["cell"] * n_codes + matrix["source"]
+    totals = np.bincount(rows, weights=matrix["weight"])
+
+    rates = matrix["cells"].iloc[matrix["cell"], :].reset_index(drop=True)
+
+    return rates.assign(
+        source=matrix["codes"][matrix["source"]],
+        destination=matrix["codes"][matrix["destination"]],
+        weight=matrix["weight"],
+        count=matrix["count"],
+        rate=matrix["weight"] / totals[rows],
+    )
+
+
+def switch_rates(matrix: dict, weight: np.ndarray = None) -> pd.DataFrame:
+    """
+    This function returns, for each cell of a transition matrix, the number
+    of spells, their total weight, and the occupation switching rate (the
+    weighted share of spells whose destination differs from the source).
+    weight replaces the weights of the triples, if given.
+    """
+
+    weight = matrix["weight"] if weight is None else weight
+    n_cells = len(matrix["cells"])
+    switch = matrix["source"] != matrix["destination"]
+
+    total = np.bincount(matrix["cell"], weights=weight, minlength=n_cells)
+    switched = np.bincount(
+        matrix["cell"], weights=weight * switch, minlength=n_cells
+    )
+
+    return matrix["cells"].assign(
+        count=np.bincount(
+            matrix["cell"], weights=matrix["count"], minlength=n_cells
+        ).astype(np.int64),
+        weight=total,
+        switch_rate=switched / total,
+    )
+
+
+def to_dense(matrix: dict, cell: int = 0, normalize: bool = False):
+    """
+    This function returns the K x K array (K occupations, in the order of
+    matrix["codes"]) of the weights of one cell, or of its row-normalized
+    rates with normalize=True.
+    """
+
+    n_codes = len(matrix["codes"])
+    in_cell = matrix["cell"] == cell
+    dense = np.bincount(
+        matrix["source"][in_cell] * n_codes + matrix["destination"][in_cell],
+        weights=matrix["weight"][in_cell],
+        minlength=n_codes * n_codes,
+    ).reshape(n_codes, n_codes)
+
+    if normalize:
+        totals = dense.sum(axis=1, keepdims=True)
+        dense = np.divide(
+            dense, totals, out=np.zeros_like(dense), where=totals > 0
+        )
+
+    return dense
+
+
+def to_sparse(matrix: dict, cell: int = 0):
+    """
+    This function returns the weights of one cell as a K x K
+    scipy.sparse.csr_matrix (requires the scipy package).
+    """
+
+    from scipy.sparse import csr_matrix
+
+    n_codes = len(matrix["codes"])
+    in_cell = matrix["cell"] == cell
+
+    return csr_matrix(
+        (
+            matrix["weight"][in_cell],
+            (matrix["source"][in_cell], matrix["destination"][in_cell]),
+        ),
+        shape=(n_codes, n_codes),
+    )
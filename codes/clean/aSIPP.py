@@ -11,6 +11,10 @@ In particular,
     the source and destination occupations' raw information is collected, 
     individual probability weights are calculated.
 
+The redesigned panels (2014 and 2018) are cleaned by the same procedures,
+after their person-month files are mapped to the variables of the wave files
+(see codes/util/adapters.py).
+
 Input:
     dta files stored in "rawdata" folder.
 Output:
@@ -23,18 +27,41 @@ Wang Wenzhi
 Time: 2024-10-19
 """
 
+import os
+import sys
+
+import pandas as pd
+import numpy as np
+
+pd.set_option("mode.copy_on_write", True)
+
 # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
-# ?? Code Block 1. Function to Clean SIPP Datasets
+# ?? Code Block 1. Cleaning Procedures (pandas backend)
 # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
 
 
-def SIPP_cleaning(codes_path: str, panel: int) -> None:
+def SIPP_cleaning_pandas(
+    panel: int,
+    n_shards: int = 1,
+    n_workers: int = None,
+    sample: tuple = None,
+    columns: list = None,
+) -> pd.DataFrame:
     """
-    This function wraps all data cleaning procedures into a function, taking
-    SIPP panel year and codes_path as arguments, generates a .dta file --
-    temp`panel'.dta, and stores the resulting dat file in the tempdata folder.
-
-    Version: 2024-10-19
+    This function implements all data cleaning procedures with pandas, taking
+    SIPP panel year as an argument, and returns the cleaned person-month
+    DataFrame (before exporting).
+
+    Step 2 to step 3 are implemented in SIPP_sample, step 4 to step 7 in
+    SIPP_spells, and step 8 to step x in SIPP_weights. With n_shards > 1,
+    step 2 to step 7 run on n_shards groups of individuals in n_workers
+    parallel processes (see SIPP_sharded). With sample=(fraction, seed), only
+    a subsample of persons is read (see sample_mask in codes/util/waves.py).
+    With columns, a subset of the output columns, only the raw variables
+    needed for them are read, and columns are dropped after the last step
+    that uses them (see raw_columns and prune in codes/util/schema.py).
+    With n_shards="auto", shards, workers, and rows per chunk read are
+    planned from the memory and cores available (see SIPP_sharded_planned).
     """
 
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
@@ -42,12 +69,12 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
 
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
-    # -? s-0-1. Functions for data paths (stored in codes/util/paths.py)
+    # -? s-0-1. Functions to read raw wave files
+    # -? (stored in codes/util/waves.py)
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
-    import sys
+    from functools import partial
 
-    sys.path.append(codes_path)
-    from util.paths import rawdata, tempdata
+    from util.waves import read_panel
 
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
     # -? s-0-2. Dictionaries for value labels
@@ -58,20 +85,14 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     # print(val_labs["empl"])  # test value labels
 
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
-    # -? s-0-3. Functions for DataFrame manipulation
-    # -? (stored in codes/util/funcsforpandas.py)
+    # -? s-0-3. Column dependencies (stored in codes/util/schema.py)
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
-    from util.funcsforpandas import df_order
-
-    # help(df_order)  # test functions
+    from util.schema import prune, raw_columns
 
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
-    # -? s-0-4. Other necessary packages
+    # -? s-0-4. Resource planner (stored in codes/util/planner.py)
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
-    import pandas as pd
-    import numpy as np
-
-    pd.set_option("mode.copy_on_write", True)
+    from util.planner import plan_cleaning
 
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
     # ?? step 1. construct monthly employment status
@@ -79,309 +100,65 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
 
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
     # -? s-1-1. load the full dataset and remain only relevant variables
+    # -? (relevant variables are stored in codes/util/waves.py)
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
 
-    if panel == 1996:
-        sipp96w1 = pd.read_stata(
-            rawdata("sipp96w1.dta"), convert_categoricals=False
-        )
-        sipp96w2 = pd.read_stata(
-            rawdata("sipp96w2.dta"), convert_categoricals=False
-        )
-        sipp96w3 = pd.read_stata(
-            rawdata("sipp96w3.dta"), convert_categoricals=False
-        )
-        sipp96w4 = pd.read_stata(
-            rawdata("sipp96w4.dta"), convert_categoricals=False
-        )
-        sipp96w5 = pd.read_stata(
-            rawdata("sipp96w5.dta"), convert_categoricals=False
-        )
-        sipp96w6 = pd.read_stata(
-            rawdata("sipp96w6.dta"), convert_categoricals=False
-        )
-        sipp96w7 = pd.read_stata(
-            rawdata("sipp96w7.dta"), convert_categoricals=False
-        )
-        sipp96w8 = pd.read_stata(
-            rawdata("sipp96w8.dta"), convert_categoricals=False
-        )
-        sipp96w9 = pd.read_stata(
-            rawdata("sipp96w9.dta"), convert_categoricals=False
-        )
-        sipp96w10 = pd.read_stata(
-            rawdata("sipp96w10.dta"), convert_categoricals=False
-        )
-        sipp96w11 = pd.read_stata(
-            rawdata("sipp96w11.dta"), convert_categoricals=False
-        )
-        sipp96w12 = pd.read_stata(
-            rawdata("sipp96w12.dta"), convert_categoricals=False
-        )
+    plan, n_rows = None, None
+    if n_shards == "auto":
+        fraction = 1.0 if sample is None else sample[0]
+        plan = plan_cleaning(panel, raw_columns(columns), fraction)
+        n_shards, n_rows = plan["n_shards"], plan["chunk_rows"]
 
-        sipp = pd.concat(
-            [
-                sipp96w1,
-                sipp96w2,
-                sipp96w3,
-                sipp96w4,
-                sipp96w5,
-                sipp96w6,
-                sipp96w7,
-                sipp96w8,
-                sipp96w9,
-                sipp96w10,
-                sipp96w11,
-                sipp96w12,
-            ],
-            axis=0,
-        )
-    elif panel == 2001:
-        sipp01w1 = pd.read_stata(
-            rawdata("sipp01w1.dta"), convert_categoricals=False
-        )
-        sipp01w2 = pd.read_stata(
-            rawdata("sipp01w2.dta"), convert_categoricals=False
-        )
-        sipp01w3 = pd.read_stata(
-            rawdata("sipp01w3.dta"), convert_categoricals=False
-        )
-        sipp01w4 = pd.read_stata(
-            rawdata("sipp01w4.dta"), convert_categoricals=False
-        )
-        sipp01w5 = pd.read_stata(
-            rawdata("sipp01w5.dta"), convert_categoricals=False
-        )
-        sipp01w6 = pd.read_stata(
-            rawdata("sipp01w6.dta"), convert_categoricals=False
-        )
-        sipp01w7 = pd.read_stata(
-            rawdata("sipp01w7.dta"), convert_categoricals=False
-        )
-        sipp01w8 = pd.read_stata(
-            rawdata("sipp01w8.dta"), convert_categoricals=False
-        )
-        sipp01w9 = pd.read_stata(
-            rawdata("sipp01w9.dta"), convert_categoricals=False
-        )
-        sipp = pd.concat(
-            [
-                sipp01w1,
-                sipp01w2,
-                sipp01w3,
-                sipp01w4,
-                sipp01w5,
-                sipp01w6,
-                sipp01w7,
-                sipp01w8,
-                sipp01w9,
-            ],
-            axis=0,
-        )
-    elif panel == 2004:
-        sipp04w1 = pd.read_stata(
-            rawdata("sipp04w1.dta"), convert_categoricals=False
-        )
-        sipp04w2 = pd.read_stata(
-            rawdata("sipp04w2.dta"), convert_categoricals=False
-        )
-        sipp04w3 = pd.read_stata(
-            rawdata("sipp04w3.dta"), convert_categoricals=False
-        )
-        sipp04w4 = pd.read_stata(
-            rawdata("sipp04w4.dta"), convert_categoricals=False
-        )
-        sipp04w5 = pd.read_stata(
-            rawdata("sipp04w5.dta"), convert_categoricals=False
-        )
-        sipp04w6 = pd.read_stata(
-            rawdata("sipp04w6.dta"), convert_categoricals=False
-        )
-        sipp04w7 = pd.read_stata(
-            rawdata("sipp04w7.dta"), convert_categoricals=False
-        )
-        sipp04w8 = pd.read_stata(
-            rawdata("sipp04w8.dta"), convert_categoricals=False
-        )
-        sipp04w9 = pd.read_stata(
-            rawdata("sipp04w9.dta"), convert_categoricals=False
-        )
-        sipp04w10 = pd.read_stata(
-            rawdata("sipp04w10.dta"), convert_categoricals=False
-        )
-        sipp04w11 = pd.read_stata(
-            rawdata("sipp04w11.dta"), convert_categoricals=False
-        )
-        sipp04w12 = pd.read_stata(
-            rawdata("sipp04w12.dta"), convert_categoricals=False
-        )
-        sipp = pd.concat(
-            [
-                sipp04w1,
-                sipp04w2,
-                sipp04w3,
-                sipp04w4,
-                sipp04w5,
-                sipp04w6,
-                sipp04w7,
-                sipp04w8,
-                sipp04w9,
-                sipp04w10,
-                sipp04w11,
-                sipp04w12,
-            ],
-            axis=0,
-        )
-    elif panel == 2008:
-        sipp08w1 = pd.read_stata(
-            rawdata("sipp08w1.dta"), convert_categoricals=False
-        )
-        sipp08w2 = pd.read_stata(
-            rawdata("sipp08w2.dta"), convert_categoricals=False
-        )
-        sipp08w3 = pd.read_stata(
-            rawdata("sipp08w3.dta"), convert_categoricals=False
-        )
-        sipp08w4 = pd.read_stata(
-            rawdata("sipp08w4.dta"), convert_categoricals=False
-        )
-        sipp08w5 = pd.read_stata(
-            rawdata("sipp08w5.dta"), convert_categoricals=False
-        )
-        sipp08w6 = pd.read_stata(
-            rawdata("sipp08w6.dta"), convert_categoricals=False
-        )
-        sipp08w7 = pd.read_stata(
-            rawdata("sipp08w7.dta"), convert_categoricals=False
-        )
-        sipp08w8 = pd.read_stata(
-            rawdata("sipp08w8.dta"), convert_categoricals=False
-        )
-        sipp08w9 = pd.read_stata(
-            rawdata("sipp08w9.dta"), convert_categoricals=False
-        )
-        sipp08w10 = pd.read_stata(
-            rawdata("sipp08w10.dta"), convert_categoricals=False
-        )
-        sipp08w11 = pd.read_stata(
-            rawdata("sipp08w11.dta"), convert_categoricals=False
-        )
-        sipp08w12 = pd.read_stata(
-            rawdata("sipp08w12.dta"), convert_categoricals=False
-        )
-        sipp08w13 = pd.read_stata(
-            rawdata("sipp08w13.dta"), convert_categoricals=False
-        )
-        sipp08w14 = pd.read_stata(
-            rawdata("sipp08w14.dta"), convert_categoricals=False
-        )
-        sipp08w15 = pd.read_stata(
-            rawdata("sipp08w15.dta"), convert_categoricals=False
-        )
-        sipp08w16 = pd.read_stata(
-            rawdata("sipp08w16.dta"), convert_categoricals=False
-        )
-        sipp = pd.concat(
-            [
-                sipp08w1,
-                sipp08w2,
-                sipp08w3,
-                sipp08w4,
-                sipp08w5,
-                sipp08w6,
-                sipp08w7,
-                sipp08w8,
-                sipp08w9,
-                sipp08w10,
-                sipp08w11,
-                sipp08w12,
-                sipp08w13,
-                sipp08w14,
-                sipp08w15,
-                sipp08w16,
-            ],
-            axis=0,
-        )
+    # &? A sharded run reads the raw panel itself, so that no reference to it
+    # &? is left here once it is copied into shared memory.
+    read = partial(read_panel, panel, raw_columns(columns), sample, n_rows)
 
-    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
-    # -? s-1-2. relevant variables
-    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 2 to step 7. individual-level cleaning procedures
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
 
-    vars_id = [
-        "lgtkey",
-        "rhcalmn",
-        "rhcalyr",
-        "swave",
-        "ssuid",
-        "eentaid",
-        "epppnum",
-        "srotaton",
-    ]
+    if n_shards == 1:
+        temp = prune(SIPP_sample(read(), panel), "sample", columns)
+        temp = prune(SIPP_spells(temp), "spells", columns)
+    elif plan is not None:
+        temp = SIPP_sharded_planned(read, panel, plan, columns)
+        temp = prune(temp, "spells", columns)
+    else:
+        temp = SIPP_sharded(read, panel, n_shards, n_workers, columns)
+        temp = prune(temp, "spells", columns)
 
-    vars_demogr = [
-        "tbyear",
-        "ebmnth",
-        "esex",
-        "ems",
-        "eeducate",
-        "eafnow",
-        "eafever",
-        "erace",
-        "ebuscntr",
-        "ebno1",
-        "ebno2",
-        "eppintvw",
-    ]
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 8 to step x. panel-level procedures
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
 
-    vars_emp = [
-        "rmesr",
-        "rwkesr1",
-        "rwkesr2",
-        "rwkesr3",
-        "rwkesr4",
-        "rwkesr5",
-        "ersend1",
-        "ersend2",
-        "ersnowrk",
-    ]
+    temp = prune(SIPP_weights(temp, panel), "weights", columns)
 
-    vars_occ = [
-        "eeno1",
-        "eeno2",
-        "tsjdate1",
-        "tsjdate2",
-        "tejdate1",
-        "tejdate2",
-        "ejbhrs1",
-        "ejbhrs2",
-        "tpmsum1",
-        "tpmsum2",
-        "eclwrk1",
-        "eclwrk2",
-        "tjbocc1",
-        "ajbocc1",
-        "tjbocc2",
-        "ajbocc2",
-    ]
+    return temp
 
-    vars_earn = ["tpearn", "tptrninc", "tptotinc", "tpothinc", "tpprpinc"]
 
-    vars_wgt = ["wpfinwgt"]
+def SIPP_sample(temp: pd.DataFrame, panel: int) -> pd.DataFrame:
+    """
+    This function implements step 2 and step 3 of the cleaning procedures:
+    id-relevant and demographic information is generated, and sample
+    restrictions are conducted.
+    """
 
-    vars_all = (
-        vars_id + vars_demogr + vars_emp + vars_occ + vars_earn + vars_wgt
-    )
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 0. import necessary packages
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
 
-    temp = sipp[vars_all]
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # -? s-0-1. Functions for DataFrame manipulation
+    # -? (stored in codes/util/funcsforpandas.py)
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    from util.funcsforpandas import sort_once, segments, seg_transform
 
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
     # ?? step 2. process vars_id
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
 
-    panel_year = panel
-
     # -? s-2-1 panel information
-    temp.loc[:, "panel"] = panel_year
+    temp.loc[:, "panel"] = panel
     temp["panel"] = temp["panel"].astype("Int64")
 
     # -? s-2-2 individual id: add panel prefix to distinguish with other panels' id
@@ -400,18 +177,8 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     # -? s-2-4 occurrence counts
     temp["occurrence"] = temp.groupby("indid").cumcount() + 1
 
-    # -? s-2-5 order and sort
-    cols_first = (
-        "panel",
-        "swave",
-        "year",
-        "month",
-        "ym",
-        "indid",
-        "occurrence",
-    )
-    temp = df_order(temp, cols_first)
-    temp = temp.sort_values(by=["indid", "ym"])
+    # -? s-2-5 sort
+    temp = sort_once(temp, ["indid", "ym"])
 
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
     # ?? step 3. process vars_demogr and do sample restrictions
@@ -437,7 +204,9 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     ] = 1
     temp.loc[(temp["selfemp"].isna()), "selfemp"] = 0
 
-    temp["ind_selfemp"] = temp.groupby("indid")["selfemp"].transform("max")
+    temp["ind_selfemp"] = seg_transform(
+        temp["selfemp"], segments(temp, ["indid"]), "max"
+    )
 
     # impt: drop individuals who have ever been self-employed
     temp = temp.loc[(temp["ind_selfemp"] == 0), :]
@@ -461,7 +230,9 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     temp.loc[(temp["eafever"].isin([1])), "armed"] = 1
     temp.loc[(temp["eafever"].isin([2])), "armed"] = 0
 
-    temp["ind_armed"] = temp.groupby("indid")["armed"].transform("max")
+    temp["ind_armed"] = seg_transform(
+        temp["armed"], segments(temp, ["indid"]), "max"
+    )
 
     # impt: drop observations who have been in the armed force
     temp = temp.loc[(temp["ind_armed"] == 0), :]
@@ -511,22 +282,47 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
         ]
     )
 
-    cols_first = (
-        "panel",
-        "swave",
-        "year",
-        "month",
-        "ym",
-        "indid",
-        "occurrence",
-        "tbyear",
-        "age",
-        "male",
-        "edu",
-        "ems",
+    temp = sort_once(temp, ["indid", "ym"])
+
+    return temp
+
+
+def SIPP_spells(
+    temp: pd.DataFrame, prev_person: pd.DataFrame = None
+) -> pd.DataFrame:
+    """
+    This function implements step 4 to step 7 of the cleaning procedures:
+    monthly employment status is generated, spells of interest are marked,
+    and the source and destination occupations are collected.
+
+    All procedures stay within an individual, except that the previous row
+    of an individual's first occurrence (used in the unemployment cases) is
+    the last occurrence of the previous individual. When temp holds only a
+    subset of individuals, prev_person supplies these values for the
+    individuals in its index ("indid"), in columns "indid_lstoccur" and
+    "ym_lstoccur".
+    """
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 0. import necessary packages
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # -? s-0-1. Functions for DataFrame manipulation
+    # -? (stored in codes/util/funcsforpandas.py)
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    from util.funcsforpandas import (
+        sort_once,
+        segments,
+        seg_shift,
+        seg_cumsum,
+        seg_transform,
     )
-    temp = df_order(temp, cols_first)
-    temp = temp.sort_values(by=["indid", "ym"])
+
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # -? s-0-2. Integrity checks (stored in codes/util/integrity.py)
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    from util.integrity import check, unique_months
 
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
     # ?? step 4. process vars_emp
@@ -587,7 +383,7 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     ]:
         temp[var] = temp[var].astype("Int64")
 
-    temp = temp.sort_values(by=["indid", "ym"])
+    temp = sort_once(temp, ["indid", "ym"])
 
     # &? Generate shifted ([_n]=[_n-1]) observations for the following variables
     # &? ["indid", "ym", "rwkesr2", "rwkesr3", "rwkesr4", "rwkesr5"]
@@ -599,6 +395,19 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     temp["rwkesr4_lstoccur"] = temp["rwkesr4"].shift(periods=1)
     temp["rwkesr5_lstoccur"] = temp["rwkesr5"].shift(periods=1)
 
+    # &? With only a subset of individuals, the last occurrence before each
+    # &? individual's first occurrence is taken from prev_person instead.
+    if prev_person is not None:
+        first = ~temp["indid"].duplicated() & temp["indid"].isin(
+            prev_person.index
+        )
+        temp.loc[first, "indid_lstoccur"] = (
+            temp.loc[first, "indid"].map(prev_person["indid_lstoccur"]).array
+        )
+        temp.loc[first, "ym_lstoccur"] = (
+            temp.loc[first, "indid"].map(prev_person["ym_lstoccur"]).array
+        )
+
     # &? Generate shifted ([_n]=[_n+1]) observations for the following variables
     # &? ["indid", "ym", "empl"]
     # &? Identification of unemployment will need these next-occurrence values.
@@ -718,23 +527,12 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     ] = 1
 
     # &? Case 3. In earlier months, he has declared to be retired.
-    first_retired_month = (
-        temp[temp["retired"] == 1].groupby("indid")["ym"].min().reset_index()
-    )
-
-    first_retired_month = first_retired_month.rename(
-        columns={"ym": "first_retired_month"}
-    )
-    temp = temp.merge(
-        first_retired_month,
-        on="indid",
-        how="left",
-        validate="many_to_one",
-        indicator=True,
-    )
-
-    temp.loc[(temp["ym"] >= temp["first_retired_month"]), "retired"] = 1
-    temp = temp.drop(columns=["_merge", "first_retired_month"])
+    # &? Rows are sorted by (indid, ym), so a month is at or after his first
+    # &? retired month if he is retired in this or an earlier row.
+    temp["retired"] = (
+        seg_cumsum(temp["retired"], segments(temp, ["indid"])) > 0
+    ).astype("Int64")
+    temp = temp.reset_index(drop=True)
 
     # &? Modify employment status according to retirement
     temp.loc[temp["retired"] == 1, "empl"] = 0
@@ -764,7 +562,9 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
         "gov2",
     ] = 1
     temp.loc[((temp["gov1"] == 1) | (temp["gov2"] == 1)), "gov"] = 1
-    temp["ind_gov"] = temp.groupby("indid")["gov"].transform("max")
+    temp["ind_gov"] = seg_transform(
+        temp["gov"], segments(temp, ["indid"]), "max"
+    )
 
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
     # -? s-4-4. drop, order, and sort columns
@@ -787,31 +587,7 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
         ]
     )
 
-    cols_first = (
-        "indid",
-        "occurrence",
-        "ym",
-        "empl",
-        "unempl",
-        "outlf",
-        "panel",
-        "swave",
-        "year",
-        "month",
-        "inlf",
-        "retired",
-        "mn_empl",
-        "mn_unempl",
-        "mn_outlf",
-        "age",
-        "tbyear",
-        "male",
-        "edu",
-        "ems",
-    )
-    temp = df_order(temp, cols_first)
-
-    temp = temp.sort_values(by=["indid", "ym"])
+    temp = sort_once(temp, ["indid", "ym"])
 
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
     # ?? step 5. mark spells of interest
@@ -821,9 +597,10 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     # -? s-5-1. discontinuous spell (point indicator)
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
 
-    temp = temp.sort_values(by=["indid", "ym"])
+    temp = sort_once(temp, ["indid", "ym"])
 
-    temp["next_ym"] = temp.groupby("indid")["ym"].shift(-1)
+    new_indid = segments(temp, ["indid"])
+    temp["next_ym"] = seg_shift(temp["ym"], new_indid, -1)
     temp["next_indid"] = temp["indid"].shift(-1)
 
     # &? Under the same "indid", if next occurrence month is not next calendar
@@ -848,7 +625,7 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
 
     # &? This variable documents which continuous spell the individual is in.
-    temp["cont_spell_no"] = temp.groupby("indid")["disc_spell"].cumsum()
+    temp["cont_spell_no"] = seg_cumsum(temp["disc_spell"], new_indid)
     temp["cont_spell_no"] = temp["cont_spell_no"] + 1
 
     # &? Adjust for the last period of a spell (which drops into the next spell).
@@ -860,30 +637,18 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     # -? s-5-3. number of months in that spell
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
 
-    temp["len_cont_spell"] = temp.groupby(["indid", "cont_spell_no"])[
-        "indid"
-    ].transform("size")
+    new_cont_spell = segments(temp, ["indid", "cont_spell_no"])
+    temp["len_cont_spell"] = seg_transform(
+        temp["indid"], new_cont_spell, "size"
+    )
 
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
-    # -? s-5-4. drop, order, and sort
+    # -? s-5-4. drop and sort
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
 
     temp = temp.drop(columns=["next_ym", "next_indid"])
 
-    temp = df_order(
-        temp,
-        (
-            "indid",
-            "ym",
-            "cont_spell_no",
-            "len_cont_spell",
-            "empl",
-            "unempl",
-            "outlf",
-        ),
-    )
-
-    temp = temp.sort_values(by=["indid", "ym"])
+    temp = sort_once(temp, ["indid", "ym"])
 
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
     # ?? step 6. construct different types of EUE spell
@@ -903,12 +668,9 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     # &? defined by this notion should at least contain some search activities for
     # &? reemployment. So it is not that bad.
 
-    temp["nxt_empl"] = temp.groupby(["indid", "cont_spell_no"])["empl"].shift(
-        -1
-    )
-    temp["lst_empl"] = temp.groupby(["indid", "cont_spell_no"])["empl"].shift(
-        1
-    )
+    new_cont_spell = segments(temp, ["indid", "cont_spell_no"])
+    temp["nxt_empl"] = seg_shift(temp["empl"], new_cont_spell, -1)
+    temp["lst_empl"] = seg_shift(temp["empl"], new_cont_spell, 1)
 
     # &? For empl==1 to empl==0 transition inside an indid-cont_spell_no cell,
     # &? start_of_ubar is flagged as 1 at the start of the unemployment month,
@@ -935,14 +697,20 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
 
     temp["temp_period_id"] = (
-        temp.groupby(["indid", "cont_spell_no"])["start_of_ubar"].cumsum() + 1
+        seg_cumsum(temp["start_of_ubar"], new_cont_spell) + 1
     )
     temp.loc[(temp["empl"] == 1), "temp_period_id"] = np.nan
 
-    temp["ubar_spell_no"] = (
-        temp.groupby(["indid", "cont_spell_no", "temp_period_id"]).ngroup() + 1
-    )
+    # &? Rows are sorted by (indid, ym), so the groups of (indid, cont_spell_no,
+    # &? temp_period_id) are numbered in order of their first row (as ngroup).
+    in_ubar = temp["temp_period_id"].notna().to_numpy()
+    temp["ubar_spell_no"] = np.nan
     temp["ubar_spell_no"] = temp["ubar_spell_no"].astype("Int64")
+    temp.loc[in_ubar, "ubar_spell_no"] = np.cumsum(
+        segments(
+            temp.loc[in_ubar, :], ["indid", "cont_spell_no", "temp_period_id"]
+        )
+    )
 
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
     # -? s-6-3. modify "ubar_spell_no" - non-missing only for E(UBAR)E spells
@@ -1040,27 +808,6 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
         ]
     )
 
-    temp = df_order(
-        temp,
-        (
-            "ym",
-            "indid",
-            "cont_spell_no",
-            "len_cont_spell",
-            "ubar_spell_no",
-            "len_ubar_spell",
-            "ustar_spell_no",
-            "len_ustar_spell",
-            "u_spell_no",
-            "len_u_spell",
-            "empl",
-            "unempl",
-            "outlf",
-            "start_of_ubar",
-            "end_of_ubar",
-        ),
-    )
-
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
     # ?? step 7. process vars_occ
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
@@ -1200,82 +947,36 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     # -? s-7-3. obtain source and destination occupations
     # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
 
+    # &? Each individual has one row per month (checked by unique_months), and
+    # &? rows are sorted by (indid, ym). The start month of a ubar spell follows
+    # &? an employed month of the same continuous spell, so the previous row is
+    # &? the last month; similarly, the next row of its end month is the next
+    # &? month.
+    check(temp, [unique_months])
+
     # !! s-7-3-1. source occupation
     # &? The way I am obtaining the source information is to collect start months
     # &? of the ubar spells of interest, the last month for a start month stores
     # &? a worker's employed occupation.
-    start_of_ubar_info = temp.loc[
-        ((temp["start_of_ubar"] == 1) & (temp["ubar_spell_no"].notna())),
-        ["indid", "ym"],
-    ].reset_index(drop=False, names="original_index")
-
-    start_of_ubar_info["last_empl_month"] = start_of_ubar_info[
-        "ym"
-    ] - pd.DateOffset(months=1)
-
-    start_of_ubar_info = start_of_ubar_info.merge(
-        temp[["indid", "ym", "occ_raw"]],
-        how="left",
-        left_on=["indid", "last_empl_month"],
-        right_on=["indid", "ym"],
-        validate="one_to_one",
-        indicator=True,
-    )
-    start_of_ubar_info = start_of_ubar_info[["indid", "ym_x", "occ_raw"]]
-    start_of_ubar_info = start_of_ubar_info.rename(
-        columns={"ym_x": "ym", "occ_raw": "source_occ_raw"}
+    temp["source_occ_raw"] = (
+        temp["occ_raw"]
+        .shift(1)
+        .where((temp["start_of_ubar"] == 1) & (temp["ubar_spell_no"].notna()))
     )
 
     # !! s-7-3-2. destination occupation
     # &? The way I am obtaining the destination information is to collect start
     # &? months of the ubar spells of interest, the next month for a start month
     # &? stores a worker's employed occupation.
-    end_of_ubar_info = temp.loc[
-        ((temp["end_of_ubar"] == 1) & (temp["ubar_spell_no"].notna())),
-        ["indid", "ym"],
-    ].reset_index(drop=False, names="original_index")
-
-    end_of_ubar_info["next_empl_month"] = end_of_ubar_info[
-        "ym"
-    ] + pd.DateOffset(months=1)
-
-    end_of_ubar_info = end_of_ubar_info.merge(
-        temp[["indid", "ym", "occ_raw"]],
-        how="left",
-        left_on=["indid", "next_empl_month"],
-        right_on=["indid", "ym"],
-        validate="one_to_one",
-        indicator=True,
-    )
-    end_of_ubar_info = end_of_ubar_info[["indid", "ym_x", "occ_raw"]]
-    end_of_ubar_info = end_of_ubar_info.rename(
-        columns={"ym_x": "ym", "occ_raw": "destination_occ_raw"}
+    temp["destination_occ_raw"] = (
+        temp["occ_raw"]
+        .shift(-1)
+        .where((temp["end_of_ubar"] == 1) & (temp["ubar_spell_no"].notna()))
     )
 
-    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
-    # -? s-7-4. merge datasets to obtain the source and destination occupations
-    # -?        for an unemployment spell
-    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
-
-    temp = temp.merge(
-        start_of_ubar_info,
-        how="outer",
-        left_on=["indid", "ym"],
-        right_on=["indid", "ym"],
-        validate="one_to_one",
-        indicator=True,
-    )
-    temp = temp.drop(columns=["_merge"])
-
-    temp = temp.merge(
-        end_of_ubar_info,
-        how="outer",
-        left_on=["indid", "ym"],
-        right_on=["indid", "ym"],
-        validate="one_to_one",
-        indicator=True,
-    )
-    temp = temp.drop(columns=["_merge"])
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # -? s-7-4. spell-level source and destination occupations
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
 
     # &? Currently, the two source and destination occupation variables are only
     # &? defined at the start and end of a ubar spell, we need to make a
@@ -1293,48 +994,15 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
         mean_destination_occ_raw
     )
 
-    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
-    # -? s-7-4. order columns
-    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    return temp
 
-    temp = df_order(
-        temp,
-        (
-            "indid",
-            "ym",
-            "len_ubar_spell",
-            "ubar_spell_no",
-            "ustar_spell_no",
-            "u_spell_no",
-            "source_occ_raw",
-            "destination_occ_raw",
-            "tpearn",
-            "occ_raw",
-            "empl",
-            "unempl",
-            "outlf",
-            "panel",
-            "swave",
-            "year",
-            "month",
-            "age",
-            "tbyear",
-            "male",
-            "edu",
-            "ems",
-            "race",
-            "rmesr",
-            "rwkesr1",
-            "rwkesr2",
-            "rwkesr3",
-            "rwkesr4",
-            "rwkesr5",
-            "lgtkey",
-            "ssuid",
-            "eentaid",
-            "epppnum",
-        ),
-    )
+
+def SIPP_weights(temp: pd.DataFrame, panel: int) -> pd.DataFrame:
+    """
+    This function implements step 8 and step x of the cleaning procedures:
+    weights are normalized within the panel, and spell ids are made unique
+    across panels.
+    """
 
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
     # ?? step 8. normalize weights
@@ -1360,20 +1028,650 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     temp["sum_weights"] = temp.groupby(["panel"])["wpfinwgt"].transform("sum")
     temp["pweights"] = temp["wpfinwgt"] / temp["sum_weights"]
 
-    temp = df_order(temp, ("pweights",))
-
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
     # ?? step x. redefine un/non-employment spell id
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
 
-    temp["ubar_spell_no"] = temp["ubar_spell_no"] + panel_year * 100000
-    temp["ustar_spell_no"] = temp["ustar_spell_no"] + panel_year * 100000
-    temp["u_spell_no"] = temp["u_spell_no"] + panel_year * 100000
+    temp["ubar_spell_no"] = temp["ubar_spell_no"] + panel * 100000
+    temp["ustar_spell_no"] = temp["ustar_spell_no"] + panel * 100000
+    temp["u_spell_no"] = temp["u_spell_no"] + panel * 100000
+
+    return temp
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? Code Block 2. Sharded and Distributed Execution of Cleaning Procedures
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def _ubar_runs(temp: pd.DataFrame) -> pd.Series:
+    """
+    This function counts, for each individual, the runs of non-employment
+    months within continuous spells, i.e., the groups numbered by
+    "ubar_spell_no" in step 6 (before any spell is dropped).
+    """
+
+    from util.funcsforpandas import segments, seg_shift
+
+    new_cont_spell = segments(temp, ["indid", "cont_spell_no"])
+    lst_empl = seg_shift(temp["empl"], new_cont_spell, 1)
+    new_run = (temp["empl"] == 0) & (lst_empl.fillna(1) != 0)
+
+    new_indid = segments(temp, ["indid"])
+    runs = np.bincount(
+        np.cumsum(new_indid) - 1,
+        weights=new_run.to_numpy(dtype="int64"),
+        minlength=new_indid.sum(),
+    ).astype("int64")
+
+    indid = temp["indid"].to_numpy(dtype="int64")
+
+    return pd.Series(runs, index=indid[new_indid])
+
+
+def _dry_run(func, temp: pd.DataFrame, key: str, *args) -> list:
+    """
+    This function runs func on the first 100 individuals (identified by the
+    variable key) of temp, and returns the specification of the resulting
+    columns, used to preallocate the shared output of all shards.
+    """
+
+    from util.shm import frame_spec
+
+    persons = temp[key].drop_duplicates().iloc[:100]
+    head = temp.loc[temp[key].isin(persons), :]
+
+    return frame_spec(func(head, *args))
+
+
+def _shard_sample(
+    desc_in: dict, desc_out: dict, start: int, stop: int, panel: int
+) -> int:
+    """
+    This function runs step 2 to step 3 on rows start to stop of the shared
+    input, writes the remaining rows to the shared output from row start on,
+    and returns the number of remaining rows.
+    """
+
+    from util.shm import attach_frame, write_frame, release
+
+    temp, blocks = attach_frame(desc_in, start, stop)
+    result = SIPP_sample(temp, panel)
+    write_frame(desc_out, result, start)
+    n_rows = len(result)
+
+    del temp, result
+    release(blocks)
+
+    return n_rows
+
+
+def _shard_spells(
+    desc_in: dict,
+    desc_out: dict,
+    start: int,
+    stop: int,
+    prev_person: pd.DataFrame,
+) -> int:
+    """
+    This function runs step 4 to step 7 on rows start to stop of the shared
+    input, writes the result to the same rows of the shared output, and
+    returns the number of non-employment runs (see _ubar_runs).
+    """
+
+    from util.shm import attach_frame, write_frame, release
+
+    temp, blocks = attach_frame(desc_in, start, stop)
+    result = SIPP_spells(temp, prev_person)
+    write_frame(desc_out, result, start)
+    n_runs = int(_ubar_runs(result).sum())
+
+    del temp, result
+    release(blocks)
+
+    return n_runs
+
+
+def SIPP_sharded(
+    read,
+    panel: int,
+    n_shards: int,
+    n_workers: int = None,
+    columns: list = None,
+) -> pd.DataFrame:
+    """
+    This function implements step 2 to step 7 on n_shards groups of
+    individuals in n_workers parallel processes, and returns the same
+    DataFrame as running SIPP_sample and SIPP_spells on the whole panel.
+    The raw panel is returned by read (e.g., read_panel with its arguments),
+    called here so that the raw panel is freed once it is copied into shared
+    memory: the parent then only holds the shared columns while the workers
+    run.
+
+    Data are handed to the workers in shared memory (see util/shm.py): each
+    worker attaches to a contiguous range of rows of the input columns, and
+    writes its result into preallocated shared output columns.
+        (1) step 2 to step 3: individuals are assigned to shards by a hash of
+            "lgtkey";
+        (2) step 4 to step 7: the sample is sorted by "indid" and "ym", and
+            split into ranges of individuals.
+
+    Two procedures are not local to an individual, and are reconciled here:
+        (1) in step 4, an individual's first occurrence is compared with the
+            last occurrence of the previous individual, which is passed to
+            each range of individuals (prev_person in SIPP_spells);
+        (2) in step 6, spell ids are numbered over the whole panel, so each
+            range's ids are shifted by the number of non-employment runs of
+            the ranges before it.
+    With columns, the columns dead after step 3 are dropped before step 4
+    (see prune in codes/util/schema.py).
+    """
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    from util.funcsforpandas import sort_once
+    from util.schema import prune
+    from util.shards import sort_shards, range_bounds
+    from util.shm import allocate_frame, share_frame, take_frame
+    from util.shm import discard, release
+
+    blocks_in, blocks_out = [], []
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+
+            # -? step 2 to step 3 in each shard
+            temp, bounds = sort_shards(read(), "lgtkey", n_shards)
+            spec = _dry_run(SIPP_sample, temp, "lgtkey", panel)
+            desc_in, blocks_in = share_frame(temp)
+            del temp
+            desc_out, blocks_out = allocate_frame(spec, int(bounds[-1]))
+
+            starts, stops = bounds[:-1], bounds[1:]
+            n_rows = list(
+                pool.map(
+                    _shard_sample,
+                    [desc_in] * n_shards,
+                    [desc_out] * n_shards,
+                    starts,
+                    stops,
+                    [panel] * n_shards,
+                )
+            )
+            release(blocks_in, unlink=True)
+
+            temp = take_frame(
+                desc_out,
+                blocks_out,
+                [(start, start + n) for start, n in zip(starts, n_rows)],
+            )
+            temp = sort_once(temp, ["indid", "ym"]).reset_index(drop=True)
+            temp = prune(temp, "sample", columns)
+
+            # -? step 4 to step 7 in each range of individuals
+            bounds = range_bounds(temp["indid"], n_shards)
+            starts, stops = bounds[:-1], bounds[1:]
+            prev_persons = [None] + [
+                pd.DataFrame(
+                    {
+                        "indid_lstoccur": temp["indid"]
+                        .iloc[[start - 1]]
+                        .array,
+                        "ym_lstoccur": temp["ym"].iloc[[start - 1]].array,
+                    },
+                    index=temp["indid"].iloc[[start]],
+                )
+                for start in starts[1:]
+            ]
+            spec = _dry_run(SIPP_spells, temp, "indid")
+            desc_in, blocks_in = share_frame(temp)
+            n_sample = len(temp)
+            del temp
+            desc_out, blocks_out = allocate_frame(spec, n_sample)
+
+            n_runs = list(
+                pool.map(
+                    _shard_spells,
+                    [desc_in] * len(starts),
+                    [desc_out] * len(starts),
+                    starts,
+                    stops,
+                    prev_persons,
+                )
+            )
+            release(blocks_in, unlink=True)
+
+            temp = take_frame(desc_out, blocks_out)
+    except BaseException:
+        # &? free the shared memory of a failed run (e.g., a worker killed by
+        # &? the OOM killer), so that it can be rerun
+        discard(blocks_in + blocks_out)
+        raise
+
+    # -? renumber spell ids as if numbered over the whole panel
+    offset = np.repeat(np.cumsum([0] + n_runs[:-1]), stops - starts)
+    for var in ["ubar_spell_no", "ustar_spell_no", "u_spell_no"]:
+        temp[var] = temp[var] + offset
+
+    return temp
+
+
+def SIPP_sharded_planned(
+    read, panel: int, plan: dict, columns: list = None
+) -> pd.DataFrame:
+    """
+    This function runs SIPP_sharded with the shards of a plan (see
+    plan_cleaning in codes/util/planner.py), and with its workers that fit in
+    the memory available now. If a worker dies (e.g., killed by the OOM
+    killer) or memory runs out, the run is repeated with half the workers,
+    down to one worker, reading the raw panel again (read, see SIPP_sharded)
+    rather than keeping it alive during the run.
+    """
+
+    from concurrent.futures.process import BrokenProcessPool
+
+    from util.planner import fit_workers
+
+    n_workers = fit_workers(plan)
+    while True:
+        try:
+            return SIPP_sharded(
+                read, panel, plan["n_shards"], n_workers, columns
+            )
+        except (BrokenProcessPool, MemoryError) as error:
+            if n_workers == 1:
+                raise
+            n_workers = n_workers // 2
+            print(
+                f"Plan {panel}: sharded run failed ({type(error).__name__}), "
+                f"retrying with {n_workers} workers"
+            )
+
+
+def _queue_split(queue_dir: str, name: str, task: dict):
+    """
+    This function reads one wave file of a panel (a task of SIPP_submit),
+    and stores its rows in one output per shard, f"{name}-{shard:04d}", by a
+    hash of "lgtkey", so that each wave file is read once whatever the
+    number of shards.
+    """
+
+    from util.schema import raw_columns
+    from util.shards import sort_shards
+    from util.waves import read_wave
+    from util.workqueue import save_output
+
+    sample = None if task["sample"] is None else tuple(task["sample"])
+    raw = read_wave(task["path"], raw_columns(task["columns"]), sample)
+    raw, bounds = sort_shards(raw, "lgtkey", task["n_shards"])
+
+    for shard in range(task["n_shards"]):
+        save_output(
+            queue_dir,
+            f"{name}-{shard:04d}",
+            raw.iloc[bounds[shard] : bounds[shard + 1], :],
+        )
+
+
+def _queue_sample(queue_dir: str, name: str, task: dict):
+    """
+    This function runs step 2 to step 3 on one shard of a panel (a task of
+    SIPP_submit), on the rows of the shard stored by the tasks reading each
+    wave file (see _queue_split). It stores the result, and the last month
+    of each of its individuals.
+    """
+
+    from util.funcsforpandas import sort_once
+    from util.schema import prune
+    from util.workqueue import load_output, save_output
+
+    panel, columns = task["panel"], task["columns"]
+    temp = pd.concat(
+        [
+            load_output(queue_dir, f"{dep}-{task['shard']:04d}")
+            for dep in task["after"]
+        ],
+        axis=0,
+    )
+
+    temp = prune(SIPP_sample(temp, panel), "sample", columns)
+    temp = sort_once(temp, ["indid", "ym"]).reset_index(drop=True)
+    last_ym = temp.drop_duplicates(subset="indid", keep="last")
+
+    save_output(queue_dir, name, temp)
+    save_output(
+        queue_dir,
+        f"{name}-last",
+        pd.Series(last_ym["ym"].array, index=last_ym["indid"].array),
+    )
+
+
+def _queue_spells(queue_dir: str, name: str, task: dict):
+    """
+    This function runs step 4 to step 7 on the individuals of one shard (a
+    task of SIPP_submit), with the last occurrence of the previous
+    individual of the whole panel taken from the last months stored by all
+    step 2 to step 3 tasks. It stores the result and the non-employment runs
+    of each individual (see _ubar_runs).
+    """
+
+    from util.schema import prune
+    from util.workqueue import load_output, save_output
+
+    last_ym = pd.concat(
+        [load_output(queue_dir, f"{dep}-last") for dep in task["after"]]
+    ).sort_index()
+    prev_person = pd.DataFrame(
+        {
+            "indid_lstoccur": pd.Series(last_ym.index).shift(1).array,
+            "ym_lstoccur": last_ym.shift(1).array,
+        },
+        index=last_ym.index,
+    )
+
+    temp = load_output(queue_dir, task["input"])
+    prev_person = prev_person.loc[temp["indid"].unique(), :]
+    temp = SIPP_spells(temp, prev_person)
+    runs = _ubar_runs(temp)
+    temp = prune(temp, "spells", task["columns"])
+
+    save_output(queue_dir, name, (temp, runs))
+
+
+def _queue_merge(queue_dir: str, name: str, task: dict):
+    """
+    This function merges the shards of a panel after step 7 (a task of
+    SIPP_submit), renumbering spell ids over the whole panel (see
+    _renumber_spells), runs step 8 to step x, and exports the panel (see
+    SIPP_export).
+    """
+
+    from util.schema import prune
+    from util.workqueue import load_output
+
+    parts = []
+    for dep in task["after"]:
+        temp, runs = load_output(queue_dir, dep)
+        parts.append((temp, runs, runs.cumsum() - runs))
+    temp = _renumber_spells(parts)
+    del parts
+
+    panel, columns = task["panel"], task["columns"]
+    temp = prune(SIPP_weights(temp, panel), "weights", columns)
+    sample_fraction = 1.0 if task["sample"] is None else task["sample"][0]
+    SIPP_export(temp, panel, sample_fraction, columns)
+
+
+def SIPP_submit(
+    codes_path: str,
+    queue_dir: str,
+    panels: list,
+    n_shards: int,
+    sample_fraction: float = 1.0,
+    sample_seed: int = 0,
+    columns: list = None,
+    force: bool = False,
+) -> dict:
+    """
+    This function submits the cleaning of the panels in panels (pandas
+    backend) to a work queue in the folder queue_dir, on a filesystem shared
+    by all machines (see codes/util/workqueue.py), and returns the number of
+    tasks in each state. Each panel is cleaned in four rounds of tasks:
+        (1) each wave file is read once, and split into n_shards shards of
+            individuals, by a hash of "lgtkey" (see _queue_split);
+        (2) step 2 to step 3 on each shard (see _queue_sample);
+        (3) step 4 to step 7 on the same shards, once all shards of round 2
+            are done (see _queue_spells);
+        (4) one merge of the shards, step 8 to step x, and the export of
+            temp`panel'.dta (see _queue_merge).
+    The tasks are run by any number of workers, started on each machine by
+        python codes/util/workqueue.py <queue_dir>
+    and the data roots of all machines must be the same shared folders (see
+    codes/util/paths.py). sample_fraction, sample_seed, and columns are as
+    in SIPP_cleaning.
+
+    Submitting again adds back the failed tasks, and reruns the tasks done
+    whose wave file or cleaning code changed since (see fingerprint and
+    code_version in codes/util/checkpoint.py), and the tasks after them;
+    force=True reruns all tasks.
+    """
+
+    sys.path.append(codes_path)
+    from util.checkpoint import code_version, fingerprint
+    from util.preflight import preflight
+    from util.schema import raw_columns
+    from util.waves import wave_files
+    from util.workqueue import status, submit
+
+    preflight(panels, raw_columns(columns))
+
+    sample = [sample_fraction, sample_seed] if sample_fraction < 1 else None
+    tasks = {}
+    for panel in panels:
+        args = {
+            "panel": panel,
+            "sample": sample,
+            "columns": columns,
+            "version": code_version(),
+        }
+        paths = wave_files(panel)
+        split_names = [
+            f"{panel}-1-split-{wave:02d}" for wave in range(1, len(paths) + 1)
+        ]
+        sample_names = [
+            f"{panel}-2-sample-{shard:04d}" for shard in range(n_shards)
+        ]
+        spells_names = [
+            f"{panel}-3-spells-{shard:04d}" for shard in range(n_shards)
+        ]
+        for split_name, path in zip(split_names, paths):
+            tasks[split_name] = dict(
+                args,
+                func="clean.aSIPP:_queue_split",
+                after=[],
+                path=path,
+                fingerprint=list(fingerprint(path)),
+                n_shards=n_shards,
+            )
+        for shard in range(n_shards):
+            tasks[sample_names[shard]] = dict(
+                args,
+                func="clean.aSIPP:_queue_sample",
+                after=split_names,
+                shard=shard,
+            )
+        for shard in range(n_shards):
+            tasks[spells_names[shard]] = dict(
+                args,
+                func="clean.aSIPP:_queue_spells",
+                after=sample_names,
+                input=sample_names[shard],
+            )
+        tasks[f"{panel}-4-merge"] = dict(
+            args, func="clean.aSIPP:_queue_merge", after=spells_names
+        )
+
+    submit(queue_dir, tasks, force)
+
+    return status(queue_dir)
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? Code Block 3. Incremental Cleaning of New or Changed Waves
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def _renumber_spells(parts: list) -> pd.DataFrame:
+    """
+    This function combines cleaned parts of a panel (after step 7), given as
+    (DataFrame, runs, offsets) with the non-employment runs of each individual
+    (see _ubar_runs) and the offsets of each individual's spell ids in that
+    part. Spell ids are renumbered as if numbered over the combined panel.
+    """
+
+    from util.funcsforpandas import sort_once
+
+    runs_all = pd.concat([runs for _, runs, _ in parts]).sort_index()
+    offsets_all = runs_all.cumsum() - runs_all
+    shift = offsets_all - pd.concat([offsets for _, _, offsets in parts])
+
+    temp = pd.concat([part for part, _, _ in parts], axis=0)
+    temp = sort_once(temp, ["indid", "ym"]).reset_index(drop=True)
+    shift = temp["indid"].map(shift).astype("Int64")
+    for var in ["ubar_spell_no", "ustar_spell_no", "u_spell_no"]:
+        temp[var] = temp[var] + shift
+
+    return temp
+
+
+def SIPP_cleaning_incremental(
+    panel: int, rebuild: bool = False
+) -> pd.DataFrame:
+    """
+    This function implements all data cleaning procedures with pandas (as
+    SIPP_cleaning_pandas), but only re-ingests the wave files which are new or
+    changed since the last run, and only re-cleans the individuals affected by
+    them. The state of the last run is checkpointed in the scratch folder
+    (see codes/util/checkpoint.py); without a checkpoint, with a checkpoint
+    saved by another version of the cleaning code, or with rebuild=True, all
+    wave files are new.
+        (1) step 2 to step 3 rerun for the individuals ("lgtkey") with rows
+            in a new or changed wave file, before or after the change;
+        (2) step 4 to step 7 rerun for these individuals and the individual
+            next to each of them, whose first occurrence is compared with the
+            last occurrence of the previous individual (step 4);
+        (3) spell ids are renumbered over the panel, and step 8 to step x run
+            on the whole panel.
+    """
 
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
-    # ?? step y. print some useful information for each panel
+    # ?? step 0. import necessary packages and load the checkpoint
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
 
+    from util.checkpoint import drop_state, fingerprint, load_state
+    from util.checkpoint import save_state
+    from util.funcsforpandas import sort_once
+    from util.waves import read_wave, wave_files, vars_all
+
+    if rebuild:
+        drop_state(panel)
+    state = load_state(panel)
+    if state is None:
+        state = {"waves": {}, "raw": {}, "sample": None, "spells": None}
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 1. ingest new or changed wave files
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    files = wave_files(panel)
+    waves = {path: fingerprint(path) for path in files if os.path.exists(path)}
+    changed = [
+        path
+        for path in files
+        if waves.get(path) != state["waves"].get(path)
+    ]
+
+    if not changed and state["spells"] is not None:
+        return SIPP_weights(state["spells"], panel)
+
+    keys = []
+    for path in changed:
+        if path in state["raw"]:
+            keys.append(state["raw"].pop(path)["lgtkey"])
+        if path in waves:
+            state["raw"][path] = read_wave(path, vars_all)
+            keys.append(state["raw"][path]["lgtkey"])
+    state["raw"] = {
+        path: state["raw"][path] for path in files if path in state["raw"]
+    }
+    state["waves"] = waves
+    lgtkeys = pd.concat(keys).unique()
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 2 to step 3. rerun for affected individuals
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    temp = pd.concat(
+        [
+            raw.loc[raw["lgtkey"].isin(lgtkeys), :]
+            for raw in state["raw"].values()
+        ],
+        axis=0,
+    )
+    sample = state["sample"]
+    if sample is not None:
+        sample = sample.loc[~sample["lgtkey"].isin(lgtkeys), :]
+    if len(temp):
+        sample = pd.concat([sample, SIPP_sample(temp, panel)], axis=0)
+    sample = sort_once(sample, ["indid", "ym"])
+    state["sample"] = sample
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 4 to step 7. rerun for affected and next individuals
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    last_ym = sample.drop_duplicates(subset="indid", keep="last")
+    last_ym = pd.Series(last_ym["ym"].array, index=last_ym["indid"].array)
+    indids = last_ym.index.to_numpy(dtype="int64")
+
+    affected = (
+        (str(panel) + pd.Series(lgtkeys, dtype="str")).astype("int64").to_numpy()
+    )
+    nxt = np.searchsorted(indids, affected, side="right")
+    rerun = np.union1d(
+        np.intersect1d(indids, affected), indids[nxt[nxt < len(indids)]]
+    )
+
+    prev_person = pd.DataFrame(
+        {
+            "indid_lstoccur": pd.Series(last_ym.index).shift(1).array,
+            "ym_lstoccur": last_ym.shift(1).array,
+        },
+        index=last_ym.index,
+    ).loc[rerun, :]
+    temp = SIPP_spells(
+        sample.loc[sample["indid"].isin(rerun), :], prev_person
+    )
+
+    # -? combine with the unaffected individuals of the last run
+    runs = _ubar_runs(temp)
+    parts = [(temp, runs, runs.cumsum() - runs)]
+    spells = state["spells"]
+    if spells is not None:
+        runs = _ubar_runs(spells)
+        offsets = runs.cumsum() - runs
+        keep = runs.index[
+            ~runs.index.isin(rerun) & runs.index.isin(last_ym.index)
+        ]
+        spells = spells.loc[spells["indid"].isin(keep), :]
+        parts.append((spells, runs.loc[keep], offsets.loc[keep]))
+
+    temp = _renumber_spells(parts)
+    state["spells"] = temp
+    save_state(panel, state, changed)
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 8 to step x. panel-level procedures
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    return SIPP_weights(temp, panel)
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? Code Block 4. Summary Information of a Cleaned Panel
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def SIPP_summary(
+    temp: pd.DataFrame, panel_year: int, sample_fraction: float = 1.0
+) -> dict:
+    """
+    This function prints some useful information for a cleaned panel, and
+    returns the printed numbers in a dictionary. For a subsample of persons
+    (sample_fraction < 1), the numbers extrapolated to the full panel
+    (divided by sample_fraction) are printed as well, and returned with
+    "_full" appended to their names.
+    """
+
     # -? panel year
     print(f"\nPanel = {panel_year}")
 
@@ -1449,21 +1747,224 @@ def SIPP_cleaning(codes_path: str, panel: int) -> None:
     ].nunique()
     print(f"Number of E(U)E spells with identified occ info: {num_u_occ}")
 
+    summary = {
+        "num_ubar_spell_no": num_ubar_spell_no,
+        "num_ustar_spell_no": num_ustar_spell_no,
+        "num_u_spell_no": num_u_spell_no,
+        "num_indid_ubar": num_indid_ubar,
+        "num_indid_ustar": num_indid_ustar,
+        "num_indid_u": num_indid_u,
+        "no_firmid": no_firmid,
+        "no_occraw": no_occraw,
+        "num_ubar_occ": num_ubar_occ,
+        "num_ustar_occ": num_ustar_occ,
+        "num_u_occ": num_u_occ,
+    }
+
+    # -? full-panel estimates of a subsample of persons
+    if sample_fraction < 1:
+        print(f"Full-panel estimates (sample fraction = {sample_fraction}):")
+        for name, number in list(summary.items()):
+            summary[f"{name}_full"] = round(number / sample_fraction)
+            print(f"    {name}: {summary[f'{name}_full']}")
+
+    return summary
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? Code Block 5. Function to Clean SIPP Datasets
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def SIPP_export(
+    temp: pd.DataFrame,
+    panel: int,
+    sample_fraction: float = 1.0,
+    columns: list = None,
+) -> pd.DataFrame:
+    """
+    This function checks a cleaned panel and prints some useful information
+    (see SIPP_summary), and stores it in the tempdata folder as
+    temp`panel'.dta (temp`panel'_sample.dta for a subsample of persons,
+    sample_fraction < 1, and temp`panel'_subset.dta for a subset of the
+    output columns, columns).
+    """
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 0. import necessary packages
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # -? s-0-1. Functions for data paths (stored in codes/util/paths.py)
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    from util.paths import tempdata
+
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # -? s-0-2. Compiled value labels (stored in codes/util/categoricals.py)
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    from util.categoricals import stata_value_labels
+
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # -? s-0-3. Output schema (stored in codes/util/schema.py)
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    from util.schema import apply_schema, stata_variable_labels
+
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # -? s-0-4. Integrity checks (stored in codes/util/integrity.py)
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    from util.integrity import check
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step y. check and print some useful information for each panel
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    check(temp)
+    SIPP_summary(temp, panel, sample_fraction)
+
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
     # ?? step z. export as dta file
     # ??         (used in further occupation recoding procedures)
     # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
-    temp["indid"] = temp["indid"].astype("str")
-    dta_name = f"temp{panel}.dta"
-    temp.to_stata(tempdata(dta_name), write_index=False)
+    temp = apply_schema(temp, columns)
+    if "indid" in temp.columns:
+        temp["indid"] = temp["indid"].astype("str")
+    dta_name = f"temp{panel}"
+    if sample_fraction < 1:
+        dta_name += "_sample"
+    if columns is not None:
+        dta_name += "_subset"
+    temp.to_stata(
+        tempdata(f"{dta_name}.dta"),
+        write_index=False,
+        variable_labels={
+            col: label
+            for col, label in stata_variable_labels().items()
+            if col in temp.columns
+        },
+        value_labels=stata_value_labels(temp.columns),
+    )
+
+    return temp
+
+
+def SIPP_cleaning(
+    codes_path: str,
+    panel: int,
+    backend: str = "pandas",
+    n_shards: int = 1,
+    n_workers: int = None,
+    incremental: bool = False,
+    rebuild: bool = False,
+    sample_fraction: float = 1.0,
+    sample_seed: int = 0,
+    columns: list = None,
+) -> pd.DataFrame:
+    """
+    This function wraps all data cleaning procedures into a function, taking
+    SIPP panel year and codes_path as arguments, generates a .dta file --
+    temp`panel'.dta, and stores the resulting dat file in the tempdata folder.
+
+    The cleaning procedures run on one of three backends, selected by backend:
+        "pandas": SIPP_cleaning_pandas above (eager pandas),
+        "polars": SIPP_cleaning_polars in clean/aSIPPpolars.py (one lazy
+                  Polars query plan, requires the polars package),
+        "duckdb": SIPP_cleaning_duckdb in clean/aSIPPduckdb.py (SQL in an
+                  on-disk DuckDB database for panels larger than memory,
+                  requires the duckdb package).
+    All backends generate the same temp`panel'.dta.
+
+    With the pandas backend, n_shards > 1 splits the panel into n_shards
+    groups of individuals, which are cleaned in n_workers parallel processes
+    (by default, one per CPU core); n_shards="auto" plans the shards, workers,
+    and rows per chunk read from the memory and cores available (see
+    codes/util/planner.py). With incremental=True, only new or changed
+    wave files since the last incremental run are processed (see
+    SIPP_cleaning_incremental), and rebuild=True discards the checkpoint of
+    the last run first. To clean panels on several machines sharing
+    a filesystem, see SIPP_submit instead.
+
+    For development runs, sample_fraction < 1 keeps a deterministic subsample
+    of about sample_fraction of the persons (the same persons in every wave,
+    chosen by hashing "lgtkey" with sample_seed), dropped as the wave files
+    are read; the printed numbers come with full-panel estimates, and the
+    result is stored as temp`panel'_sample.dta instead.
+
+    With columns, a subset of the output columns (see codes/util/schema.py),
+    only these columns are output, and the result is stored as
+    temp`panel'_subset.dta instead. With the pandas and duckdb backends, only
+    the raw variables needed for them are read, and with the pandas backend,
+    every other column is dropped after the last step that uses it.
+
+    Version: 2024-10-19
+    """
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 0. import necessary packages
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # -? s-0-1. Codes folder (for the imports below)
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    sys.path.append(codes_path)
+
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # -? s-0-2. Output schema (stored in codes/util/schema.py)
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    from util.schema import raw_columns
+
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    # -? s-0-3. Preflight check (stored in codes/util/preflight.py)
+    # -?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?#-?
+    from util.preflight import preflight
+
+    # &? Only the headers of the wave files are read, so a missing wave file or
+    # &? variable fails here, before any data is loaded.
+    # &? The polars backend reads all raw variables.
+    read_columns = raw_columns(columns)
+    if backend == "polars":
+        read_columns = raw_columns()
+    preflight([panel], read_columns, missing_ok=incremental)
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 1 to step x. cleaning procedures
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    sample = (sample_fraction, sample_seed) if sample_fraction < 1 else None
+
+    if incremental:
+        if backend != "pandas":
+            raise ValueError("Incremental cleaning requires the pandas backend")
+        if sample is not None or columns is not None:
+            raise ValueError("Incremental cleaning reads the full panel")
+        temp = SIPP_cleaning_incremental(panel, rebuild)
+    elif backend == "pandas":
+        temp = SIPP_cleaning_pandas(
+            panel, n_shards, n_workers, sample, columns
+        )
+    elif backend == "polars":
+        from clean.aSIPPpolars import SIPP_cleaning_polars
+
+        temp = SIPP_cleaning_polars(panel, sample)
+    elif backend == "duckdb":
+        from clean.aSIPPduckdb import SIPP_cleaning_duckdb
+
+        temp = SIPP_cleaning_duckdb(panel, sample=sample, columns=columns)
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step y to step z. check, print, and export as dta file
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    return SIPP_export(temp, panel, sample_fraction, columns)
 
 
 # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
-# ?? Code Block 2. Run the Function
+# ?? Code Block 6. Run the Function
 # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
 
 if __name__ == "__main__":
-    codes_path = r"E:\\Projects\\OccupationalMobilityInEUE\\codes"
+    # &? codes folder of this file; data roots are set in codes/util/paths.py
+    codes_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     SIPP_cleaning(codes_path, panel=1996)
     SIPP_cleaning(codes_path, panel=2001)
     SIPP_cleaning(codes_path, panel=2004)
@@ -0,0 +1,607 @@
+#! python3
+
+"""
+This file implements the cleaning procedures of the SIPP_cleaning function in
+"aSIPP.py" as SQL queries in an embedded DuckDB database file.
+
+The raw waves are read one at a time (with column projection, and redesigned
+files chunk by chunk) and appended to a table in a local database file, so at
+most one wave is ever held in memory by pandas. All remaining steps (sample
+restrictions, status rules, lead/lag windows over (indid, ym), spell numbering,
+source and destination occupation lookups, weights) are SQL over that table.
+DuckDB runs them on all cores and spills to disk when a step does not fit in
+memory. The result is streamed out of the database in chunks; only the cleaned
+panel itself is held in memory, for the checks and the .dta export.
+
+Each step mirrors the corresponding step of the pandas backend, and the
+resulting DataFrame is identical to the output of SIPP_cleaning_pandas.
+
+Usage:
+    SIPP_cleaning(codes_path, panel, backend="duckdb")
+
+Wang Wenzhi
+Time: 2024-10-19
+"""
+
+import os
+import shutil
+
+import duckdb
+import pandas as pd
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? Code Block 1. SQL for Each Step
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+# -? step 2. process vars_id
+SQL_STEP2 = """
+CREATE OR REPLACE TABLE s2 AS
+SELECT
+    * EXCLUDE (rhcalmn, rhcalyr, rowid),
+    rhcalmn AS month,
+    rhcalyr AS year,
+    make_date(rhcalyr, rhcalmn, 1)::TIMESTAMP AS ym,
+    ROW_NUMBER() OVER (PARTITION BY indid ORDER BY rowid) AS occurrence
+FROM (
+    SELECT
+        *,
+        {panel}::BIGINT AS panel,
+        CAST('{panel}' || lgtkey AS BIGINT) AS indid
+    FROM raw
+)
+"""
+
+# -? step 3. process vars_demogr and do sample restrictions
+SQL_STEP3 = """
+CREATE OR REPLACE TABLE s3 AS
+WITH intvw AS (
+    SELECT
+        *,
+        CASE WHEN ebuscntr >= 1 OR ebno1 <> -1 OR ebno2 <> -1
+            THEN 1 ELSE 0 END AS selfemp
+    FROM s2
+    WHERE eppintvw IN (1, 2)
+),
+no_selfemp AS (
+    SELECT *
+    FROM (
+        SELECT *, MAX(selfemp) OVER (PARTITION BY indid) AS ind_selfemp
+        FROM intvw
+    )
+    WHERE ind_selfemp = 0
+),
+age AS (
+    SELECT *
+    FROM (SELECT *, year - tbyear AS age FROM no_selfemp)
+    WHERE age BETWEEN 18 AND 65
+),
+armed AS (
+    SELECT *
+    FROM (
+        SELECT
+            *,
+            MAX(armed) OVER (PARTITION BY indid) AS ind_armed
+        FROM (
+            SELECT
+                *,
+                CASE eafever WHEN -1 THEN -1 WHEN 1 THEN 1 WHEN 2 THEN 0 END
+                    AS armed
+            FROM age
+        )
+    )
+    WHERE ind_armed = 0
+)
+SELECT
+    * EXCLUDE (
+        esex, eeducate, eafnow, eafever, erace, ebuscntr, ebno1, ebno2
+    ),
+    CASE
+        WHEN eeducate = -1 THEN -1
+        WHEN eeducate BETWEEN 31 AND 38 THEN 1
+        WHEN eeducate = 39 THEN 2
+        WHEN eeducate BETWEEN 40 AND 43 THEN 3
+        WHEN eeducate = 44 THEN 4
+        WHEN eeducate BETWEEN 45 AND 47 THEN 5
+    END AS edu,
+    CASE
+        WHEN erace = 1 THEN 1
+        WHEN erace = 2 THEN 2
+        WHEN erace IN (3, 4) THEN 3
+    END AS race,
+    CASE WHEN esex = 1 THEN 1 WHEN esex = 2 THEN 0 END AS male
+FROM armed
+"""
+
+# -? step 4. process vars_emp
+SQL_STEP4 = """
+CREATE OR REPLACE TABLE s4 AS
+WITH status AS (
+    SELECT
+        *,
+        CASE WHEN rmesr IN (1, 2, 3, 4, 5) THEN 1 ELSE 0 END AS mn_empl,
+        CASE WHEN rmesr IN (6, 7) THEN 1 ELSE 0 END AS mn_unempl,
+        CASE WHEN rmesr = 8 THEN 1 ELSE 0 END AS mn_outlf,
+        CASE WHEN rmesr IN (1, 2, 3) OR rwkesr2 IN (1, 2, 3)
+            THEN 1 ELSE 0 END AS empl
+    FROM s3
+),
+unempl AS (
+    SELECT
+        *,
+        CASE
+            -- Case 1. rwkesr2==4 and rmesr!=1,2,3
+            WHEN rmesr NOT IN (1, 2, 3) AND rwkesr2 = 4 THEN 1
+            -- Case 2. rwkesr2==5 and rwkesr1==4 and rmesr!=1,2,3
+            WHEN rmesr NOT IN (1, 2, 3) AND rwkesr2 = 5 AND rwkesr1 = 4
+                THEN 1
+            -- Case 3. looking for work at any week last month
+            WHEN ym - INTERVAL 1 MONTH = LAG(ym) OVER w_all
+                AND indid = LAG(indid) OVER w_all
+                AND rmesr NOT IN (1, 2, 3)
+                AND rwkesr2 = 5
+                AND (
+                    LAG(rwkesr2) OVER w_all = 4
+                    OR LAG(rwkesr3) OVER w_all = 4
+                    OR LAG(rwkesr4) OVER w_all = 4
+                    OR LAG(rwkesr5) OVER w_all = 4
+                )
+                THEN 1
+            -- Case 4. first occurrence, out of labor force, employed next
+            WHEN indid = LEAD(indid) OVER w_all
+                AND indid <> LAG(indid) OVER w_all
+                AND ym + INTERVAL 1 MONTH = LEAD(ym) OVER w_all
+                AND ym <> LAG(ym) OVER w_all + INTERVAL 1 MONTH
+                AND rmesr NOT IN (1, 2, 3)
+                AND rwkesr2 = 5
+                AND LEAD(empl) OVER w_all = 1
+                THEN 1
+            ELSE 0
+        END AS unempl
+    FROM status
+    WINDOW w_all AS (ORDER BY indid, ym)
+),
+lf AS (
+    SELECT
+        *,
+        CASE WHEN empl = 0 AND unempl = 0 THEN 1 ELSE 0 END AS outlf,
+        CASE WHEN empl = 1 OR unempl = 1 THEN 1 ELSE 0 END AS inlf,
+        -- Case 1 of retirement. Case 2 of the pandas backend, written there
+        -- as (ersend1 == 2) | ersend2 == 2, never holds and is left out.
+        CASE WHEN ersnowrk = 4 AND empl = 0 AND unempl = 0
+            THEN 1 ELSE 0 END AS retired_
+    FROM unempl
+),
+retired AS (
+    SELECT
+        * EXCLUDE (retired_),
+        CASE
+            WHEN ym >= MIN(CASE WHEN retired_ = 1 THEN ym END)
+                OVER (PARTITION BY indid)
+            THEN 1
+            ELSE retired_
+        END AS retired
+    FROM lf
+),
+modified AS (
+    SELECT
+        * REPLACE (
+            CASE WHEN retired = 1 THEN 0 ELSE empl END AS empl,
+            CASE WHEN retired = 1 THEN 0 ELSE unempl END AS unempl,
+            CASE WHEN retired = 1 THEN 1 ELSE outlf END AS outlf,
+            CASE WHEN retired = 1 THEN 0 ELSE inlf END AS inlf
+        )
+    FROM retired
+)
+SELECT
+    *,
+    MAX(
+        CASE WHEN (eclwrk1 IN (3, 4, 5) OR eclwrk2 IN (3, 4, 5)) AND empl = 1
+            THEN 1 END
+    ) OVER (PARTITION BY indid) AS ind_gov
+FROM modified
+"""
+
+# -? step 5. mark spells of interest
+SQL_STEP5 = """
+CREATE OR REPLACE TABLE s5 AS
+WITH disc AS (
+    SELECT
+        *,
+        CASE WHEN LEAD(ym) OVER w_ind <> ym + INTERVAL 1 MONTH
+            THEN 1 ELSE 0 END AS disc_spell
+    FROM s4
+    WINDOW w_ind AS (PARTITION BY indid ORDER BY ym)
+),
+cont AS (
+    SELECT
+        *,
+        SUM(disc_spell) OVER (
+            PARTITION BY indid ORDER BY ym ROWS UNBOUNDED PRECEDING
+        ) + 1 - disc_spell AS cont_spell_no
+    FROM disc
+)
+SELECT
+    *,
+    COUNT(*) OVER (PARTITION BY indid, cont_spell_no) AS len_cont_spell
+FROM cont
+"""
+
+# -? step 6. construct different types of EUE spell
+SQL_STEP6 = """
+CREATE OR REPLACE TABLE s6 AS
+WITH marks AS (
+    SELECT
+        *,
+        CASE WHEN LAG(empl) OVER w_cell = 1 AND empl = 0
+            THEN 1 ELSE 0 END AS start_of_ubar,
+        CASE WHEN LEAD(empl) OVER w_cell = 1 AND empl = 0
+            THEN 1 ELSE 0 END AS end_of_ubar,
+        CASE WHEN empl = 0 AND COALESCE(LAG(empl) OVER w_cell, 1) <> 0
+            THEN 1 ELSE 0 END AS new_run
+    FROM s5
+    WINDOW w_cell AS (PARTITION BY indid, cont_spell_no ORDER BY ym)
+),
+-- &? Runs of non-employed months are numbered in (indid, ym) order, which is
+-- &? the ngroup() numbering of (indid, cont_spell_no, temp_period_id): the
+-- &? runs of the individuals before, plus the runs so far of the individual,
+-- &? so that no window spans the whole panel.
+offsets AS (
+    SELECT
+        indid,
+        COALESCE(
+            SUM(SUM(new_run)) OVER (
+                ORDER BY indid
+                ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            ),
+            0
+        ) AS run_offset
+    FROM marks
+    GROUP BY indid
+),
+runs AS (
+    SELECT
+        * EXCLUDE (new_run, run_offset),
+        CASE WHEN empl = 0 THEN run_offset + SUM(new_run) OVER (
+            PARTITION BY indid ORDER BY ym ROWS UNBOUNDED PRECEDING
+        ) END AS run_no
+    FROM marks
+    JOIN offsets USING (indid)
+),
+ubar AS (
+    SELECT
+        * EXCLUDE (run_no),
+        CASE
+            WHEN MAX(start_of_ubar) OVER w_run = 0
+                OR MAX(end_of_ubar) OVER w_run = 0
+            THEN NULL
+            ELSE run_no
+        END AS ubar_spell_no
+    FROM runs
+    WINDOW w_run AS (PARTITION BY indid, run_no)
+),
+ubar_len AS (
+    SELECT
+        *,
+        CASE WHEN ubar_spell_no IS NOT NULL
+            THEN COUNT(*) OVER (PARTITION BY indid, ubar_spell_no) END
+            AS len_ubar_spell,
+        MAX(unempl) OVER w_spell AS spellmax_unempl,
+        SUM(unempl) OVER w_spell AS spellsum_unempl
+    FROM ubar
+    WINDOW w_spell AS (PARTITION BY indid, ubar_spell_no)
+),
+ustar AS (
+    SELECT
+        * EXCLUDE (spellmax_unempl, spellsum_unempl),
+        CASE WHEN spellmax_unempl = 0 THEN NULL ELSE ubar_spell_no END
+            AS ustar_spell_no,
+        CASE WHEN spellsum_unempl = len_ubar_spell THEN ubar_spell_no END
+            AS u_spell_no
+    FROM ubar_len
+)
+SELECT
+    *,
+    CASE WHEN ustar_spell_no IS NOT NULL
+        THEN COUNT(*) OVER (PARTITION BY indid, ustar_spell_no) END
+        AS len_ustar_spell,
+    CASE WHEN u_spell_no IS NOT NULL
+        THEN COUNT(*) OVER (PARTITION BY indid, u_spell_no) END
+        AS len_u_spell
+FROM ustar
+"""
+
+# -? step 7. process vars_occ
+SQL_STEP7 = """
+CREATE OR REPLACE TABLE s7 AS
+WITH dates AS (
+    SELECT
+        * REPLACE (
+            try_strptime(CAST(tsjdate1 AS VARCHAR), '%Y%m%d') AS tsjdate1,
+            try_strptime(CAST(tsjdate2 AS VARCHAR), '%Y%m%d') AS tsjdate2,
+            try_strptime(CAST(tejdate1 AS VARCHAR), '%Y%m%d') AS tejdate1,
+            try_strptime(CAST(tejdate2 AS VARCHAR), '%Y%m%d') AS tejdate2
+        )
+    FROM s6
+),
+-- !! Case 1. One firm id is missing while the other is not.
+firm_1 AS (
+    SELECT
+        *,
+        CASE
+            WHEN eeno1 <> -1 AND eeno2 = -1 AND empl = 1 THEN eeno1
+            WHEN eeno1 = -1 AND eeno2 <> -1 AND empl = 1 THEN eeno2
+        END::BIGINT AS firmid_1
+    FROM dates
+),
+-- !! Case 2. Both firm ids are nonmissing, pick the more reasonable dates.
+firm_2 AS (
+    SELECT
+        * EXCLUDE (firmid_1),
+        CASE
+            WHEN eeno1 <> -1 AND eeno2 <> -1
+                AND tsjdate2 <= ym + INTERVAL 14 DAY
+                AND tejdate2 >= ym + INTERVAL 21 DAY
+                AND (tsjdate1 > ym + INTERVAL 14 DAY
+                    OR tejdate1 < ym + INTERVAL 7 DAY)
+                THEN eeno2
+            WHEN eeno1 <> -1 AND eeno2 <> -1
+                AND tsjdate1 <= ym + INTERVAL 14 DAY
+                AND tejdate1 >= ym + INTERVAL 21 DAY
+                AND (tsjdate2 > ym + INTERVAL 14 DAY
+                    OR tejdate2 < ym + INTERVAL 7 DAY)
+                THEN eeno1
+            ELSE firmid_1
+        END::BIGINT AS firmid_2
+    FROM firm_1
+),
+-- !! Case 3. Both firm ids are nonmissing, pick one that has longer hours.
+firm_3 AS (
+    SELECT
+        * EXCLUDE (firmid_2),
+        CASE
+            WHEN eeno1 <> -1 AND eeno2 <> -1 AND empl = 1
+                AND firmid_2 IS NULL
+                AND ejbhrs1 <> -1 AND ejbhrs2 <> -1 AND ejbhrs1 > ejbhrs2
+                THEN eeno1
+            WHEN eeno1 <> -1 AND eeno2 <> -1 AND empl = 1
+                AND firmid_2 IS NULL
+                AND ejbhrs1 <> -1 AND ejbhrs2 <> -1 AND ejbhrs2 > ejbhrs1
+                THEN eeno2
+            ELSE firmid_2
+        END::BIGINT AS firmid_3
+    FROM firm_2
+),
+-- !! Case 4. Both firm ids are nonmissing, pick one that has higher wages.
+firm AS (
+    SELECT
+        * EXCLUDE (firmid_3),
+        CASE
+            WHEN eeno1 <> -1 AND eeno2 <> -1 AND empl = 1
+                AND firmid_3 IS NULL AND tpmsum1 >= tpmsum2
+                THEN eeno1
+            WHEN eeno1 <> -1 AND eeno2 <> -1 AND empl = 1
+                AND firmid_3 IS NULL AND tpmsum2 > tpmsum1
+                THEN eeno2
+            ELSE firmid_3
+        END::BIGINT AS firmid
+    FROM firm_3
+)
+SELECT
+    *,
+    CASE
+        WHEN firmid = eeno2 AND ajbocc2 = 0 THEN tjbocc2
+        WHEN firmid = eeno1 AND ajbocc1 = 0 THEN tjbocc1
+    END::BIGINT AS occ_raw
+FROM firm
+"""
+
+# -? s-7-3 and s-7-4. source and destination occupations, looked up over
+# -? (indid, ym) and spread to the whole spell
+SQL_STEP7_OCC = """
+CREATE OR REPLACE TABLE s7_occ AS
+-- &? Each E(UBAR)E spell has one first and one last month: its source
+-- &? occupation is "occ_raw" in the month before the first, and its
+-- &? destination occupation "occ_raw" in the month after the last. Both are
+-- &? looked up once per spell, and joined to all months of the spell.
+WITH spells AS (
+    SELECT
+        indid,
+        ubar_spell_no,
+        MIN(CASE WHEN start_of_ubar = 1 THEN ym END) - INTERVAL 1 MONTH
+            AS last_empl_month,
+        MAX(CASE WHEN end_of_ubar = 1 THEN ym END) + INTERVAL 1 MONTH
+            AS next_empl_month
+    FROM s7
+    WHERE ubar_spell_no IS NOT NULL
+    GROUP BY indid, ubar_spell_no
+),
+spell_occ AS (
+    SELECT
+        spells.indid,
+        spells.ubar_spell_no,
+        lst.occ_raw::BIGINT AS source_occ_raw,
+        nxt.occ_raw::BIGINT AS destination_occ_raw
+    FROM spells
+    LEFT JOIN (SELECT indid, ym, occ_raw FROM s7) AS lst
+        ON lst.indid = spells.indid AND lst.ym = spells.last_empl_month
+    LEFT JOIN (SELECT indid, ym, occ_raw FROM s7) AS nxt
+        ON nxt.indid = spells.indid AND nxt.ym = spells.next_empl_month
+)
+SELECT
+    s7.*,
+    spell_occ.source_occ_raw,
+    spell_occ.destination_occ_raw
+FROM s7
+LEFT JOIN spell_occ USING (indid, ubar_spell_no)
+"""
+
+# -? step 8 and step x. normalize weights and redefine spell ids
+SQL_OUTPUT = """
+SELECT {cols_out}
+FROM (
+    SELECT
+        * REPLACE (
+            ubar_spell_no + {panel} * 100000 AS ubar_spell_no,
+            ustar_spell_no + {panel} * 100000 AS ustar_spell_no,
+            u_spell_no + {panel} * 100000 AS u_spell_no
+        ),
+        wpfinwgt / sum_weights AS pweights
+    FROM s7_occ, (SELECT SUM(wpfinwgt) AS sum_weights FROM s7_occ)
+)
+ORDER BY indid, ym
+"""
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? Code Block 2. Cleaning Procedures (duckdb backend)
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def SIPP_cleaning_duckdb(
+    panel: int,
+    database: str = None,
+    memory_limit: str = None,
+    threads: int = None,
+    keep_database: bool = False,
+    sample: tuple = None,
+    columns: list = None,
+    chunk_vectors: int = 64,
+) -> pd.DataFrame:
+    """
+    This function implements all data cleaning procedures as SQL in an embedded
+    DuckDB database file, taking SIPP panel year as an argument, and returns
+    the cleaned person-month DataFrame (before exporting).
+
+    database is the path of the database file (scratch/sipp`panel'.duckdb by
+    default); memory_limit (e.g. "8GB") and threads cap DuckDB's resources,
+    and DuckDB spills to a ".tmp" folder next to the database file beyond
+    memory_limit. The database file is removed at the end unless keep_database
+    is True, and the spill folder always. With sample=(fraction, seed), only
+    a subsample of persons is loaded (see sample_mask in codes/util/waves.py).
+    With columns, a subset of the output columns, only the raw variables
+    needed for them are loaded (see raw_columns in codes/util/schema.py).
+    The result is fetched chunk_vectors vectors (of 2048 rows) at a time,
+    so DuckDB never materializes it in memory next to the DataFrame.
+    """
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 0. import necessary packages and open the database
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    from util.paths import scratch
+
+    if database is None:
+        database = scratch(f"sipp{panel}.duckdb")
+    if os.path.exists(database):
+        os.remove(database)
+
+    con = duckdb.connect(database)
+    try:
+        temp = _clean_in_database(
+            con,
+            database,
+            panel,
+            memory_limit,
+            threads,
+            sample,
+            columns,
+            chunk_vectors,
+        )
+    finally:
+        con.close()
+        shutil.rmtree(f"{database}.tmp", ignore_errors=True)
+        if not keep_database:
+            for path in [database, f"{database}.wal"]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    return temp
+
+
+def _clean_in_database(
+    con,
+    database: str,
+    panel: int,
+    memory_limit: str,
+    threads: int,
+    sample: tuple,
+    columns: list,
+    chunk_vectors: int,
+) -> pd.DataFrame:
+    """
+    This function runs the cleaning procedures of SIPP_cleaning_duckdb on an
+    open connection to the database file.
+    """
+
+    from util.schema import output_columns, raw_columns
+    from util.waves import iter_wave, wave_files
+
+    con.execute(f"SET temp_directory = '{database}.tmp'")
+    # &? Every step orders its rows explicitly (rowid, or indid and ym), so
+    # &? DuckDB need not keep the insertion order, which holds rows in memory.
+    con.execute("SET preserve_insertion_order = false")
+    if memory_limit is not None:
+        con.execute(f"SET memory_limit = '{memory_limit}'")
+    if threads is not None:
+        con.execute(f"SET threads = {int(threads)}")
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 1. load waves one at a time into the database
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    # &? rowid keeps the stacking order of waves, which defines "occurrence".
+    # &? Redesigned files are loaded chunk by chunk (see iter_wave).
+    offset = 0
+    for path in wave_files(panel):
+        for wave in iter_wave(path, raw_columns(columns), sample):
+            wave["rowid"] = range(offset, offset + len(wave))
+
+            con.register("wave", wave)
+            if offset == 0:
+                con.execute(
+                    "CREATE OR REPLACE TABLE raw AS SELECT * FROM wave"
+                )
+            else:
+                con.execute("INSERT INTO raw SELECT * FROM wave")
+            con.unregister("wave")
+            offset += len(wave)
+            del wave
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 2 to step x. cleaning procedures
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    con.execute(SQL_STEP2.format(panel=panel))
+    con.execute("DROP TABLE raw")
+    for step, sql in [
+        ("s2", SQL_STEP3),
+        ("s3", SQL_STEP4),
+        ("s4", SQL_STEP5),
+        ("s5", SQL_STEP6),
+        ("s6", SQL_STEP7),
+        ("s7", SQL_STEP7_OCC),
+    ]:
+        con.execute(sql)
+        con.execute(f"DROP TABLE {step}")
+
+    cols_out = output_columns if columns is None else columns
+    output = con.execute(
+        SQL_OUTPUT.format(panel=panel, cols_out=", ".join(cols_out))
+    )
+    integer_cols = [
+        name
+        for name, dtype, *_ in output.description
+        if str(dtype) in ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT")
+    ]
+    # &? the last chunk fetched is empty (the only one if no rows are left)
+    chunks = [output.fetch_df_chunk(chunk_vectors)]
+    while len(chunks[-1]):
+        chunks.append(output.fetch_df_chunk(chunk_vectors))
+    temp = pd.concat(chunks[:-1] or chunks, axis=0, ignore_index=True)
+    del chunks
+
+    # &? Integer columns with missing values come back as float64; use the
+    # &? nullable Int64 dtype as pandas does.
+    for col in integer_cols:
+        if temp[col].dtype == "float64":
+            temp[col] = temp[col].astype("Int64")
+
+    return temp
@@ -0,0 +1,547 @@
+#! python3
+
+"""
+This file implements the cleaning procedures of the SIPP_cleaning function in
+"aSIPP.py" with Polars LazyFrames.
+
+All steps (ingestion, sample restrictions, monthly employment status, spells of
+interest, source and destination occupations, weights) are expressed as one
+lazy query, which Polars optimizes and executes with multiple threads when it
+is collected. Each step mirrors the corresponding step of the pandas backend,
+and the resulting DataFrame is identical to the output of SIPP_cleaning_pandas
+(columns are put in order once at export, see codes/util/schema.py).
+
+Usage:
+    SIPP_cleaning(codes_path, panel, backend="polars")
+
+Wang Wenzhi
+Time: 2024-10-19
+"""
+
+import pandas as pd
+import polars as pl
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? Code Block 1. Helper Functions
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def _months(n: int) -> str:
+    """
+    This function returns the Polars duration string of n calendar months.
+    """
+
+    return f"{n}mo"
+
+
+def _to_pandas(df: pl.DataFrame) -> pd.DataFrame:
+    """
+    This function converts the collected DataFrame to pandas, using nullable
+    Int64 columns for integer columns with missing values (as pandas does).
+    """
+
+    out = df.to_pandas()
+    for col, dtype in df.schema.items():
+        if dtype.is_integer() and df[col].null_count() > 0:
+            out[col] = out[col].astype("Int64")
+
+    return out
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? Code Block 2. Cleaning Procedures (polars backend)
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def SIPP_cleaning_polars(panel: int, sample: tuple = None) -> pd.DataFrame:
+    """
+    This function implements all data cleaning procedures as one Polars lazy
+    query, taking SIPP panel year as an argument, and returns the cleaned
+    person-month DataFrame (before exporting) as a pandas DataFrame. With
+    sample=(fraction, seed), only a subsample of persons is read (see
+    sample_mask in codes/util/waves.py).
+    """
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 0. import necessary packages
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    from util.waves import read_wave, wave_files, vars_all
+
+    ym = pl.col("ym")
+    indid = pl.col("indid")
+    empl = pl.col("empl")
+    not_job_all_month = ~pl.col("rmesr").is_in([1, 2, 3])
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 1. load the full dataset and remain only relevant variables
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    # &? Polars cannot read dta files, so each wave is read by pandas (with
+    # &? column projection) and handed over to the lazy query.
+    lf = pl.concat(
+        [
+            pl.from_pandas(read_wave(path, vars_all, sample))
+            for path in wave_files(panel)
+        ],
+        how="vertical_relaxed",
+    ).lazy()
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 2. process vars_id
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    lf = lf.with_columns(
+        pl.lit(panel, dtype=pl.Int64).alias("panel"),
+        pl.concat_str([pl.lit(str(panel)), pl.col("lgtkey")])
+        .cast(pl.Int64)
+        .alias("indid"),
+    )
+    lf = lf.rename({"rhcalmn": "month", "rhcalyr": "year"})
+    lf = lf.with_columns(
+        pl.datetime(pl.col("year"), pl.col("month"), 1).alias("ym"),
+        (pl.int_range(pl.len(), dtype=pl.Int64).over("indid") + 1).alias(
+            "occurrence"
+        ),
+    )
+
+    lf = lf.sort(["indid", "ym"])
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 3. process vars_demogr and do sample restrictions
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    # impt drop observations with ambiguous interview status
+    lf = lf.filter(pl.col("eppintvw").is_in([1, 2]))
+
+    # impt: drop individuals who have ever been self-employed
+    lf = lf.with_columns(
+        pl.when(
+            (pl.col("ebuscntr") >= 1)
+            | (pl.col("ebno1") != -1)
+            | (pl.col("ebno2") != -1)
+        )
+        .then(1)
+        .otherwise(0)
+        .cast(pl.Int64)
+        .alias("selfemp")
+    )
+    lf = lf.with_columns(
+        pl.col("selfemp").max().over("indid").alias("ind_selfemp")
+    )
+    lf = lf.filter(pl.col("ind_selfemp") == 0)
+
+    # impt: drop observations who are too young or too old at interview
+    lf = lf.with_columns((pl.col("year") - pl.col("tbyear")).alias("age"))
+    lf = lf.filter(pl.col("age").is_between(18, 65))
+
+    # impt: drop observations who have been in the armed force
+    lf = lf.with_columns(
+        pl.when(pl.col("eafever") == -1)
+        .then(-1)
+        .when(pl.col("eafever") == 1)
+        .then(1)
+        .when(pl.col("eafever") == 2)
+        .then(0)
+        .cast(pl.Int64)
+        .alias("armed")
+    )
+    lf = lf.with_columns(pl.col("armed").max().over("indid").alias("ind_armed"))
+    lf = lf.filter(pl.col("ind_armed") == 0)
+
+    eeducate = pl.col("eeducate")
+    lf = lf.with_columns(
+        pl.when(eeducate == -1)
+        .then(-1)
+        .when(eeducate.is_between(31, 38))
+        .then(1)
+        .when(eeducate == 39)
+        .then(2)
+        .when(eeducate.is_between(40, 43))
+        .then(3)
+        .when(eeducate == 44)
+        .then(4)
+        .when(eeducate.is_between(45, 47))
+        .then(5)
+        .cast(pl.Int64)
+        .alias("edu"),
+        pl.when(pl.col("erace") == 1)
+        .then(1)
+        .when(pl.col("erace") == 2)
+        .then(2)
+        .when(pl.col("erace").is_in([3, 4]))
+        .then(3)
+        .cast(pl.Int64)
+        .alias("race"),
+        pl.when(pl.col("esex") == 1)
+        .then(1)
+        .when(pl.col("esex") == 2)
+        .then(0)
+        .cast(pl.Int64)
+        .alias("male"),
+    )
+
+    lf = lf.drop(
+        [
+            "esex",
+            "eeducate",
+            "eafnow",
+            "eafever",
+            "erace",
+            "ebuscntr",
+            "ebno1",
+            "ebno2",
+        ]
+    )
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 4. process vars_emp
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    # -? s-4-1. employment status (based on monthly variables)
+    # -? s-4-2-1. employment (based on monthly and weekly variables)
+    lf = lf.with_columns(
+        pl.col("rmesr").is_in([1, 2, 3, 4, 5]).cast(pl.Int64).alias("mn_empl"),
+        pl.col("rmesr").is_in([6, 7]).cast(pl.Int64).alias("mn_unempl"),
+        (pl.col("rmesr") == 8).cast(pl.Int64).alias("mn_outlf"),
+        (pl.col("rmesr").is_in([1, 2, 3]) | pl.col("rwkesr2").is_in([1, 2, 3]))
+        .cast(pl.Int64)
+        .alias("empl"),
+    )
+    lf = lf.with_columns(
+        pl.col(["rmesr", "rwkesr1", "rwkesr2", "rwkesr3", "rwkesr4", "rwkesr5"])
+        .cast(pl.Int64)
+    )
+
+    # -? s-4-2-2. unemployment
+    # &? Last- and next-occurrence values are plain shifts over the sorted frame
+    # &? (not within indid), exactly as in the pandas backend.
+    lst_wk_looking = (
+        (pl.col("rwkesr2").shift(1) == 4)
+        | (pl.col("rwkesr3").shift(1) == 4)
+        | (pl.col("rwkesr4").shift(1) == 4)
+        | (pl.col("rwkesr5").shift(1) == 4)
+    )
+    case_1 = not_job_all_month & (pl.col("rwkesr2") == 4)
+    case_2 = (
+        not_job_all_month
+        & (pl.col("rwkesr2") == 5)
+        & (pl.col("rwkesr1") == 4)
+    )
+    case_3 = (
+        (ym.dt.offset_by(_months(-1)) == ym.shift(1))
+        & (indid == indid.shift(1))
+        & not_job_all_month
+        & (pl.col("rwkesr2") == 5)
+        & lst_wk_looking
+    )
+    case_4 = (
+        (indid == indid.shift(-1))
+        & (indid != indid.shift(1))
+        & (ym.dt.offset_by(_months(1)) == ym.shift(-1))
+        & (ym != ym.shift(1).dt.offset_by(_months(1)))
+        & not_job_all_month
+        & (pl.col("rwkesr2") == 5)
+        & (empl.shift(-1) == 1)
+    )
+    lf = lf.with_columns(
+        pl.when(case_1 | case_2 | case_3 | case_4)
+        .then(1)
+        .otherwise(0)
+        .cast(pl.Int64)
+        .alias("unempl")
+    )
+
+    # -? s-4-2-3. out of and in the labor force
+    lf = lf.with_columns(
+        ((empl == 0) & (pl.col("unempl") == 0)).cast(pl.Int64).alias("outlf"),
+        ((empl == 1) | (pl.col("unempl") == 1)).cast(pl.Int64).alias("inlf"),
+    )
+
+    # -? s-4-2-5. retirement
+    # &? Case 2 of the pandas backend, written there as
+    # &? (ersend1 == 2) | ersend2 == 2, evaluates to ((...) | ersend2) == 2 and
+    # &? never holds, so only Case 1 and Case 3 contribute here.
+    lf = lf.with_columns(
+        ((pl.col("ersnowrk") == 4) & (pl.col("outlf") == 1))
+        .cast(pl.Int64)
+        .alias("retired")
+    )
+    lf = lf.with_columns(
+        pl.when(
+            ym >= ym.filter(pl.col("retired") == 1).min().over("indid")
+        )
+        .then(1)
+        .otherwise(pl.col("retired"))
+        .alias("retired")
+    )
+    retired = pl.col("retired") == 1
+    lf = lf.with_columns(
+        pl.when(retired).then(0).otherwise(empl).alias("empl"),
+        pl.when(retired).then(0).otherwise(pl.col("unempl")).alias("unempl"),
+        pl.when(retired).then(1).otherwise(pl.col("outlf")).alias("outlf"),
+        pl.when(retired).then(0).otherwise(pl.col("inlf")).alias("inlf"),
+    )
+
+    # -? s-4-3. government employees
+    lf = lf.with_columns(
+        pl.when(
+            (pl.col("eclwrk1").is_in([3, 4, 5]) | pl.col("eclwrk2").is_in([3, 4, 5]))
+            & (empl == 1)
+        )
+        .then(1)
+        .cast(pl.Int64)
+        .max()
+        .over("indid")
+        .alias("ind_gov")
+    )
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 5. mark spells of interest
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    lf = lf.with_columns(
+        pl.when(
+            (indid.shift(-1) == indid)
+            & (ym.shift(-1).over("indid") != ym.dt.offset_by(_months(1)))
+        )
+        .then(1)
+        .otherwise(0)
+        .cast(pl.Int64)
+        .alias("disc_spell")
+    )
+    lf = lf.with_columns(
+        (
+            pl.col("disc_spell").cum_sum().over("indid")
+            + 1
+            - pl.col("disc_spell")
+        ).alias("cont_spell_no")
+    )
+    lf = lf.with_columns(
+        pl.len()
+        .over(["indid", "cont_spell_no"])
+        .cast(pl.Int64)
+        .alias("len_cont_spell")
+    )
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 6. construct different types of EUE spell
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    cell = ["indid", "cont_spell_no"]
+
+    # -? s-6-1. e_to_ubar and ubar_to_e under ubar (generalized unemployment)
+    lf = lf.with_columns(
+        ((empl.shift(1).over(cell) == 1) & (empl == 0))
+        .fill_null(False)
+        .cast(pl.Int64)
+        .alias("start_of_ubar"),
+        ((empl.shift(-1).over(cell) == 1) & (empl == 0))
+        .fill_null(False)
+        .cast(pl.Int64)
+        .alias("end_of_ubar"),
+    )
+
+    # -? s-6-2. give id to continuous unemployment spells ("ubar_spell_no")
+    # &? Rows are sorted by (indid, ym), so the groups of (indid, cont_spell_no,
+    # &? temp_period_id) are consecutive runs of non-employed months, and the
+    # &? pandas ngroup() numbering is the running count of such runs.
+    lf = lf.with_columns(
+        (pl.col("start_of_ubar").cum_sum().over(cell) + 1).alias(
+            "temp_period_id"
+        )
+    )
+    new_run = (empl == 0) & (
+        (empl.shift(1) != 0)
+        | (indid.shift(1) != indid)
+        | (pl.col("cont_spell_no").shift(1) != pl.col("cont_spell_no"))
+        | (pl.col("temp_period_id").shift(1) != pl.col("temp_period_id"))
+    ).fill_null(True)
+    lf = lf.with_columns(
+        pl.when(empl == 0)
+        .then(new_run.cast(pl.Int64).cum_sum())
+        .alias("ubar_spell_no")
+    )
+
+    # -? s-6-3. modify "ubar_spell_no" - non-missing only for E(UBAR)E spells
+    ubar = pl.col("ubar_spell_no")
+    lf = lf.with_columns(
+        pl.when(
+            (pl.col("start_of_ubar").max().over("ubar_spell_no") == 0)
+            | (pl.col("end_of_ubar").max().over("ubar_spell_no") == 0)
+        )
+        .then(None)
+        .otherwise(ubar)
+        .alias("ubar_spell_no")
+    )
+    lf = lf.with_columns(
+        pl.when(ubar.is_not_null())
+        .then(pl.len().over("ubar_spell_no"))
+        .cast(pl.Int64)
+        .alias("len_ubar_spell")
+    )
+
+    # -? s-6-4. identify E(USTAR)E spells
+    lf = lf.with_columns(
+        pl.when(pl.col("unempl").max().over("ubar_spell_no") == 0)
+        .then(None)
+        .otherwise(ubar)
+        .alias("ustar_spell_no")
+    )
+    lf = lf.with_columns(
+        pl.when(pl.col("ustar_spell_no").is_not_null())
+        .then(pl.len().over("ustar_spell_no"))
+        .cast(pl.Int64)
+        .alias("len_ustar_spell")
+    )
+
+    # -? s-6-4. identify E(U)E spells
+    lf = lf.with_columns(
+        pl.when(
+            pl.col("unempl").sum().over("ubar_spell_no")
+            == pl.col("len_ubar_spell")
+        )
+        .then(ubar)
+        .alias("u_spell_no")
+    )
+    lf = lf.with_columns(
+        pl.when(pl.col("u_spell_no").is_not_null())
+        .then(pl.len().over("u_spell_no"))
+        .cast(pl.Int64)
+        .alias("len_u_spell")
+    )
+
+    lf = lf.drop(["temp_period_id"])
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 7. process vars_occ
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    # -? s-7-1. firm id
+    eeno1, eeno2 = pl.col("eeno1"), pl.col("eeno2")
+    firmid = pl.col("firmid")
+    both_ids = (eeno1 != -1) & (eeno2 != -1)
+
+    lf = lf.with_columns(
+        pl.col(["tsjdate1", "tsjdate2", "tejdate1", "tejdate2"])
+        .cast(pl.Utf8)
+        .str.strptime(pl.Datetime("us"), "%Y%m%d", strict=False)
+    )
+
+    # !! Case 1. One firm id is missing while the other is not.
+    lf = lf.with_columns(
+        pl.when((eeno1 != -1) & (eeno2 == -1) & (empl == 1))
+        .then(eeno1)
+        .when((eeno1 == -1) & (eeno2 != -1) & (empl == 1))
+        .then(eeno2)
+        .cast(pl.Int64)
+        .alias("firmid")
+    )
+
+    # !! Case 2. Both firm ids are nonmissing, pick the more reasonable dates.
+    mid_month = ym.dt.offset_by("14d")
+    cond_date_1 = (
+        both_ids
+        & (pl.col("tsjdate1") <= mid_month)
+        & (pl.col("tejdate1") >= ym.dt.offset_by("21d"))
+        & (
+            (pl.col("tsjdate2") > mid_month)
+            | (pl.col("tejdate2") < ym.dt.offset_by("7d"))
+        )
+    )
+    cond_date_2 = (
+        both_ids
+        & (pl.col("tsjdate2") <= mid_month)
+        & (pl.col("tejdate2") >= ym.dt.offset_by("21d"))
+        & (
+            (pl.col("tsjdate1") > mid_month)
+            | (pl.col("tejdate1") < ym.dt.offset_by("7d"))
+        )
+    )
+    lf = lf.with_columns(
+        pl.when(cond_date_2)
+        .then(eeno2)
+        .when(cond_date_1)
+        .then(eeno1)
+        .otherwise(firmid)
+        .cast(pl.Int64)
+        .alias("firmid")
+    )
+
+    # !! Case 3 and 4. Both firm ids are nonmissing, pick the one with longer
+    # !! hours, and otherwise the one with higher wages.
+    open_case = both_ids & (empl == 1) & firmid.is_null()
+    valid_hrs = (pl.col("ejbhrs1") != -1) & (pl.col("ejbhrs2") != -1)
+    lf = lf.with_columns(
+        pl.when(open_case & valid_hrs & (pl.col("ejbhrs1") > pl.col("ejbhrs2")))
+        .then(eeno1)
+        .when(open_case & valid_hrs & (pl.col("ejbhrs2") > pl.col("ejbhrs1")))
+        .then(eeno2)
+        .otherwise(firmid)
+        .cast(pl.Int64)
+        .alias("firmid")
+    )
+    lf = lf.with_columns(
+        pl.when(open_case & (pl.col("tpmsum1") >= pl.col("tpmsum2")))
+        .then(eeno1)
+        .when(open_case & (pl.col("tpmsum2") > pl.col("tpmsum1")))
+        .then(eeno2)
+        .otherwise(firmid)
+        .cast(pl.Int64)
+        .alias("firmid")
+    )
+
+    # -? s-7-2. raw occupation code (the main job)
+    lf = lf.with_columns(
+        pl.when((firmid == eeno2) & (pl.col("ajbocc2") == 0))
+        .then(pl.col("tjbocc2"))
+        .when((firmid == eeno1) & (pl.col("ajbocc1") == 0))
+        .then(pl.col("tjbocc1"))
+        .cast(pl.Int64)
+        .alias("occ_raw")
+    )
+
+    # -? s-7-3. obtain source and destination occupations
+    # &? Inside an (indid, cont_spell_no) cell months are consecutive, so the
+    # &? last employed month of a start_of_ubar month is the previous row, and
+    # &? the next employed month of an end_of_ubar month is the next row.
+    occ_raw = pl.col("occ_raw")
+    lf = lf.with_columns(
+        pl.when((pl.col("start_of_ubar") == 1) & ubar.is_not_null())
+        .then(occ_raw.shift(1).over("indid"))
+        .alias("source_occ_raw"),
+        pl.when((pl.col("end_of_ubar") == 1) & ubar.is_not_null())
+        .then(occ_raw.shift(-1).over("indid"))
+        .alias("destination_occ_raw"),
+    )
+
+    # -? s-7-4. spell-level source and destination occupations
+    lf = lf.with_columns(
+        pl.coalesce(
+            pl.col(var),
+            pl.when(ubar.is_not_null()).then(
+                pl.col(var).mean().over("ubar_spell_no")
+            ),
+        )
+        .cast(pl.Int64)
+        .alias(var)
+        for var in ["source_occ_raw", "destination_occ_raw"]
+    )
+
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step 8. normalize weights
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    lf = lf.with_columns(
+        pl.col("wpfinwgt").sum().over("panel").alias("sum_weights")
+    )
+    lf = lf.with_columns(
+        (pl.col("wpfinwgt") / pl.col("sum_weights")).alias("pweights")
+    )
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+    # ?? step x. redefine un/non-employment spell id
+    # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+    lf = lf.with_columns(
+        pl.col(["ubar_spell_no", "ustar_spell_no", "u_spell_no"])
+        + panel * 100000
+    )
+
+    return _to_pandas(lf.collect())
@@ -0,0 +1,113 @@
+#! python3
+
+"""
+This file benchmarks the backends of the SIPP_cleaning function in
+"aSIPP.py": the eager pandas backend (SIPP_cleaning_pandas), the lazy
+Polars backend (SIPP_cleaning_polars in "aSIPPpolars.py"), and the DuckDB
+backend (SIPP_cleaning_duckdb in "aSIPPduckdb.py").
+
+For each panel, every backend runs the full cleaning procedures (from
+reading raw wave files to redefining spell ids), the resulting DataFrames
+are checked to be identical to the pandas one, and the wall-clock times and
+their ratios to the pandas time are printed.
+
+Usage:
+    python benchmark_backends.py
+        the four panels, from the raw wave files in the "rawdata" folder;
+    python benchmark_backends.py synthetic [n_persons]
+        a synthetic panel of n_persons persons (2000 by default) in the
+        layout of the 1996 wave files (see synthetic.py in this folder),
+        written to a temporary folder, so no raw data is needed.
+
+Input:
+    dta files stored in "rawdata" folder (or none, with synthetic).
+Output:
+    printed timings, no files are written (but the temporary folder).
+
+Wang Wenzhi
+Time: 2024-10-19
+"""
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? step 0. import necessary packages and set the data roots
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+codes_path = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+# &? The data roots are read when codes/util/paths.py is imported.
+synthetic = len(sys.argv) > 1 and sys.argv[1] == "synthetic"
+if synthetic:
+    root = tempfile.mkdtemp(prefix="occmob-benchmark-")
+    for folder in ["rawdata", "scratch"]:
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    os.environ["OCCMOB_RAWDATA"] = os.path.join(root, "rawdata")
+    os.environ["OCCMOB_SCRATCH"] = os.path.join(root, "scratch")
+
+sys.path.append(codes_path)
+from clean.aSIPP import SIPP_cleaning_pandas
+from clean.aSIPPduckdb import SIPP_cleaning_duckdb
+from clean.aSIPPpolars import SIPP_cleaning_polars
+from util.schema import apply_schema
+
+import pandas as pd
+
+backends = {
+    "pandas": SIPP_cleaning_pandas,
+    "polars": SIPP_cleaning_polars,
+    "duckdb": SIPP_cleaning_duckdb,
+}
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? step 1. synthetic wave files (with synthetic only)
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+panels = [1996, 2001, 2004, 2008]
+if synthetic:
+    from clean.test.synthetic import synthetic_panel, write_wave
+
+    n_persons = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    for wave, temp in enumerate(synthetic_panel(n_persons), start=1):
+        write_wave(temp, wave)
+    panels = [1996]
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? step 2. run every backend on each panel
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+results = []
+for panel in panels:
+    result = {"panel": panel, "rows": None}
+    for backend, cleaning in backends.items():
+        start = time.perf_counter()
+        temp = cleaning(panel)
+        result[f"{backend} (s)"] = round(time.perf_counter() - start, 2)
+
+        # &? Same rows, same columns, same values (weights up to summation
+        # &? order).
+        temp = apply_schema(temp).reset_index(drop=True)
+        if backend == "pandas":
+            temp_pandas = temp
+            result["rows"] = len(temp)
+        else:
+            pd.testing.assert_frame_equal(temp_pandas, temp, check_dtype=False)
+    for backend in list(backends)[1:]:
+        result[f"pandas / {backend}"] = round(
+            result["pandas (s)"] / result[f"{backend} (s)"], 2
+        )
+    results.append(result)
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? step 3. print the benchmark
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+print(pd.DataFrame(results).to_string(index=False))
+
+if synthetic:
+    shutil.rmtree(root, ignore_errors=True)
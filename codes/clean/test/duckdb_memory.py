@@ -0,0 +1,95 @@
+#! python3
+
+"""
+This file checks that the DuckDB backend of the SIPP_cleaning function in
+"aSIPP.py" (SIPP_cleaning_duckdb in "aSIPPduckdb.py") cleans a panel larger
+than its memory limit, and that the result is identical to the output of the
+pandas backend (SIPP_cleaning_pandas).
+
+The synthetic panel (see synthetic.py in this folder) has n_persons persons
+(60000 by default, about 0.9 million person-months), and the raw waves take
+several times the memory limit given to DuckDB (100MB by default), so the
+intermediate tables are evicted to the database file while the queries run.
+
+Usage:
+    python duckdb_memory.py [n_persons] [memory limit in MB]
+
+Input:
+    none (the synthetic wave files are written to a temporary folder).
+Output:
+    printed sizes and timings; an AssertionError if the raw panel fits in the
+    memory limit or if the backends differ.
+
+Wang Wenzhi
+Time: 2024-10-19
+"""
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? step 0. import necessary packages and set the data roots
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+codes_path = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+# &? The data roots are read when codes/util/paths.py is imported.
+root = tempfile.mkdtemp(prefix="occmob-duckdb-memory-")
+for folder in ["rawdata", "scratch"]:
+    os.makedirs(os.path.join(root, folder), exist_ok=True)
+os.environ["OCCMOB_RAWDATA"] = os.path.join(root, "rawdata")
+os.environ["OCCMOB_SCRATCH"] = os.path.join(root, "scratch")
+
+sys.path.append(codes_path)
+from clean.aSIPP import SIPP_cleaning_pandas
+from clean.aSIPPduckdb import SIPP_cleaning_duckdb
+from clean.test.synthetic import synthetic_panel, write_wave
+from util.schema import apply_schema
+
+import pandas as pd
+
+panel = 1996
+n_persons = int(sys.argv[1]) if len(sys.argv) > 1 else 60000
+limit_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+memory_limit = f"{limit_mb}MB"
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? step 1. synthetic wave files larger than the memory limit
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+raw_bytes = 0
+for wave, temp in enumerate(synthetic_panel(n_persons), start=1):
+    raw_bytes += int(temp.memory_usage(deep=True).sum())
+    write_wave(temp, wave)
+del temp
+
+print(f"raw panel: {raw_bytes / 10**6:.0f}MB, memory limit: {memory_limit}")
+# &? DuckDB counts memory limits in decimal units (1MB = 1000^2 bytes).
+assert raw_bytes > limit_mb * 10**6, "The raw panel fits in the memory limit."
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? step 2. run both backends and compare
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+start = time.perf_counter()
+temp_duckdb = SIPP_cleaning_duckdb(panel, memory_limit=memory_limit, threads=1)
+print(f"duckdb: {time.perf_counter() - start:.1f}s, {len(temp_duckdb)} rows")
+temp_duckdb = apply_schema(temp_duckdb).reset_index(drop=True)
+
+start = time.perf_counter()
+temp_pandas = SIPP_cleaning_pandas(panel)
+print(f"pandas: {time.perf_counter() - start:.1f}s, {len(temp_pandas)} rows")
+temp_pandas = apply_schema(temp_pandas).reset_index(drop=True)
+
+# &? Same rows, same columns, same values (weights up to summation order).
+pd.testing.assert_frame_equal(temp_pandas, temp_duckdb, check_dtype=False)
+print("duckdb: same as pandas")
+
+# &? Nothing is left in the scratch folder (database file and spill folder).
+leftover = os.listdir(os.path.join(root, "scratch"))
+shutil.rmtree(root, ignore_errors=True)
+assert not leftover, f"Files left in the scratch folder: {leftover}"
@@ -0,0 +1,126 @@
+#! python3
+
+"""
+This file checks that the execution modes of the SIPP_cleaning function in
+"aSIPP.py" generate the same temp1996.dta on a small synthetic panel:
+    serial:      SIPP_cleaning (pandas backend, one process),
+    sharded:     n_shards > 1 in a process pool (SIPP_sharded),
+    incremental: incremental=True, run first without the last two waves,
+                 then with all waves, then after a wave file changed
+                 (SIPP_cleaning_incremental),
+    queue:       SIPP_submit, run by several worker processes started by
+                 "python codes/util/workqueue.py <queue folder>".
+The synthetic panel is generated with the layout of the 1996 wave files
+(random labor market histories, job changes, and missing waves, see
+synthetic.py in this folder), so the check needs no raw data and runs in a
+minute.
+
+Input:
+    none (the synthetic wave files are written to a temporary folder).
+Output:
+    printed comparisons; an AssertionError if any mode differs.
+
+Wang Wenzhi
+Time: 2024-10-19
+"""
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? step 0. import necessary packages and set the data roots
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+codes_path = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+# &? The data roots are read when codes/util/paths.py is imported, and the
+# &? workers of the queue mode inherit them from the environment.
+root = tempfile.mkdtemp(prefix="occmob-equivalence-")
+for folder in ["rawdata", "tempdata", "scratch", "queue"]:
+    os.makedirs(os.path.join(root, folder), exist_ok=True)
+os.environ["OCCMOB_RAWDATA"] = os.path.join(root, "rawdata")
+os.environ["OCCMOB_TEMPDATA"] = os.path.join(root, "tempdata")
+os.environ["OCCMOB_SCRATCH"] = os.path.join(root, "scratch")
+
+sys.path.append(codes_path)
+from clean.aSIPP import SIPP_cleaning, SIPP_submit
+from clean.test.synthetic import synthetic_panel, write_wave
+from util.paths import rawdata, tempdata
+
+panel = 1996
+n_waves = 12
+n_persons = 2000
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? step 1. synthetic wave files (see synthetic.py in this folder)
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def read_output() -> pd.DataFrame:
+    return pd.read_stata(
+        tempdata(f"temp{panel}.dta"), convert_categoricals=False
+    )
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? step 2. run each mode and compare with the serial mode
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+if __name__ == "__main__":
+    waves = synthetic_panel(n_persons, n_waves)
+    for wave, temp in enumerate(waves, start=1):
+        write_wave(temp, wave)
+
+    outputs = {}
+
+    # -? serial and sharded modes
+    SIPP_cleaning(codes_path, panel)
+    outputs["serial"] = read_output()
+    SIPP_cleaning(codes_path, panel, n_shards=4, n_workers=2)
+    outputs["sharded"] = read_output()
+
+    # -? incremental mode: two new waves, then one changed wave
+    for wave in [11, 12]:
+        os.remove(rawdata(f"sipp96w{wave}.dta"))
+    SIPP_cleaning(codes_path, panel, incremental=True, rebuild=True)
+    for wave in [11, 12]:
+        write_wave(waves[wave - 1], wave)
+    SIPP_cleaning(codes_path, panel, incremental=True)
+    stat = os.stat(rawdata("sipp96w5.dta"))
+    os.utime(
+        rawdata("sipp96w5.dta"),
+        ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9),
+    )
+    SIPP_cleaning(codes_path, panel, incremental=True)
+    outputs["incremental"] = read_output()
+
+    # -? queue mode: three workers on a queue folder
+    queue_dir = os.path.join(root, "queue")
+    SIPP_submit(codes_path, queue_dir, [panel], n_shards=3)
+    worker_script = os.path.join(codes_path, "util", "workqueue.py")
+    workers = [
+        subprocess.Popen([sys.executable, worker_script, queue_dir])
+        for _ in range(3)
+    ]
+    for worker in workers:
+        worker.wait()
+    outputs["queue"] = read_output()
+
+    # -? same rows, same columns, same values
+    differences = []
+    for mode, temp in outputs.items():
+        try:
+            pd.testing.assert_frame_equal(outputs["serial"], temp)
+            print(f"{mode}: same as serial, {temp.shape}")
+        except AssertionError as error:
+            differences.append(mode)
+            print(f"{mode}: differs from serial\n{error}")
+
+    shutil.rmtree(root, ignore_errors=True)
+    assert not differences, f"Modes differ from serial: {differences}"
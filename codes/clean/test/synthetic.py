@@ -0,0 +1,168 @@
+#! python3
+
+# ?? This script generates synthetic wave files in the layout of the 1996 wave
+# ?? files (rawdata/sipp96w`wave'.dta), so that the cleaning can be checked
+# ?? and timed without the raw data (see equivalence_modes.py and
+# ?? benchmark_backends.py in this folder).
+
+# &? The wave files are written to the rawdata folder of codes/util/paths.py:
+# &? set the data roots (e.g., OCCMOB_RAWDATA) before util.paths is imported.
+
+import numpy as np
+import pandas as pd
+
+
+def synthetic_panel(
+    n_persons: int = 2000, n_waves: int = 12, seed: int = 0
+) -> list:
+    """
+    This function generates the wave files of a synthetic panel in the
+    layout of the 1996 wave files: four reference months per wave, monthly
+    transitions between employment, unemployment, and nonparticipation, up
+    to two jobs, entry and exit in random waves, and about 8% of the persons
+    missing in each wave, for n_persons persons over n_waves waves. It
+    returns one DataFrame per wave.
+    """
+
+    rng = np.random.default_rng(seed)
+    keys = rng.permutation(10**6)[:n_persons]
+    lgtkey = np.array([f"{key:08d}" for key in keys])
+    tbyear = rng.integers(1926, 1981, n_persons)
+    esex = rng.integers(1, 3, n_persons)
+    erace = rng.integers(1, 5, n_persons)
+    eeducate = rng.choice([-1] + list(range(31, 48)), n_persons)
+    eafever = rng.choice([-1, 1, 2], n_persons, p=[0.05, 0.05, 0.9])
+    selfemp = rng.random(n_persons) < 0.05
+    occs = np.array([3, 7, 22, 43, 95, 156, 243, 313, 405, 567, 628, 804, 889])
+
+    # -? states 0: employed, 1: unemployed, 2: out of the labor force
+    transitions = np.array(
+        [[0.95, 0.03, 0.02], [0.3, 0.5, 0.2], [0.3, 0.1, 0.6]]
+    )
+    states = np.zeros((n_persons, 4 * n_waves), dtype=int)
+    state = rng.choice(3, n_persons, p=[0.7, 0.1, 0.2])
+    for month in range(4 * n_waves):
+        states[:, month] = state
+        draws = rng.random(n_persons)[:, None]
+        state = (draws > transitions[state].cumsum(axis=1)).sum(axis=1)
+    jobs = rng.integers(1, 4, states.shape)
+
+    # &? Persons enter and leave the panel in different waves, so that the
+    # &? first month of an individual often follows the last month of the
+    # &? previous individual (case 4 of step 4, across shards).
+    entry = rng.integers(0, n_waves // 2, n_persons)
+    leave = rng.integers(entry + 1, n_waves + 1)
+    wave_ids = np.arange(n_waves)
+    present = (rng.random((n_persons, n_waves)) > 0.08) & (
+        (wave_ids >= entry[:, None]) & (wave_ids < leave[:, None])
+    )
+
+    waves = []
+    for wave in range(n_waves):
+        persons = np.flatnonzero(present[:, wave])
+        n = len(persons)
+        months = []
+        for month in range(4 * wave, 4 * wave + 4):
+            state, job = states[persons, month], jobs[persons, month]
+            year, calmn = 1996 + (month + 2) // 12, (month + 2) % 12 + 1
+            empl = state == 0
+
+            def weekly():
+                return np.where(
+                    empl,
+                    rng.choice([1, 2, 3], n, p=[0.9, 0.05, 0.05]),
+                    np.where(state == 1, rng.choice([4, 5], n), 5),
+                )
+
+            second = empl & (rng.random(n) < 0.1)
+            eeno1 = np.where(empl, job, -1)
+            eeno2 = np.where(second, job + 10, -1)
+            start = np.where(
+                rng.random(n) < 0.7,
+                (year - 1) * 10000 + 101,
+                year * 10000 + calmn * 100 + rng.integers(1, 28, n),
+            )
+            end = np.where(
+                rng.random(n) < 0.8,
+                (year + 1) * 10000 + 1231,
+                year * 10000 + calmn * 100 + rng.integers(1, 28, n),
+            )
+            months.append(
+                pd.DataFrame(
+                    {
+                        "lgtkey": lgtkey[persons],
+                        "rhcalmn": calmn,
+                        "rhcalyr": year,
+                        "swave": wave + 1,
+                        "ssuid": lgtkey[persons],
+                        "eentaid": 11,
+                        "epppnum": 101,
+                        "srotaton": persons % 4 + 1,
+                        "tbyear": tbyear[persons],
+                        "ebmnth": 6,
+                        "esex": esex[persons],
+                        "ems": rng.integers(1, 7, n),
+                        "eeducate": eeducate[persons],
+                        "eafnow": -1,
+                        "eafever": eafever[persons],
+                        "erace": erace[persons],
+                        "ebuscntr": np.where(selfemp[persons], 1, -1),
+                        "ebno1": -1,
+                        "ebno2": -1,
+                        "eppintvw": rng.choice([1, 2], n, p=[0.9, 0.1]),
+                        "rmesr": np.where(
+                            empl,
+                            rng.choice([1, 2, 3, 4, 5], n),
+                            np.where(state == 1, rng.choice([6, 7], n), 8),
+                        ),
+                        "rwkesr1": weekly(),
+                        "rwkesr2": weekly(),
+                        "rwkesr3": weekly(),
+                        "rwkesr4": weekly(),
+                        "rwkesr5": weekly(),
+                        "ersend1": np.where(empl, -1, rng.choice([1, 2], n)),
+                        "ersend2": -1,
+                        "ersnowrk": np.where(state == 2, 1, -1),
+                        "eeno1": eeno1,
+                        "eeno2": eeno2,
+                        "tsjdate1": np.where(empl, start, -1),
+                        "tsjdate2": np.where(second, start, -1),
+                        "tejdate1": np.where(empl, end, -1),
+                        "tejdate2": np.where(second, end, -1),
+                        "ejbhrs1": np.where(
+                            empl, rng.integers(10, 60, n), -1
+                        ),
+                        "ejbhrs2": np.where(second, 20, -1),
+                        "tpmsum1": np.where(empl, rng.random(n) * 5000, 0.0),
+                        "tpmsum2": np.where(second, 1000.0, 0.0),
+                        "eclwrk1": np.where(empl, rng.integers(1, 6, n), -1),
+                        "eclwrk2": np.where(second, 1, -1),
+                        "tjbocc1": np.where(
+                            empl, occs[(job * 7 + persons) % len(occs)], -1
+                        ),
+                        "ajbocc1": 0,
+                        "tjbocc2": np.where(second, occs[0], -1),
+                        "ajbocc2": 0,
+                        "tpearn": rng.random(n) * 3000,
+                        "tptrninc": rng.random(n),
+                        "tptotinc": rng.random(n),
+                        "tpothinc": rng.random(n),
+                        "tpprpinc": rng.random(n),
+                        "wpfinwgt": rng.random(n) * 3000 + 1000,
+                    }
+                )
+            )
+        temp = pd.concat(months, axis=0)
+        temp = temp.sort_values(["ssuid", "rhcalyr", "rhcalmn"], kind="stable")
+        ints = [col for col in temp.columns if temp[col].dtype == "int64"]
+        waves.append(temp.astype({col: "int32" for col in ints}))
+
+    return waves
+
+
+def write_wave(temp: pd.DataFrame, wave: int):
+    from util.paths import rawdata
+
+    temp.to_stata(
+        rawdata(f"sipp96w{wave}.dta"), write_index=False, version=114
+    )
@@ -0,0 +1,374 @@
+#! python3
+
+# ?? This script adapts the person-month files of the redesigned SIPP panels
+# ?? (2014 and 2018) to the raw variables of the 1996-2008 wave files (see
+# ?? codes/util/waves.py), so that the redesigned panels go through the same
+# ?? cleaning procedures.
+
+# &? A redesigned file holds all person-months of a wave (2014: one file per
+# &? annual wave, 2018: one file) and several gigabytes of variables. Files
+# &? are read in chunks of rows, keeping only the source variables of the
+# &? requested columns, and each chunk is mapped, and then either handed on
+# &? (iter_redesign) or stacked with the others (read_redesign).
+
+# &? Source variable names follow the public-use codebooks, and are matched
+# &? regardless of case. The mapping is collected in part 1, so that renamed
+# &? source variables only need to be changed there.
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from util.waves import sample_mask, vars_all
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. mapping of the redesigned variables
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+# -? file names of the redesigned panels (wave in {wave})
+redesign_files = {
+    2014: "pu2014w{wave}.dta",
+    2018: "pu2018.dta",
+}
+
+# -? rows per chunk
+chunk_rows = 250_000
+
+# -? variables renamed as they are (variable: source variable)
+vars_renamed = {
+    "rhcalmn": "monthcode",
+    "swave": "swave",
+    "ssuid": "ssuid",
+    "eentaid": "eresidenceid",
+    "epppnum": "pnum",
+    "tbyear": "tdob_byear",
+    "ebmnth": "edob_bmonth",
+    "esex": "esex",
+    "ems": "ems",
+    "eeducate": "eeduc",
+    "erace": "erace",
+    "rmesr": "rmesr",
+    "rwkesr1": "rwkesr1",
+    "rwkesr2": "rwkesr2",
+    "rwkesr3": "rwkesr3",
+    "rwkesr4": "rwkesr4",
+    "rwkesr5": "rwkesr5",
+    "tpearn": "tpearn",
+    "tptrninc": "tptrninc",
+    "tptotinc": "tptotinc",
+    "tpothinc": "tpothinc",
+    "tpprpinc": "tpprpinc",
+    "wpfinwgt": "wpfinwgt",
+}
+
+# -? job slot variables (variable without slot number: source variable of
+# -? slot {k}); the redesign has up to seven job slots instead of two
+vars_slots = {
+    "eeno": "ejb{k}_jobid",
+    "tsjdate": "ejb{k}_bmonth",
+    "tejdate": "ejb{k}_emonth",
+    "ejbhrs": "tjb{k}_mwkhrs",
+    "tpmsum": "tjb{k}_msum",
+    "eclwrk": "ejb{k}_clwrk",
+    "tjbocc": "tjb{k}_occ",
+    "ajbocc": "ajb{k}_occ",
+    "ersend": "ejb{k}_rsend",
+}
+
+# -? variables not collected in the redesign (variable: constant value)
+# &? Person-month records are only released for interviewed or imputed
+# &? persons (eppintvw == 1); businesses and military service are only known
+# &? through the class of worker of the job slots (ebuscntr and eafever, see
+# &? map_chunk).
+vars_constant = {
+    "srotaton": -1,
+    "eafnow": -1,
+    "eafever": 2,
+    "ebuscntr": -1,
+    "ebno1": -1,
+    "ebno2": -1,
+    "eppintvw": 1,
+    "ersnowrk": -1,
+}
+
+# -? value recodes (variable: {redesign code: wave-file code})
+recodes = {
+    # &? the redesign has no vocational diploma (41 in the wave files): its
+    # &? associate degrees, occupational/vocational (41) and academic (42), are
+    # &? 42 and 43 in the wave files
+    "eeducate": {41: 42, 42: 43, 43: 44, 44: 45, 45: 46, 46: 47},
+    # &? 2: active duty armed forces, 7 and 8: self-employed (see map_chunk)
+    "eclwrk": {1: 5, 2: -1, 3: 4, 4: 3, 5: 1, 6: 2, 7: -1, 8: -1},
+}
+
+clwrk_armed = [2]
+clwrk_selfemp = [7, 8]
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. map and read the redesigned files
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def is_redesign_file(path: str) -> bool:
+    """
+    This function tells whether a raw data file is a person-month file of the
+    redesigned panels, e.g., rawdata/pu2014w1.dta or rawdata/pu2018.dta
+    (or a compressed copy, e.g., rawdata/pu2018.dta.gz or rawdata/pu2018.zip).
+    """
+
+    name = os.path.basename(path).lower()
+    pattern = r"pu\d{4}(w\d+)?\.(dta|dta\.gz|dta\.zst|zip)"
+
+    return re.fullmatch(pattern, name) is not None
+
+
+def source_vars(columns: list, varlist: list) -> list:
+    """
+    This function returns the source variables of a redesigned file (from its
+    varlist) needed for the requested columns, in the order of the file.
+    """
+
+    names = {name.lower(): name for name in varlist}
+    slots = [k for k in range(1, 100) if f"ejb{k}_jobid" in names]
+    year_vars = ["rhcalyr"] if "rhcalyr" in names else ["spanel", "swave"]
+
+    needed = set()
+    for col in columns:
+        if col in vars_renamed:
+            needed.add(vars_renamed[col])
+        elif col == "lgtkey":
+            needed.update(["ssuid", "pnum"])
+        elif col == "rhcalyr":
+            needed.update(year_vars)
+        elif col.rstrip("12") in vars_slots or col in ["ebuscntr", "eafever"]:
+            # &? job slots are selected by "eeno", "eclwrk", "tsjdate", and
+            # &? "tejdate" (see map_chunk)
+            for var in ["eeno", "eclwrk", "tsjdate", "tejdate"]:
+                needed.update(vars_slots[var].format(k=k) for k in slots)
+            if col.rstrip("12") in vars_slots:
+                var = col.rstrip("12")
+                needed.update(vars_slots[var].format(k=k) for k in slots)
+            needed.update(["monthcode"] + year_vars)
+        elif col not in vars_constant:
+            raise ValueError(f"Variable {col} has no source in the redesign.")
+
+    missing = sorted(needed - set(names))
+    if missing:
+        raise ValueError(
+            f"Variables missing from the redesigned file: {missing}"
+        )
+
+    return [name for name in varlist if name.lower() in needed]
+
+
+def map_chunk(chunk: pd.DataFrame, columns: list) -> pd.DataFrame:
+    """
+    This function maps a chunk of a redesigned file (with source variables in
+    any case) to the requested columns of the wave-file layout, in the order
+    of columns.
+    """
+
+    chunk = chunk.rename(columns=str.lower)
+    mapped = {}
+
+    # -? job slots
+    if any(
+        col.rstrip("12") in vars_slots or col in ["ebuscntr", "eafever"]
+        for col in columns
+    ):
+        mapped.update(map_slots(chunk, columns))
+
+    # -? identifiers and dates
+    # &? "ssuid" has 12 digits, so "indid" (panel, "ssuid", "pnum") fits in
+    # &? an int64 as in the wave files.
+    if "lgtkey" in columns:
+        pnum = chunk["pnum"].astype("int64").astype("str").str.zfill(3)
+        mapped["lgtkey"] = chunk["ssuid"].astype("str") + pnum
+    if "rhcalyr" in columns:
+        mapped["rhcalyr"] = reference_year(chunk)
+
+    # -? renamed and constant variables
+    for col in columns:
+        if col in vars_renamed:
+            values = chunk[vars_renamed[col]]
+            if col in recodes:
+                values = values.replace(recodes[col])
+            mapped[col] = values.to_numpy()
+        elif col in vars_constant and col not in mapped:
+            mapped[col] = vars_constant[col]
+
+    temp = pd.DataFrame(mapped, index=chunk.index)[columns]
+
+    # &? "not in universe" is -1 in the wave files and missing in the redesign
+    coded = [
+        col
+        for col in columns
+        if col not in ["lgtkey", "ssuid", "eentaid", "wpfinwgt"]
+        and not col.startswith("tp")
+    ]
+    temp[coded] = temp[coded].fillna(-1).astype("int32")
+
+    return temp
+
+
+def map_slots(chunk: pd.DataFrame, columns: list) -> dict:
+    """
+    This function maps the job slots of a chunk of a redesigned file (with
+    lower-case source variables) to the job 1 and job 2 variables of the
+    wave-file layout in columns, and to "ebuscntr" and "eafever".
+
+    Of the job slots, the first two slots of jobs held for an employer (not
+    self-employed) in the month become job 1 and job 2. Self-employed slots
+    count as businesses ("ebuscntr"), and an active duty slot as ever in the
+    armed forces ("eafever").
+    """
+
+    slots = [k for k in range(1, 100) if f"ejb{k}_jobid" in chunk.columns]
+    mapped = {}
+
+    month = chunk["monthcode"].to_numpy("float64")[:, None]
+    jobid = slot_matrix(chunk, vars_slots["eeno"], slots)
+    clwrk = slot_matrix(chunk, vars_slots["eclwrk"], slots)
+    start = slot_matrix(chunk, vars_slots["tsjdate"], slots)
+    end = slot_matrix(chunk, vars_slots["tejdate"], slots)
+
+    # &? Job slots hold all jobs of the reference year; a job is held in the
+    # &? months from its start month to its end month.
+    has_job = ~np.isnan(jobid) & (jobid > 0)
+    held = has_job & ~(start > month) & ~(end < month)
+    selfemp = held & np.isin(clwrk, clwrk_selfemp)
+    employer = held & ~selfemp
+    ended = has_job & (end < month)
+
+    mapped["ebuscntr"] = np.where(selfemp.any(axis=1), selfemp.sum(axis=1), -1)
+    mapped["eafever"] = np.where(
+        (has_job & np.isin(clwrk, clwrk_armed)).any(axis=1),
+        1,
+        vars_constant["eafever"],
+    )
+
+    # &? Job 1 and job 2 are the first two slots of jobs held for an employer
+    # &? (not self-employed), except for the reason of stopping work, taken
+    # &? from the first two slots of jobs ended before the month.
+    for var, source in vars_slots.items():
+        if f"{var}1" not in columns and f"{var}2" not in columns:
+            continue
+        mask = ended if var == "ersend" else employer
+        order = np.argsort(~mask, axis=1, kind="stable")[:, :2]
+        picked = np.take_along_axis(mask, order, axis=1)
+        values = slot_matrix(chunk, source, slots)
+        values = np.take_along_axis(values, order, axis=1)
+        if var in recodes:
+            values = pd.DataFrame(values).replace(recodes[var]).to_numpy()
+        if var in ["tsjdate", "tejdate"]:
+            day = 1 if var == "tsjdate" else 28
+            year = reference_year(chunk)[:, None]
+            values = year * 10000 + values * 100 + day
+        fill = 0 if var == "tpmsum" else -1
+        values = np.where(picked & ~np.isnan(values), values, fill)
+        mapped[f"{var}1"], mapped[f"{var}2"] = values[:, 0], values[:, 1]
+
+    return mapped
+
+
+def reference_year(chunk: pd.DataFrame) -> np.ndarray:
+    """
+    This function returns the reference year of each row of a chunk of a
+    redesigned file: each annual wave refers to the previous calendar year
+    (e.g., wave 1 of the 2014 panel to 2013).
+    """
+
+    if "rhcalyr" in chunk.columns:
+        return chunk["rhcalyr"].to_numpy("int64")
+
+    return (
+        chunk["spanel"].to_numpy("int64")
+        + chunk["swave"].to_numpy("int64")
+        - 2
+    )
+
+
+def slot_matrix(chunk: pd.DataFrame, source: str, slots: list) -> np.ndarray:
+    """
+    This function stacks the source variable of each job slot (source with
+    the slot number in {k}) into the columns of a float matrix, padded with
+    missing columns to at least two slots.
+    """
+
+    values = [
+        chunk[source.format(k=k)].to_numpy("float64", na_value=np.nan)
+        for k in slots
+    ]
+    values += [np.full(len(chunk), np.nan)] * (2 - len(values))
+
+    return np.column_stack(values)
+
+
+def redesign_chunks(path: str, columns: list, n_rows: int = chunk_rows):
+    """
+    This function yields the source variables of columns in a redesigned file
+    in chunks of n_rows rows. Compressed files are streamed and decompressed
+    on the fly (see iter_columns in codes/util/dta.py).
+    """
+
+    from util.dta import is_compressed, iter_columns, read_header
+
+    if is_compressed(path):
+        sources = source_vars(columns, read_header(path)["varlist"])
+        yield from iter_columns(path, sources, n_rows)
+        return
+
+    with pd.read_stata(
+        path, convert_categoricals=False, chunksize=n_rows
+    ) as reader:
+        varlist = list(reader.variable_labels())
+        sources = source_vars(columns, varlist)
+        while True:
+            try:
+                yield reader.read(n_rows, columns=sources)
+            except StopIteration:
+                break
+
+
+def iter_redesign(
+    path: str,
+    columns: list = vars_all,
+    n_rows: int = chunk_rows,
+    sample: tuple = None,
+):
+    """
+    This function yields the rows of one redesigned file mapped to the
+    wave-file layout (see map_chunk), in chunks of n_rows rows read, keeping
+    only the source variables of columns, so that the file is never held in
+    memory at once. With sample=(fraction, seed), only the rows of a
+    subsample of persons are kept (see sample_mask in codes/util/waves.py).
+    """
+
+    for chunk in redesign_chunks(path, columns, n_rows):
+        chunk = map_chunk(chunk, columns)
+        if sample is not None:
+            chunk = chunk.loc[sample_mask(chunk["lgtkey"], *sample)]
+        yield chunk
+
+
+def read_redesign(
+    path: str,
+    columns: list = vars_all,
+    n_rows: int = chunk_rows,
+    sample: tuple = None,
+) -> pd.DataFrame:
+    """
+    This function reads one redesigned file in chunks of n_rows rows (see
+    iter_redesign), and returns all its mapped rows. Only the raw chunks are
+    bounded: the mapped rows of the whole file are held in memory, so a
+    caller that can process the file chunk by chunk should use
+    iter_redesign instead.
+    """
+
+    return pd.concat(
+        iter_redesign(path, columns, n_rows, sample),
+        axis=0,
+        ignore_index=True,
+    )
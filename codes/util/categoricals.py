@@ -0,0 +1,129 @@
+#! python3
+
+# ?? This script compiles the value labels in codes/util/labels.py into a
+# ?? registry of categorical dtypes, so that labeled views and exports are a
+# ?? dtype change (codes -> category index -> label) instead of a per-row
+# ?? mapping of strings.
+
+# &? For each labeled variable, the registry stores:
+# &?     "dtype":  pd.CategoricalDtype with the labels (in code order),
+# &?     "codes":  the labeled codes (in the same order),
+# &?     "offset": the smallest labeled code,
+# &?     "lookup": a dense array, lookup[code - offset] is the index of the
+# &?               code's label in "dtype" (-1 if the code is not labeled).
+# &? Entries of labels.py holding only a description (a set of strings instead
+# &? of a dictionary of codes) are kept as metadata in descriptions.
+
+import numpy as np
+import pandas as pd
+
+from util.labels import original_val_labs, val_labs
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. compile the registry
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def compile_labels(labs: dict) -> tuple:
+    """
+    This function compiles a dictionary of value labels (as in labels.py) into
+    a registry of categorical dtypes and a dictionary of descriptions.
+    """
+
+    registry, descriptions = {}, {}
+    for var, labels in labs.items():
+        if isinstance(labels, set):
+            descriptions[var] = " ".join(sorted(labels))
+            continue
+
+        codes = np.array(sorted(labels), dtype=np.int64)
+        categories = [labels[code].strip() for code in codes]
+        if len(set(categories)) < len(categories):
+            raise ValueError(f"Duplicated value labels of {var}.")
+
+        offset = int(codes.min())
+        lookup = np.full(int(codes.max()) - offset + 1, -1, dtype=np.int64)
+        lookup[codes - offset] = np.arange(len(codes))
+
+        registry[var] = {
+            "dtype": pd.CategoricalDtype(categories=categories, ordered=False),
+            "codes": codes,
+            "offset": offset,
+            "lookup": lookup,
+        }
+
+    return registry, descriptions
+
+
+registry, descriptions = compile_labels({**original_val_labs, **val_labs})
+
+# &? Variables named differently in the cleaned data than in labels.py.
+aliases = {
+    "edu": "educ",
+    "ind_selfemp": "ind_self_empl",
+}
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. apply the registry
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def label_entry(var: str) -> dict:
+    """
+    This function returns the registry entry of a variable (or None if it has
+    no value labels).
+    """
+
+    return registry.get(aliases.get(var, var))
+
+
+def to_labeled(col: pd.Series, var: str = None) -> pd.Series:
+    """
+    This function converts a column of codes into a categorical column of
+    labels. Missing and unlabeled codes become missing.
+    """
+
+    entry = label_entry(col.name if var is None else var)
+    lookup, offset = entry["lookup"], entry["offset"]
+
+    values = col.to_numpy(dtype="float64", na_value=np.nan)
+    positions = values - offset
+    valid = (positions >= 0) & (positions < len(lookup))
+    index = np.full(len(values), -1, dtype=np.int64)
+    index[valid] = lookup[positions[valid].astype(np.int64)]
+
+    return pd.Series(
+        pd.Categorical.from_codes(index, dtype=entry["dtype"], validate=False),
+        index=col.index,
+        name=col.name,
+    )
+
+
+def labeled_view(temp: pd.DataFrame, cols: list = None) -> pd.DataFrame:
+    """
+    This function returns temp with all labeled variables (or those in cols)
+    shown as categorical labels. Other columns are not copied.
+    """
+
+    cols = temp.columns if cols is None else cols
+    labeled = {col: to_labeled(temp[col]) for col in cols if label_entry(col)}
+
+    return temp.assign(**labeled)
+
+
+def stata_value_labels(cols: list) -> dict:
+    """
+    This function returns the value labels of the labeled variables in cols,
+    in the format of the value_labels argument of DataFrame.to_stata.
+    """
+
+    value_labels = {}
+    for col in cols:
+        entry = label_entry(col)
+        if entry is None:
+            continue
+        value_labels[col] = dict(
+            zip(entry["codes"].tolist(), entry["dtype"].categories.tolist())
+        )
+
+    return value_labels
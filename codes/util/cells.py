@@ -0,0 +1,61 @@
+#! python3
+
+# ?? This script stores functions to index demographic cells (e.g., panel,
+# ?? education, sex, race, and age bin) of a cleaned panel by one integer,
+# ?? so that tabulations by cell are a np.bincount over combined keys.
+
+import numpy as np
+import pandas as pd
+
+# -? lower bounds of the age bins (ages 18 to 65 after step 3)
+age_bins = [18, 25, 35, 45, 55]
+
+cell_vars = ["panel", "edu", "male", "race", "age_bin"]
+
+
+def age_bin(age: pd.Series) -> np.ndarray:
+    """
+    This function returns the age bin of each age: 1 for 18 to 24, 2 for 25
+    to 34, ..., 5 for 55 and older (0 below 18 or missing).
+    """
+
+    values = age.to_numpy(dtype="float64", na_value=np.nan)
+
+    return np.digitize(np.nan_to_num(values, nan=-1), age_bins)
+
+
+def cell_index(temp: pd.DataFrame, by: list) -> tuple:
+    """
+    This function indexes the cells of the variables in by ("age_bin" is
+    derived from "age"), and returns the cell of each row and a DataFrame of
+    the cells (row i: the values of cell i), sorted by the variables in by.
+    Rows with a missing value in by are in cell -1.
+    """
+
+    if not by:
+        return np.zeros(len(temp), dtype=np.int64), pd.DataFrame(index=[0])
+
+    codes, levels = [], []
+    for var in by:
+        col = age_bin(temp["age"]) if var == "age_bin" else temp[var]
+        code, level = pd.factorize(col, sort=True)
+        codes.append(code)
+        levels.append(level)
+
+    # -? combine the codes (mixed radix), then keep the observed cells
+    combined = np.zeros(len(temp), dtype=np.int64)
+    missing = np.zeros(len(temp), dtype=bool)
+    for code, level in zip(codes, levels):
+        combined = combined * len(level) + code
+        missing |= code < 0
+
+    observed, ids = np.unique(combined[~missing], return_inverse=True)
+    cell = np.full(len(temp), -1, dtype=np.int64)
+    cell[~missing] = ids
+
+    cells = {}
+    for var, level in zip(reversed(by), reversed(levels)):
+        cells[var] = np.asarray(level)[observed % len(level)]
+        observed = observed // len(level)
+
+    return cell, pd.DataFrame({var: cells[var] for var in by})
@@ -0,0 +1,152 @@
+#! python3
+
+# ?? This script stores functions to keep the checkpointed state of a panel
+# ?? between runs of the incremental cleaning mode (SIPP_cleaning_incremental
+# ?? in codes/clean/aSIPP.py).
+
+# &? The state of a panel is a dictionary, stored in the scratch folder (see
+# &? codes/util/paths.py):
+# &?     "version": code_version() of the run that saved it,
+# &?     "waves":   {wave file: fingerprint} of the ingested wave files,
+# &?     "raw":     {wave file: DataFrame} of the ingested raw variables,
+# &?     "sample":  DataFrame after step 3 (SIPP_sample),
+# &?     "spells":  DataFrame after step 7 (SIPP_spells).
+# &? The raw variables of each wave file are one pickle file in the folder
+# &? state`panel', and everything else is state`panel'.pkl, so a run only
+# &? rewrites the raw variables of the wave files it re-ingests.
+# &? A wave file whose fingerprint (size and modification time) differs from
+# &? the stored one is treated as changed, and re-ingested. A state saved by
+# &? a different version of the cleaning code is not used.
+
+import hashlib
+import os
+import pickle
+import re
+import shutil
+
+from util.paths import CODES_PATH, scratch
+
+# -? the cleaning code, whose changes invalidate a state: these files and
+# -? every util module they import, directly or through other util modules
+# -? (util/occ.py recodes the raw occupations of the cleaned panels)
+code_main = ["clean/aSIPP.py", "util/occ.py"]
+
+
+def state_path(panel: int) -> str:
+    return scratch(f"state{panel}.pkl")
+
+
+def raw_path(panel: int, path: str) -> str:
+    return scratch(f"state{panel}", f"{os.path.basename(path)}.pkl")
+
+
+def fingerprint(path: str) -> tuple:
+    """
+    This function returns the fingerprint of a file: size and modification
+    time in nanoseconds.
+    """
+
+    stat = os.stat(path)
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+def code_files() -> list:
+    """
+    This function returns the files of the cleaning code: code_main and the
+    util modules they import, directly or indirectly, in order.
+    """
+
+    files, todo = set(), list(code_main)
+    while todo:
+        file = todo.pop()
+        if file in files:
+            continue
+        files.add(file)
+        with open(os.path.join(CODES_PATH, file)) as f:
+            modules = re.findall(r"from util\.(\w+) import", f.read())
+        todo += [f"util/{module}.py" for module in modules]
+
+    return sorted(files)
+
+
+def code_version() -> str:
+    """
+    This function returns a hash of the contents of the files of the
+    cleaning code (code_files).
+    """
+
+    digest = hashlib.sha256()
+    for file in code_files():
+        digest.update(file.encode())
+        with open(os.path.join(CODES_PATH, file), "rb") as f:
+            digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+def _dump(obj, path: str):
+    # &? written under a temporary name and renamed, so an interrupted run
+    # &? keeps the old file
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+def load_state(panel: int) -> dict:
+    """
+    This function loads the checkpointed state of a panel (or returns None if
+    there is none, or if it was saved by another version of the code).
+    """
+
+    path = state_path(panel)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    if state.get("version") != code_version():
+        print(f"Checkpoint {panel}: the cleaning code changed, rebuilding")
+        return None
+
+    state["raw"] = {}
+    for wave in state["waves"]:
+        with open(raw_path(panel, wave), "rb") as f:
+            state["raw"][wave] = pickle.load(f)
+
+    return state
+
+
+def save_state(panel: int, state: dict, changed: list = None):
+    """
+    This function saves the state of a panel, with the raw variables of the
+    wave files in changed (all by default). Files are written under a
+    temporary name and renamed, so an interrupted run keeps the old state.
+    """
+
+    os.makedirs(os.path.dirname(raw_path(panel, "")), exist_ok=True)
+    for wave in state["raw"] if changed is None else changed:
+        if wave in state["raw"]:
+            _dump(state["raw"][wave], raw_path(panel, wave))
+        elif os.path.exists(raw_path(panel, wave)):
+            os.remove(raw_path(panel, wave))
+
+    _dump(
+        dict(
+            {key: value for key, value in state.items() if key != "raw"},
+            version=code_version(),
+        ),
+        state_path(panel),
+    )
+
+
+def drop_state(panel: int):
+    """
+    This function removes the checkpointed state of a panel, so the next
+    incremental run rebuilds it from all wave files.
+    """
+
+    path = state_path(panel)
+    if os.path.exists(path):
+        os.remove(path)
+    shutil.rmtree(os.path.dirname(raw_path(panel, "")), ignore_errors=True)
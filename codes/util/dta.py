@@ -0,0 +1,439 @@
+#! python3
+
+# ?? This script stores a reader of the header of Stata .dta files (format
+# ?? versions 113 to 115, and 117 to 119): the number of variables and
+# ?? observations, the variable names and storage types, and the layout of the
+# ?? data section, without reading any observation, and readers of the data
+# ?? section: through a memory map of the file as a NumPy structured array,
+# ?? or, for compressed files (.dta.gz, .dta.zst, or a .dta in a .zip), in
+# ?? chunks of records decompressed on the fly.
+
+# &? Storage types are returned by name: "byte", "int", "long", "float",
+# &? "double", "str1" to "str2045", or "strL". In the data section, each
+# &? observation is one fixed-width record with the variables in order:
+# &?     byte: 1, int: 2, long: 4, float: 4, double: 8 bytes,
+# &?     strN: N bytes (null-padded),
+# &?     strL: 8 bytes (a reference into the strL section).
+# &? So the data section maps onto a structured array with one field per
+# &? variable (see record_dtype), and a variable is a strided view of the
+# &? file. Numeric values above the largest valid value of their type are
+# &? Stata missing values (. and .a to .z), read as NaN as by pd.read_stata.
+
+import gzip
+import io
+import os
+import struct
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+# -? storage type codes of format versions 113 to 115 (1 to 244: strN)
+old_types = {251: "byte", 252: "int", 253: "long", 254: "float", 255: "double"}
+
+# -? storage type codes of format versions 117 to 119 (1 to 2045: strN)
+new_types = {
+    65530: "byte",
+    65529: "int",
+    65528: "long",
+    65527: "float",
+    65526: "double",
+    32768: "strL",
+}
+
+# -? width in bytes of the numeric storage types
+type_widths = {"byte": 1, "int": 2, "long": 4, "float": 4, "double": 8}
+
+# -? NumPy types of the numeric storage types
+numpy_types = {
+    "byte": "i1",
+    "int": "i2",
+    "long": "i4",
+    "float": "f4",
+    "double": "f8",
+}
+
+# -? records per block copied out of a memory map
+block_rows = 2048
+
+# -? bytes of a compressed file decompressed to read its header (first try)
+header_bytes = 1 << 20
+
+# -? suffixes of compressed .dta files
+compressed_suffixes = (".dta.gz", ".dta.zst", ".zip")
+
+# -? largest valid value of the numeric storage types (larger: missing)
+valid_max = {
+    "byte": 100,
+    "int": 32740,
+    "long": 2147483620,
+    "float": np.frombuffer(b"\xff\xff\xff\x7e", "<f4")[0],
+    "double": np.frombuffer(b"\xff\xff\xff\xff\xff\xff\xdf\x7f", "<f8")[0],
+}
+
+
+def type_width(kind: str) -> int:
+    """
+    This function returns the width in bytes of a storage type in the data
+    section.
+    """
+
+    if kind == "strL":
+        return 8
+    if kind.startswith("str"):
+        return int(kind[3:])
+
+    return type_widths[kind]
+
+
+def _names(raw: bytes, n: int, width: int, encoding: str) -> list:
+    return [
+        raw[i * width : (i + 1) * width].split(b"\0", 1)[0].decode(encoding)
+        for i in range(n)
+    ]
+
+
+def _read_old_header(f, version: int) -> dict:
+    head = f.read(109)
+    order = ">" if head[1] == 1 else "<"
+    nvar, nobs = struct.unpack(order + "hi", head[4:10])
+
+    kinds = []
+    for code in f.read(nvar):
+        kinds.append(old_types.get(code, f"str{code}"))
+    varlist = _names(f.read(nvar * 33), nvar, 33, "latin-1")
+
+    # -? skip sort list, formats, value label names, variable labels
+    fmt_width = 12 if version == 113 else 49
+    f.seek(2 * (nvar + 1) + nvar * (fmt_width + 33 + 81), 1)
+
+    # -? skip expansion fields (type byte and length, until type 0)
+    while True:
+        kind, length = struct.unpack(order + "bi", f.read(5))
+        if kind == 0:
+            break
+        f.seek(length, 1)
+
+    return {
+        "byteorder": order,
+        "nvar": nvar,
+        "nobs": nobs,
+        "varlist": varlist,
+        "typlist": kinds,
+        "data_offset": f.tell(),
+    }
+
+
+def _tag(f, name: str):
+    start = f"<{name}>".encode()
+    if f.read(len(start)) != start:
+        raise ValueError(f"Corrupted .dta file: expected <{name}>")
+
+
+def _read_new_header(f, version: int) -> dict:
+    f.seek(len(b"<stata_dta><header><release>117</release>"))
+    _tag(f, "byteorder")
+    order = ">" if f.read(3) == b"MSF" else "<"
+    f.seek(len(b"</byteorder>"), 1)
+
+    _tag(f, "K")
+    nvar = struct.unpack(
+        order + ("I" if version == 119 else "H"),
+        f.read(4 if version == 119 else 2),
+    )[0]
+    f.seek(len(b"</K>"), 1)
+    _tag(f, "N")
+    nobs = struct.unpack(
+        order + ("I" if version == 117 else "Q"),
+        f.read(4 if version == 117 else 8),
+    )[0]
+
+    # -? the map holds the offsets of the sections
+    f.seek(0)
+    head = f.read(1024)
+    start = head.index(b"<map>") + len(b"<map>")
+    offsets = struct.unpack(order + "14Q", head[start : start + 14 * 8])
+
+    f.seek(offsets[2] + len(b"<variable_types>"))
+    codes = struct.unpack(order + f"{nvar}H", f.read(2 * nvar))
+    kinds = [new_types.get(code, f"str{code}") for code in codes]
+
+    width = 33 if version == 117 else 129
+    encoding = "latin-1" if version == 117 else "utf-8"
+    f.seek(offsets[3] + len(b"<varnames>"))
+    varlist = _names(f.read(nvar * width), nvar, width, encoding)
+
+    return {
+        "byteorder": order,
+        "nvar": nvar,
+        "nobs": nobs,
+        "varlist": varlist,
+        "typlist": kinds,
+        "data_offset": offsets[9] + len(b"<data>"),
+    }
+
+
+def is_compressed(path: str) -> bool:
+    return path.lower().endswith(compressed_suffixes)
+
+
+def open_dta(path: str):
+    """
+    This function opens a .dta file as a binary stream, decompressing
+    .dta.gz, .dta.zst (requires zstandard), and .zip files (the .dta member
+    named as the archive, or else the first .dta member) on the fly.
+    """
+
+    name = path.lower()
+    if name.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if name.endswith(".zst"):
+        import zstandard
+
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            members = [
+                member
+                for member in archive.namelist()
+                if member.lower().endswith(".dta")
+            ]
+            if not members:
+                raise ValueError(f"No .dta file in {path}")
+            member = os.path.basename(path)[: -len(".zip")] + ".dta"
+            return archive.open(member if member in members else members[0])
+
+    return open(path, "rb")
+
+
+def _read_exact(f, n: int) -> bytes:
+    """
+    This function reads n bytes from a stream (decompressing streams may
+    return fewer bytes per read).
+    """
+
+    parts, size = [], 0
+    while size < n:
+        part = f.read(n - size)
+        if not part:
+            raise ValueError("Corrupted .dta file: unexpected end of data")
+        parts.append(part)
+        size += len(part)
+
+    return b"".join(parts)
+
+
+def _parse_header(f, path: str) -> dict:
+    first = f.read(len(b"<stata_dta><header><release>117"))
+    f.seek(0)
+    if first.startswith(b"<stata_dta>"):
+        version = int(first[-3:])
+        header = _read_new_header(f, version)
+    elif first[:1] and first[0] in (113, 114, 115):
+        version = first[0]
+        header = _read_old_header(f, version)
+    else:
+        raise ValueError(f"Unsupported .dta format: {path}")
+
+    header["version"] = version
+    header["record"] = sum(type_width(kind) for kind in header["typlist"])
+
+    return header
+
+
+def read_header(path: str) -> dict:
+    """
+    This function reads the header of a .dta file (compressed or not), and
+    returns a dictionary:
+        "version":     format version (113 to 115, or 117 to 119),
+        "byteorder":   "<" (little-endian) or ">" (big-endian),
+        "nvar":        number of variables,
+        "nobs":        number of observations,
+        "varlist":     variable names,
+        "typlist":     storage types (see above),
+        "data_offset": position of the first observation in the (decompressed)
+                       file,
+        "record":      width in bytes of one observation.
+    """
+
+    if not is_compressed(path):
+        with open(path, "rb") as f:
+            return _parse_header(f, path)
+
+    # &? The header of a compressed file is parsed from its first bytes,
+    # &? decompressed again with 16 times more bytes if they were too few.
+    size = header_bytes
+    while True:
+        with open_dta(path) as f:
+            head = f.read(size)
+        if len(head) < size:
+            return _parse_header(io.BytesIO(head), path)
+        f = io.BytesIO(head)
+        try:
+            header = _parse_header(f, path)
+            if f.tell() < size:
+                return header
+        except (struct.error, ValueError):
+            pass
+        size *= 16
+
+
+def record_dtype(header: dict) -> np.dtype:
+    """
+    This function returns the NumPy structured type of one observation in the
+    data section of a .dta file, with one field per variable (strL fields
+    are the raw 8-byte references).
+    """
+
+    order = header["byteorder"]
+    fields = []
+    for name, kind in zip(header["varlist"], header["typlist"]):
+        if kind == "strL":
+            fields.append((name, "V8"))
+        elif kind.startswith("str"):
+            fields.append((name, f"S{kind[3:]}"))
+        else:
+            fields.append((name, order + numpy_types[kind]))
+
+    return np.dtype(fields)
+
+
+def map_records(path: str, header: dict = None) -> np.memmap:
+    """
+    This function maps the data section of a .dta file into memory (read
+    only), as an array of nobs records of type record_dtype(header). Nothing
+    is read until a field is used.
+    """
+
+    if is_compressed(path):
+        raise ValueError(f"{path}: compressed files cannot be memory-mapped")
+    header = header or read_header(path)
+
+    return np.memmap(
+        path,
+        dtype=record_dtype(header),
+        mode="r",
+        offset=header["data_offset"],
+        shape=(header["nobs"],),
+    )
+
+
+def _missing_to_nan(values: np.ndarray, kind: str) -> np.ndarray:
+    missing = values > valid_max[kind]
+    if not missing.any():
+        return values
+    if values.dtype.kind != "f":
+        values = values.astype(np.float64)
+    values[missing] = np.nan
+
+    return values
+
+
+def _column_types(header: dict, columns: list, path: str) -> dict:
+    types = dict(zip(header["varlist"], header["typlist"]))
+    absent = [col for col in columns if col not in types]
+    if absent:
+        raise ValueError(f"{path}: variables not found: {absent}")
+    if any(types[col] == "strL" for col in columns):
+        raise ValueError(f"{path}: strL variables cannot be read as records")
+
+    return {col: types[col] for col in columns}
+
+
+def records_frame(
+    records: np.ndarray, types: dict, encoding: str = "utf-8"
+) -> pd.DataFrame:
+    """
+    This function copies the variables in types ({name: storage type}) out
+    of an array of records, and returns them as pd.read_stata does (with
+    convert_categoricals=False): numbers in native byte order with missing
+    values as NaN (integer types then as float64), strings decoded without
+    their null padding.
+    """
+
+    # -? copy all variables one block of records at a time, while the block
+    # -? is in the CPU cache (one pass over the records)
+    strings = [col for col, kind in types.items() if kind.startswith("str")]
+    numeric = [col for col in types if col not in strings]
+    values = {
+        col: np.empty(len(records), records.dtype[col].newbyteorder("="))
+        for col in numeric
+    }
+    values.update({col: [] for col in strings})
+    for start in range(0, len(records), block_rows):
+        block = records[start : start + block_rows]
+        for col in numeric:
+            values[col][start : start + block_rows] = block[col]
+        for col in strings:
+            values[col].extend(
+                value.partition(b"\0")[0].decode(encoding)
+                for value in block[col].tolist()
+            )
+
+    return pd.DataFrame(
+        {
+            col: (
+                np.array(values[col], dtype=object)
+                if col in strings
+                else _missing_to_nan(values[col], kind)
+            )
+            for col, kind in types.items()
+        },
+        copy=False,
+    )
+
+
+def _encoding(header: dict) -> str:
+    return "utf-8" if header["version"] >= 118 else "latin-1"
+
+
+def read_columns(
+    path: str, columns: list, rows: np.ndarray = None
+) -> pd.DataFrame:
+    """
+    This function reads the variables in columns of an uncompressed .dta file
+    through a memory map of its data section (all rows, or the rows selected
+    by rows, a boolean mask or row positions), and returns them as
+    pd.read_stata(path, columns=columns, convert_categoricals=False) does
+    (see records_frame). strL variables cannot be read this way.
+    """
+
+    header = read_header(path)
+    types = _column_types(header, columns, path)
+    records = map_records(path, header)
+    if rows is not None:
+        records = records[rows]
+
+    return records_frame(records, types, _encoding(header))
+
+
+def iter_records(path: str, n_rows: int, header: dict = None):
+    """
+    This function yields the records of a .dta file (compressed or not) in
+    arrays of up to n_rows records, reading the file as one stream, so that
+    compressed files are decompressed on the fly, never as a whole. A file
+    without observations yields one empty array.
+    """
+
+    header = header or read_header(path)
+    dtype = record_dtype(header)
+    with open_dta(path) as f:
+        skip = header["data_offset"]
+        while skip > 0:
+            skip -= len(_read_exact(f, min(skip, header_bytes)))
+        for start in range(0, max(header["nobs"], 1), n_rows):
+            count = min(n_rows, header["nobs"] - start)
+            yield np.frombuffer(_read_exact(f, count * dtype.itemsize), dtype)
+
+
+def iter_columns(path: str, columns: list, n_rows: int):
+    """
+    This function yields the variables in columns of a .dta file (compressed
+    or not) in DataFrames of up to n_rows rows (see iter_records and
+    records_frame).
+    """
+
+    header = read_header(path)
+    types = _column_types(header, columns, path)
+    for records in iter_records(path, n_rows, header):
+        yield records_frame(records, types, _encoding(header))
@@ -2,6 +2,7 @@
 
 # &? This file stores some commonly used functions for pandas..
 
+import numpy as np
 import pandas as pd
 
 # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
@@ -9,15 +10,147 @@ import pandas as pd
 # ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
 
 
-def df_order(df: pd.DataFrame, cols: tuple) -> None:
+def df_order(df: pd.DataFrame, cols: tuple) -> pd.DataFrame:
     """
     This function moves columns (stored in a tuple) to the front of a dataset.
+
+    Only a view for display is returned: the columns are not copied (and, with
+    copy-on-write, modifying the view does not modify df). The column order of
+    the cleaned datasets is set once at export by the output schema in
+    codes/util/schema.py.
     """
 
     cols_first = list(cols)
     cols_ordered = cols_first + [
         col for col in df.columns if not col in cols_first
     ]
-    df = df[cols_ordered]
 
-    return df
+    return pd.DataFrame(
+        {col: df[col] for col in cols_ordered}, index=df.index, copy=False
+    )
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? function 2. sort only when necessary
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def _key_values(col: pd.Series) -> np.ndarray:
+    if hasattr(col.dtype, "numpy_dtype"):
+        return col.to_numpy(dtype=col.dtype.numpy_dtype)
+    return col.to_numpy()
+
+
+def is_sorted(df: pd.DataFrame, by: list) -> bool:
+    """
+    This function checks in O(n), by comparing each row with the previous one,
+    whether a dataset is sorted (ascending) by the columns in by. Datasets with
+    missing values in by are reported as not sorted.
+    """
+
+    if len(df) < 2:
+        return True
+    if any(df[col].hasnans for col in by):
+        return False
+
+    ordered = np.zeros(len(df) - 1, dtype=bool)
+    tied = np.ones(len(df) - 1, dtype=bool)
+    for col in by:
+        values = _key_values(df[col])
+        ordered |= tied & (values[:-1] < values[1:])
+        tied &= values[:-1] == values[1:]
+
+    return bool((ordered | tied).all())
+
+
+def sort_once(df: pd.DataFrame, by: list) -> pd.DataFrame:
+    """
+    This function sorts a dataset by the columns in by, unless it is already
+    sorted (see is_sorted), in which case it is returned as is. As sorting by
+    several columns is stable, the result is the same as df.sort_values(by).
+    """
+
+    if is_sorted(df, by):
+        return df
+
+    return df.sort_values(by=by)
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? function 3. group operations on sorted datasets
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+# &? In a dataset sorted by the group keys, each group is a contiguous segment
+# &? of rows, so group operations only need the first row of each segment,
+# &? instead of hashing the keys as groupby does. The group keys must not be
+# &? missing.
+
+
+def segments(df: pd.DataFrame, keys: list) -> np.ndarray:
+    """
+    This function flags the first row of each segment of equal keys.
+    """
+
+    new = np.zeros(len(df), dtype=bool)
+    if len(df):
+        new[0] = True
+    for col in keys:
+        values = _key_values(df[col])
+        new[1:] |= values[1:] != values[:-1]
+
+    return new
+
+
+def seg_shift(col: pd.Series, new: np.ndarray, periods: int) -> pd.Series:
+    """
+    This function is the segment counterpart of groupby(keys)[col].shift().
+    """
+
+    ids = pd.Series(np.cumsum(new), index=col.index)
+    crossed = ids.shift(periods).ne(ids).to_numpy(dtype=bool)
+
+    return col.shift(periods).mask(crossed)
+
+
+def seg_cumsum(col: pd.Series, new: np.ndarray) -> pd.Series:
+    """
+    This function is the segment counterpart of groupby(keys)[col].cumsum(),
+    for columns without missing values.
+    """
+
+    values = _key_values(col)
+    total = np.cumsum(values)
+    ids = np.cumsum(new) - 1
+    base = (total - values)[new][ids] if len(values) else total
+
+    return pd.Series(total - base, index=col.index, dtype=col.dtype)
+
+
+def seg_transform(col: pd.Series, new: np.ndarray, how: str) -> pd.Series:
+    """
+    This function is the segment counterpart of groupby(keys)[col].transform()
+    for how in "size", "sum", "max", and "min". Missing values are skipped as
+    in groupby, and values are computed in float64 (exact up to 2**53).
+    """
+
+    starts = np.flatnonzero(new)
+    counts = np.diff(np.r_[starts, len(new)])
+    if how == "size":
+        dtype = "Int64" if hasattr(col.dtype, "numpy_dtype") else "int64"
+        return pd.Series(np.repeat(counts, counts), index=col.index, dtype=dtype)
+    if len(new) == 0:
+        return col.copy()
+
+    values = col.to_numpy(dtype="float64", na_value=np.nan)
+    if how == "sum":
+        result = np.add.reduceat(np.nan_to_num(values), starts)
+    elif how == "max":
+        result = np.fmax.reduceat(values, starts)
+    elif how == "min":
+        result = np.fmin.reduceat(values, starts)
+    else:
+        raise ValueError(f"Unknown segment operation: {how}")
+
+    return pd.Series(np.repeat(result, counts), index=col.index).astype(
+        col.dtype
+    )
@@ -0,0 +1,151 @@
+#! python3
+
+# ?? This script stores integrity checks of the key guarantees of the cleaned
+# ?? person-month panels, in O(n) passes over datasets sorted by "indid" and
+# ?? "ym" (each row is compared with the previous one, no hashing):
+# ??     unique_months:     no individual has two rows in the same month,
+# ??     monotone_months:   months increase within an individual,
+# ??     contiguous_spells: the months of a spell are adjacent rows of one
+# ??                        individual in consecutive calendar months,
+# ??     exclusive_status:  empl + unempl + outlf == 1 in every month.
+# ?? A failed check raises IntegrityError, with the number of offending rows
+# ?? and the first of them.
+
+# &? Checks are on by default. They can be turned off for production runs with
+# &? the setting "checks" (OCCMOB_CHECKS=0, or checks = 0 in paths.ini, see
+# &? codes/util/paths.py), or at run time with set_checks(False).
+
+import numpy as np
+import pandas as pd
+
+from util.paths import setting
+
+spell_cols = ["ubar_spell_no", "ustar_spell_no", "u_spell_no"]
+
+_enabled = {"checks": setting("checks", "1") not in ("0", "off", "false")}
+
+
+class IntegrityError(ValueError):
+    pass
+
+
+def set_checks(on: bool):
+    """
+    This function turns the integrity checks on or off.
+    """
+
+    _enabled["checks"] = bool(on)
+
+
+def checks_enabled() -> bool:
+    return _enabled["checks"]
+
+
+def _fail(name: str, bad: np.ndarray, temp: pd.DataFrame):
+    rows = np.flatnonzero(bad)
+    if len(rows):
+        first = temp.iloc[rows[0]]
+        raise IntegrityError(
+            f"{name} failed for {len(rows)} rows, first at row {rows[0]} "
+            f"(indid={first.get('indid')}, ym={first.get('ym')})"
+        )
+
+
+def _months(temp: pd.DataFrame) -> tuple:
+    """
+    This function returns, for the rows of a dataset after the first, whether
+    the row belongs to the same individual as the previous row, and the
+    difference in calendar months to the previous row.
+    """
+
+    person = temp["indid"].to_numpy()
+    month = temp["ym"].to_numpy().astype("datetime64[M]").astype(np.int64)
+
+    return person[1:] == person[:-1], month[1:] - month[:-1]
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. checks
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def unique_months(temp: pd.DataFrame):
+    same_person, step = _months(temp)
+    _fail("unique_months", np.r_[False, same_person & (step == 0)], temp)
+
+
+def monotone_months(temp: pd.DataFrame):
+    same_person, step = _months(temp)
+    _fail("monotone_months", np.r_[False, same_person & (step < 0)], temp)
+
+
+def contiguous_spells(temp: pd.DataFrame, cols: list = spell_cols):
+    """
+    This function checks that each spell id in cols covers adjacent rows of
+    one individual in consecutive calendar months, i.e., a spell id never
+    reappears after a row with another id, and that so do the continuous
+    spells ("cont_spell_no", numbered within an individual).
+    """
+
+    same_person, step = _months(temp)
+    if "cont_spell_no" in temp.columns:
+        cont = temp["cont_spell_no"].to_numpy()
+        same = same_person & (cont[1:] == cont[:-1])
+        _fail(
+            "contiguous_spells (cont_spell_no)",
+            np.r_[False, same & (step != 1)],
+            temp,
+        )
+
+    for col in [col for col in cols if col in temp.columns]:
+        spell_no = temp[col].to_numpy("float64", na_value=np.nan)
+        in_spell = ~np.isnan(spell_no)
+        same = in_spell[1:] & in_spell[:-1] & (spell_no[1:] == spell_no[:-1])
+        _fail(
+            f"contiguous_spells ({col})",
+            np.r_[False, same & ~(same_person & (step == 1))],
+            temp,
+        )
+
+        # -? each id starts once (a new run of an id is a new spell)
+        starts = in_spell & np.r_[True, ~same]
+        _fail(
+            f"contiguous_spells ({col})",
+            pd.Series(spell_no[starts]).duplicated().to_numpy(),
+            temp.loc[starts, :],
+        )
+
+
+def exclusive_status(temp: pd.DataFrame):
+    total = sum(
+        temp[col].to_numpy("int64", na_value=0)
+        for col in ["empl", "unempl", "outlf"]
+    )
+    _fail("exclusive_status", total != 1, temp)
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. run checks
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+panel_checks = [
+    unique_months,
+    monotone_months,
+    contiguous_spells,
+    exclusive_status,
+]
+
+
+def check(temp: pd.DataFrame, checks: list = panel_checks) -> bool:
+    """
+    This function runs the checks in checks on a dataset sorted by "indid"
+    and "ym", if checks are enabled, and returns whether they ran.
+    """
+
+    if not checks_enabled():
+        return False
+
+    for func in checks:
+        func(temp)
+
+    return True
@@ -0,0 +1,259 @@
+#! python3
+
+# ?? This script stores functions to recode raw SIPP occupation codes
+# ?? ("occ_raw", "source_occ_raw", "destination_occ_raw") to the consistent
+# ?? occupation classification occ1990dd (see val_labs["occ1990dd"] in
+# ?? codes/util/labels.py).
+
+# &? Raw codes follow the census occupation classification of each panel:
+# &?     1996, 2001: 1990 census codes,
+# &?     2004, 2008: 2000 census codes.
+# &? The 2010 census codes of the redesigned panels (2014 and 2018) are not
+# &? recoded here.
+# &? Each classification is recoded by a crosswalk file (David Dorn's
+# &? occ1990dd crosswalks) stored in the rawdata folder, with the raw code in
+# &? the first column, "occ1990dd", and optionally "weight" (the share of a raw
+# &? code going to each occ1990dd code, if a raw code is split).
+
+# &? A crosswalk is compiled once into dense arrays indexed by raw code:
+# &?     "offset":  the smallest raw code,
+# &?     "lookup":  lookup[code - offset] is the occ1990dd code with the
+# &?                largest weight (-1 if the code is not in the crosswalk),
+# &?     "starts":  the occ1990dd codes of a raw code and their weights are
+# &?                in rows starts[code - offset] to starts[code - offset + 1]
+# &?                of "targets" and "weights".
+# &? so that recoding is an array lookup (np.take) instead of a merge.
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from util.paths import rawdata
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. crosswalk files
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+# -? census classification of the raw occupation codes of each panel
+panel_census = {
+    1996: 1990,
+    2001: 1990,
+    2004: 2000,
+    2008: 2000,
+}
+
+# -? crosswalk file of each census classification (stored in rawdata)
+crosswalk_files = {
+    1990: "occ1990_occ1990dd.dta",
+    2000: "occ2000_occ1990dd.dta",
+}
+
+# -? raw codes are divided by code_scale before the lookup (SIPP 2000 census
+# -? codes have four digits, all multiples of 10, the crosswalk three)
+code_scale = {
+    1990: 1,
+    2000: 10,
+}
+
+occ_cols = ["occ_raw", "source_occ_raw", "destination_occ_raw"]
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. compile crosswalks
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def compile_crosswalk(crosswalk: pd.DataFrame, scale: int = 1) -> dict:
+    """
+    This function compiles a crosswalk (raw code in the first column,
+    "occ1990dd", and optionally "weight") into dense arrays indexed by raw
+    code. Weights of a raw code are normalized to sum to one.
+    """
+
+    source = crosswalk.iloc[:, 0].to_numpy(dtype="int64")
+    target = crosswalk["occ1990dd"].to_numpy(dtype="int64")
+    if "weight" in crosswalk.columns:
+        weight = crosswalk["weight"].to_numpy(dtype="float64")
+    else:
+        weight = np.ones(len(source))
+
+    # -? pairs sorted by raw code, largest weight first
+    order = np.lexsort((-weight, source))
+    source, target, weight = source[order], target[order], weight[order]
+
+    offset = int(source.min())
+    n_codes = int(source.max()) - offset + 1
+    counts = np.bincount(source - offset, minlength=n_codes)
+    starts = np.r_[0, np.cumsum(counts)]
+
+    totals = np.bincount(source - offset, weights=weight, minlength=n_codes)
+    weight = weight / totals[source - offset]
+
+    lookup = np.full(n_codes, -1, dtype=np.int64)
+    lookup[counts > 0] = target[starts[:-1][counts > 0]]
+
+    return {
+        "offset": offset,
+        "scale": scale,
+        "lookup": lookup,
+        "starts": starts,
+        "targets": target,
+        "weights": weight,
+    }
+
+
+def panel_crosswalk(panel: int) -> dict:
+    """
+    This function returns the compiled crosswalk of a panel's census
+    classification.
+    """
+
+    if panel not in panel_census:
+        raise ValueError(f"No occupation crosswalk for panel {panel}")
+
+    return load_crosswalk(panel_census[panel])
+
+
+@lru_cache(maxsize=None)
+def load_crosswalk(census: int) -> dict:
+    """
+    This function reads and compiles the crosswalk file of a census
+    classification (once per session).
+    """
+
+    crosswalk = pd.read_stata(
+        rawdata(crosswalk_files[census]), convert_categoricals=False
+    )
+
+    return compile_crosswalk(crosswalk, code_scale[census])
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 3. recode occupation codes
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def _lookup(codes, entry: dict) -> tuple:
+    """
+    This function looks up raw codes in a compiled crosswalk, and returns the
+    positions of the codes in its dense arrays, their occ1990dd codes with
+    the largest weight, and whether each code is in the crosswalk. A code
+    that is not a multiple of the crosswalk's scale is not in the crosswalk.
+    """
+
+    codes = pd.Series(codes, copy=False)
+    missing = codes.isna().to_numpy()
+    values = codes.to_numpy(dtype="int64", na_value=0)
+    on_scale = values % entry["scale"] == 0
+    if entry["scale"] != 1:
+        values = values // entry["scale"]
+
+    lookup = entry["lookup"]
+    positions = values - entry["offset"]
+    recoded = np.take(lookup, positions, mode="clip")
+    valid = ~missing & on_scale & (positions.astype(np.uint64) < len(lookup))
+    valid &= recoded >= 0
+
+    return positions, recoded, valid
+
+
+def recode(codes, entry: dict) -> pd.arrays.IntegerArray:
+    """
+    This function recodes raw codes to occ1990dd codes by a compiled
+    crosswalk. A split raw code gets its occ1990dd code with the largest
+    weight. Missing codes and codes not in the crosswalk become missing.
+    """
+
+    _, recoded, valid = _lookup(codes, entry)
+
+    return pd.arrays.IntegerArray(recoded, ~valid)
+
+
+def recode_weighted(codes, entry: dict) -> tuple:
+    """
+    This function recodes raw codes to all their occ1990dd codes by a compiled
+    crosswalk, and returns (rows, targets, weights): row rows[i] of codes goes
+    to occ1990dd code targets[i] with weight weights[i]. Rows with missing
+    codes or codes not in the crosswalk are left out.
+    """
+
+    positions, _, valid = _lookup(codes, entry)
+    rows = np.flatnonzero(valid)
+    first = entry["starts"][positions[rows]]
+    counts = entry["starts"][positions[rows] + 1] - first
+
+    pairs = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(
+        counts.sum()
+    )
+
+    return (
+        np.repeat(rows, counts),
+        entry["targets"][pairs],
+        entry["weights"][pairs],
+    )
+
+
+def recode_panel(
+    temp: pd.DataFrame, panel: int, cols: list = occ_cols
+) -> pd.DataFrame:
+    """
+    This function adds the occ1990dd codes of the raw occupation columns in
+    cols, e.g., "occ_1990dd" for "occ_raw", using the crosswalk of the panel's
+    census classification.
+    """
+
+    entry = panel_crosswalk(panel)
+
+    return temp.assign(
+        **{
+            col.replace("_raw", "_1990dd"): recode(temp[col], entry)
+            for col in cols
+            if col in temp.columns
+        }
+    )
+
+
+def expand_panel(temp: pd.DataFrame, panel: int, col: str) -> pd.DataFrame:
+    """
+    This function recodes one raw occupation column with all occ1990dd codes
+    of split raw codes: each row is repeated once per occ1990dd code of its
+    raw code, with the share in column col with "_raw" replaced by "_weight".
+    Applying it to the source and to the destination column gives the weight
+    of each pair as the product of the two shares.
+    """
+
+    entry = panel_crosswalk(panel)
+    rows, targets, weights = recode_weighted(temp[col], entry)
+
+    temp = temp.iloc[rows, :]
+    name = col.replace("_raw", "")
+
+    return temp.assign(
+        **{
+            f"{name}_1990dd": pd.array(targets, dtype="Int64"),
+            f"{name}_weight": weights,
+        }
+    )
+
+
+def RecodeOcc_Panel96And01(
+    temp: pd.DataFrame, panel: int = 1996, cols: list = occ_cols
+) -> pd.DataFrame:
+    """
+    This function recodes the raw occupation codes (1990 census codes) of the
+    1996 and 2001 panels to occ1990dd (see recode_panel).
+    """
+
+    return recode_panel(temp, panel, cols)
+
+
+def RecodeOcc_Panel04And08(
+    temp: pd.DataFrame, panel: int = 2004, cols: list = occ_cols
+) -> pd.DataFrame:
+    """
+    This function recodes the raw occupation codes (2000 census codes) of the
+    2004 and 2008 panels to occ1990dd (see recode_panel).
+    """
+
+    return recode_panel(temp, panel, cols)
+
@@ -0,0 +1,151 @@
+#! python3
+
+# ?? This script stores PanelIndex, an index over a cleaned panel (sorted by
+# ?? "indid" and "ym") for fast lookups of an individual's monthly history, of
+# ?? a month of an individual, and of a spell with its surrounding months.
+
+# &? The index is a set of CSR-style offset arrays over the rows:
+# &?     individuals:  the rows of individual p are person_offsets[p] to
+# &?                   person_offsets[p + 1],
+# &?     months:       individual p has one slot per calendar month from its
+# &?                   first to its last month, in month_rows[month_offsets[p]
+# &?                   : month_offsets[p + 1]], holding the row of the month
+# &?                   (-1 for months not in the panel),
+# &?     spells:       spell s of a notion starts at row
+# &?                   spells[notion]["starts"][s] and lasts
+# &?                   spells[notion]["lengths"][s] rows.
+# &? Individuals and spell ids are mapped to p and s by dictionaries, so each
+# &? lookup is O(1), and the rows are returned as slices of the panel
+# &? (temp.iloc[start:stop], which does not copy the data).
+
+import numpy as np
+import pandas as pd
+
+from util.funcsforpandas import segments
+
+spell_notions = ["ubar", "ustar", "u"]
+
+
+def month_ordinal(ym) -> np.ndarray:
+    """
+    This function returns the number of months since January 1970 of dates.
+    """
+
+    return np.asarray(ym, dtype="datetime64[M]").astype(np.int64)
+
+
+class PanelIndex:
+    """
+    This class indexes a cleaned panel whose rows of an individual are
+    contiguous and sorted by "ym" (as exported by SIPP_cleaning).
+    """
+
+    def __init__(self, temp: pd.DataFrame):
+        self.temp = temp
+
+        # -? individuals
+        new_person = segments(temp, ["indid"])
+        starts = np.flatnonzero(new_person)
+        self.person_offsets = np.r_[starts, len(temp)]
+        self.persons = temp["indid"].to_numpy()[starts]
+        self.person_ids = {
+            indid: p for p, indid in enumerate(self.persons.tolist())
+        }
+
+        # -? months: one slot per calendar month of each individual
+        month = month_ordinal(temp["ym"].to_numpy())
+        person = np.cumsum(new_person) - 1
+        self.first_month = month[starts]
+        last_month = month[self.person_offsets[1:] - 1]
+        span = last_month - self.first_month + 1
+        self.month_offsets = np.r_[0, np.cumsum(span)]
+
+        self.month_rows = np.full(self.month_offsets[-1], -1, dtype=np.int64)
+        self.month_rows[
+            self.month_offsets[person] + month - self.first_month[person]
+        ] = np.arange(len(temp))
+
+        # -? spells of each notion (rows of a spell are contiguous)
+        self.spells = {}
+        for notion in spell_notions:
+            col = f"{notion}_spell_no"
+            if col not in temp.columns:
+                continue
+            spell_no = temp[col]
+            in_spell = spell_no.notna().to_numpy()
+            new_spell = in_spell & segments(temp, [col])
+            rows = np.flatnonzero(new_spell)
+            lengths = np.bincount(
+                (np.cumsum(new_spell) - 1)[in_spell], minlength=len(rows)
+            )
+            ids = spell_no.to_numpy("float64", na_value=np.nan)[rows]
+            self.spells[notion] = {
+                "ids": {int(s): k for k, s in enumerate(ids.tolist())},
+                "starts": rows,
+                "lengths": lengths,
+            }
+
+    def __len__(self) -> int:
+        return len(self.persons)
+
+    def rows(self, indid) -> slice:
+        """
+        This method returns the rows of an individual, as a slice.
+        """
+
+        p = self.person_ids[indid]
+
+        return slice(self.person_offsets[p], self.person_offsets[p + 1])
+
+    def history(self, indid) -> pd.DataFrame:
+        """
+        This method returns the full monthly history of an individual.
+        """
+
+        return self.temp.iloc[self.rows(indid)]
+
+    def row(self, indid, ym) -> int:
+        """
+        This method returns the row of an individual in a month (a date, e.g.,
+        "2001-03-01"), or -1 if the individual is not in the panel that month.
+        """
+
+        p = self.person_ids[indid]
+        slot = int(month_ordinal(pd.Timestamp(ym))) - self.first_month[p]
+        span = self.month_offsets[p + 1] - self.month_offsets[p]
+        if slot < 0 or slot >= span:
+            return -1
+
+        return int(self.month_rows[self.month_offsets[p] + slot])
+
+    def month(self, indid, ym) -> pd.DataFrame:
+        """
+        This method returns the row of an individual in a month (empty if the
+        individual is not in the panel that month).
+        """
+
+        row = self.row(indid, ym)
+        if row < 0:
+            return self.temp.iloc[:0]
+
+        return self.temp.iloc[row : row + 1]
+
+    def spell(
+        self, spell_no, notion: str = "ubar", context: int = 1
+    ) -> pd.DataFrame:
+        """
+        This method returns the months of a spell of a notion ("ubar",
+        "ustar", or "u"), with up to context months of the same individual
+        before and after it.
+        """
+
+        spells = self.spells[notion]
+        s = spells["ids"][int(spell_no)]
+        start = spells["starts"][s]
+        stop = start + spells["lengths"][s]
+
+        p = self.person_ids[self.temp["indid"].iat[start]]
+        start = max(start - context, self.person_offsets[p])
+        stop = min(stop + context, self.person_offsets[p + 1])
+
+        return self.temp.iloc[start:stop]
@@ -1,10 +1,41 @@
 import os
+import configparser
+import tempfile
 
-data_root = "E:\\Projects\\OccupationalMobilityInEUE-Data"
+# ?? Data roots are resolved in the following order:
+# ??     (1) environment variables: OCCMOB_DATA_ROOT (parent of the rawdata,
+# ??         tempdata and finaldata folders), or OCCMOB_RAWDATA,
+# ??         OCCMOB_TEMPDATA, OCCMOB_FINALDATA, OCCMOB_SCRATCH, OCCMOB_CACHE
+# ??         for each root;
+# ??     (2) section [paths] of a config file (keys data_root, rawdata,
+# ??         tempdata, finaldata, scratch, cache), named by OCCMOB_CONFIG or
+# ??         paths.ini in the project folder (next to codes);
+# ??     (3) the defaults below.
+# ?? rawdata, tempdata and finaldata can stay on shared storage, while scratch
+# ?? (and cache, inside scratch by default) should be on a fast local disk,
+# ?? e.g., local NVMe or tmpfs, for intermediate files and checkpoints.
 
-RAWDATA_PATH = os.path.join(data_root, "rawdata")
-TEMPDATA_PATH = os.path.join(data_root, "tempdata")
-FINALDATA_PATH = os.path.join(data_root, "finaldata")
+CODES_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_PATH = os.path.dirname(CODES_PATH)
+
+config = configparser.ConfigParser()
+config.read(
+    os.environ.get("OCCMOB_CONFIG", os.path.join(PROJECT_PATH, "paths.ini"))
+)
+config = dict(config["paths"]) if config.has_section("paths") else {}
+
+def setting(key, default):
+    return os.environ.get(f"OCCMOB_{key.upper()}", config.get(key, default))
+
+data_root = setting("data_root", "E:\\Projects\\OccupationalMobilityInEUE-Data")
+
+RAWDATA_PATH = setting("rawdata", os.path.join(data_root, "rawdata"))
+TEMPDATA_PATH = setting("tempdata", os.path.join(data_root, "tempdata"))
+FINALDATA_PATH = setting("finaldata", os.path.join(data_root, "finaldata"))
+SCRATCH_PATH = setting(
+    "scratch", os.path.join(tempfile.gettempdir(), "OccupationalMobilityInEUE")
+)
+CACHE_PATH = setting("cache", os.path.join(SCRATCH_PATH, "cache"))
 
 def rawdata(*args):
     return os.path.join(RAWDATA_PATH, *args)
@@ -13,4 +44,12 @@ def tempdata(*args):
     return os.path.join(TEMPDATA_PATH, *args)
 
 def finaldata(*args):
-    return os.path.join(FINALDATA_PATH, *args)
\ No newline at end of file
+    return os.path.join(FINALDATA_PATH, *args)
+
+def scratch(*args):
+    os.makedirs(SCRATCH_PATH, exist_ok=True)
+    return os.path.join(SCRATCH_PATH, *args)
+
+def cache(*args):
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    return os.path.join(CACHE_PATH, *args)
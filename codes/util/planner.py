@@ -0,0 +1,271 @@
+#! python3
+
+# ?? This script stores a planner of the resources of a cleaning run (pandas
+# ?? backend): from the memory needed to clean a panel, estimated from the
+# ?? headers of its wave files (see codes/util/preflight.py), and the memory
+# ?? and cores available, it chooses the number of shards and of worker
+# ?? processes (see SIPP_sharded in codes/clean/aSIPP.py), and the rows per
+# ?? chunk read from compressed or redesigned files.
+
+# &? Peak memory is estimated in multiples of the preflight estimate of the
+# &? raw variables read (measured with tracemalloc, and rounded up):
+# &?     read:    waves read and stacked,
+# &?     sample:  step 2 to step 3 (the largest, with the raw panel alive),
+# &?     spells:  step 4 to step 7,
+# &?     weights: step 8 to step x.
+# &? In a sharded run, the parent first reads the raw panel and copies it
+# &? into shared memory (read, plus the shared input), and frees the raw panel
+# &? before the workers start; while they run, the parent holds the input and
+# &? output columns in shared memory (shared_factor), and each worker the peak
+# &? of its shard.
+# &? The available memory is read from the OS (the container limit if lower),
+# &? and can be set with the setting "memory_gb" (OCCMOB_MEMORY_GB, or
+# &? memory_gb in paths.ini, see codes/util/paths.py).
+
+import os
+
+from util.paths import setting
+
+stage_factors = {"read": 1.5, "sample": 2.5, "spells": 2.0, "weights": 1.5}
+
+# -? shared memory of a sharded run, in multiples of the preflight estimate
+shared_factor = 2.0
+
+# -? memory of a worker process on top of its shard (interpreter and pandas)
+process_bytes = 150 * 2**20
+
+# -? share of the available memory a plan may use
+memory_share = 0.8
+
+# -? smallest estimate per worker worth a separate process
+min_worker_bytes = 64 * 2**20
+
+max_shards = 256
+
+# -? rows per chunk: about chunk_share of the memory a plan may use
+chunk_share = 1 / 32
+min_chunk_rows = 50_000
+max_chunk_rows = 1_000_000
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. available resources
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def _read_number(path: str):
+    try:
+        with open(path) as f:
+            value = f.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+    return int(value) if value.isdigit() else None
+
+
+def _cgroup_available():
+    """
+    This function returns the memory left under the memory limit of the
+    container (cgroup v2 or v1), or None if there is no limit.
+    """
+
+    for limit_path, usage_path in [
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        (
+            "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+            "/sys/fs/cgroup/memory/memory.usage_in_bytes",
+        ),
+    ]:
+        limit = _read_number(limit_path)
+        usage = _read_number(usage_path)
+        if limit is not None and usage is not None and limit < 2**60:
+            return max(limit - usage, 0)
+
+    return None
+
+
+def _os_available():
+    if os.path.exists("/proc/meminfo"):
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+
+    if os.name == "nt":
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+        return status.ullAvailPhys
+
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def available_memory() -> int:
+    """
+    This function returns the memory available now, in bytes: the setting
+    "memory_gb" if set, or else the smaller of the memory available on the
+    machine and under the container limit.
+    """
+
+    memory_gb = setting("memory_gb", None)
+    if memory_gb is not None:
+        return int(float(memory_gb) * 1e9)
+
+    values = [
+        value
+        for value in [_os_available(), _cgroup_available()]
+        if value is not None
+    ]
+    if not values:
+        raise OSError(
+            "Available memory unknown: set memory_gb (see codes/util/paths.py)"
+        )
+
+    return min(values)
+
+
+def available_cores() -> int:
+    """
+    This function returns the number of cores this process may run on.
+    """
+
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. plans
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def sharded_peak(size: float, n_shards: int, n_workers: int) -> float:
+    """
+    This function returns the estimated peak memory of a sharded run, for a
+    preflight estimate of size bytes: the larger of the peaks while the
+    parent reads the raw panel into shared memory, and while the workers run.
+    """
+
+    per_worker = max(stage_factors.values()) * size / n_shards + process_bytes
+    reading = (stage_factors["read"] + shared_factor / 2) * size
+    running = shared_factor * size + n_workers * per_worker
+
+    return max(reading, running)
+
+
+def plan_cleaning(
+    panel: int,
+    columns: list = None,
+    sample_fraction: float = 1.0,
+    memory: int = None,
+    cores: int = None,
+    verbose: bool = True,
+) -> dict:
+    """
+    This function plans the cleaning of a panel (the raw variables in
+    columns, all by default) within the memory available (or memory bytes)
+    on the cores available (or cores), and returns a dictionary:
+        "rows", "bytes":   raw person-months and preflight estimate to read,
+        "memory", "cores": resources the plan is made for,
+        "n_shards":        shards (1: no sharding),
+        "n_workers":       worker processes,
+        "chunk_rows":      rows per chunk read,
+        "peak_bytes":      estimated peak memory,
+        "fits":            whether the peak fits in the memory a plan may use.
+    One worker runs per min_worker_bytes of estimate, up to the cores. The
+    shards are doubled until the workers fit, and then the workers reduced.
+    """
+
+    from util.preflight import preflight
+    from util.waves import vars_all
+
+    report = preflight([panel], columns or vars_all, verbose=False)
+    rows = int(report["rows"].sum() * sample_fraction)
+    size = float(report["bytes"].sum() * sample_fraction)
+    memory = memory or available_memory()
+    cores = cores or available_cores()
+    budget = memory_share * memory
+
+    n_workers = int(max(min(cores, size // min_worker_bytes), 1))
+    n_shards = 1
+    peak = max(stage_factors.values()) * size
+    if n_workers > 1 or peak > budget:
+        n_shards = n_workers
+        while (
+            n_shards < max_shards
+            and sharded_peak(size, n_shards, n_workers) > budget
+        ):
+            n_shards = min(n_shards * 2, max_shards)
+        while (
+            n_workers > 1
+            and sharded_peak(size, n_shards, n_workers) > budget
+        ):
+            n_workers -= 1
+        peak = sharded_peak(size, n_shards, n_workers)
+
+    bytes_per_row = size / max(rows, 1)
+    chunk_rows = int(chunk_share * budget / max(bytes_per_row, 1))
+    chunk_rows = min(max(chunk_rows, min_chunk_rows), max_chunk_rows)
+
+    plan = {
+        "panel": panel,
+        "rows": rows,
+        "bytes": size,
+        "memory": memory,
+        "cores": cores,
+        "n_shards": n_shards,
+        "n_workers": n_workers,
+        "chunk_rows": chunk_rows,
+        "peak_bytes": peak,
+        "fits": peak <= budget,
+    }
+
+    if verbose:
+        print(
+            f"Plan {panel}: {rows} rows, {memory / 1e9:.1f} GB and {cores} "
+            f"cores available: {n_shards} shards, {n_workers} workers, "
+            f"{chunk_rows} rows per chunk, peak about {peak / 1e9:.2f} GB"
+        )
+        if not plan["fits"]:
+            print(
+                f"Plan {panel}: the estimated peak exceeds "
+                f"{memory_share:.0%} of the available memory"
+            )
+
+    return plan
+
+
+def fit_workers(plan: dict, memory: int = None) -> int:
+    """
+    This function returns the workers of a plan that fit in the memory
+    available now (or memory bytes), at least one: other processes may have
+    taken memory since the plan was made.
+    """
+
+    budget = memory_share * (memory or available_memory())
+    n_workers = plan["n_workers"]
+    while (
+        n_workers > 1
+        and sharded_peak(plan["bytes"], plan["n_shards"], n_workers) > budget
+    ):
+        n_workers -= 1
+
+    return n_workers
@@ -0,0 +1,146 @@
+#! python3
+
+# ?? This script stores the preflight check of the raw wave files of panels,
+# ?? run before any data is loaded. Only the .dta headers are read (see
+# ?? codes/util/dta.py), to check that
+# ??     (1) every wave file exists,
+# ??     (2) every variable in columns is in every wave file (for the
+# ??         redesigned panels, every source variable, see
+# ??         codes/util/adapters.py),
+# ??     (3) variables have the expected storage type: strings for the
+# ??         variables in vars_string, numbers otherwise,
+# ?? and to estimate the number of rows and the memory needed to read them.
+# ?? All problems are collected and raised together in one PreflightError.
+
+# &? The memory estimate is per variable read: the width of numeric types, and
+# &? for strings a Python str object (about 57 bytes plus the width) and its
+# &? pointer. The cleaning procedures need a multiple of it.
+
+import os
+
+import pandas as pd
+
+from util.dta import read_header, type_widths
+from util.waves import panel_waves, vars_all, vars_string, wave_files
+
+# -? bytes per string value in memory, on top of its width
+str_overhead = 57 + 8
+
+
+class PreflightError(ValueError):
+    pass
+
+
+def value_bytes(kind: str) -> int:
+    """
+    This function returns the estimated memory of one value of a storage
+    type, once read into a DataFrame.
+    """
+
+    if kind.startswith("str"):
+        width = 8 if kind == "strL" else int(kind[3:])
+        return width + str_overhead
+
+    return type_widths[kind]
+
+
+def check_wave(path: str, columns: list = vars_all) -> dict:
+    """
+    This function checks the header of one wave file, and returns its number
+    of rows, the estimated memory to read the variables in columns, and the
+    list of problems found.
+    """
+
+    from util.adapters import is_redesign_file, source_vars
+
+    report = {"path": path, "rows": 0, "bytes": 0, "problems": []}
+    if not os.path.exists(path):
+        report["problems"].append(f"{path}: file not found")
+        return report
+
+    try:
+        header = read_header(path)
+    except (ValueError, OSError) as error:
+        report["problems"].append(f"{path}: unreadable header ({error})")
+        return report
+
+    types = dict(zip(header["varlist"], header["typlist"]))
+    report["rows"] = header["nobs"]
+
+    if is_redesign_file(path):
+        try:
+            needed = source_vars(columns, header["varlist"])
+        except ValueError as error:
+            report["problems"].append(f"{path}: {error}")
+            return report
+    else:
+        needed = [col for col in columns if col in types]
+        for col in columns:
+            if col not in types:
+                report["problems"].append(f"{path}: variable {col} not found")
+                continue
+            is_str = types[col].startswith("str")
+            if is_str != (col in vars_string):
+                report["problems"].append(
+                    f"{path}: variable {col} is {types[col]}, expected "
+                    f"{'a string' if col in vars_string else 'a number'}"
+                )
+
+    report["bytes"] = header["nobs"] * sum(
+        value_bytes(types[col]) for col in needed
+    )
+
+    return report
+
+
+def preflight(
+    panels: list,
+    columns: list = vars_all,
+    missing_ok: bool = False,
+    max_bytes: int = None,
+    verbose: bool = True,
+) -> pd.DataFrame:
+    """
+    This function checks the headers of all wave files of the panels in
+    panels, and returns one row per wave file with its number of rows and
+    estimated memory, or raises PreflightError listing all problems found.
+    With missing_ok=True, missing wave files are skipped (e.g., waves not
+    released yet in incremental runs). With max_bytes, a panel whose
+    estimated memory exceeds max_bytes is a problem too.
+    """
+
+    reports, problems = [], []
+    for panel in panels:
+        if panel not in panel_waves:
+            problems.append(f"Panel {panel} is not a SIPP panel")
+            continue
+
+        panel_reports = []
+        for path in wave_files(panel):
+            if missing_ok and not os.path.exists(path):
+                continue
+            report = check_wave(path, columns)
+            problems.extend(report.pop("problems"))
+            panel_reports.append(dict(report, panel=panel))
+
+        rows = sum(report["rows"] for report in panel_reports)
+        size = sum(report["bytes"] for report in panel_reports)
+        if max_bytes is not None and size > max_bytes:
+            problems.append(
+                f"Panel {panel} needs about {size / 1e9:.1f} GB, more than "
+                f"max_bytes ({max_bytes / 1e9:.1f} GB)"
+            )
+        if verbose:
+            print(
+                f"Preflight {panel}: {len(panel_reports)} wave files, "
+                f"{rows} rows, about {size / 1e9:.2f} GB to read"
+            )
+        reports.extend(panel_reports)
+
+    if problems:
+        raise PreflightError(
+            f"Preflight found {len(problems)} problems:\n"
+            + "\n".join(problems)
+        )
+
+    return pd.DataFrame(reports, columns=["panel", "path", "rows", "bytes"])
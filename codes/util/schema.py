@@ -0,0 +1,283 @@
+#! python3
+
+# ?? This script stores the schema of the cleaned person-month datasets
+# ?? (tempdata/temp`panel'.dta): column order, dtype, variable label, and
+# ?? description. The schema is applied once, at export, by all backends.
+# ?? It also declares the columns each stage of the cleaning procedures uses,
+# ?? so that a run for a subset of the output columns reads and carries only
+# ?? the columns it needs (see raw_columns and prune).
+
+# &? dtype None keeps the dtype as read from the raw wave files (or as
+# &? constructed, for dates), which depends on the storage types in the files.
+# &? Descriptions are taken from the description-only entries of labels.py.
+
+import pandas as pd
+
+from util.categoricals import descriptions
+from util.waves import vars_all
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. output schema
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+# -? (name, dtype, label)
+schema_temp = [
+    ("pweights", "float64", "Person weight, wpfinwgt over its panel sum"),
+    ("indid", "Int64", "Individual id, panel followed by lgtkey"),
+    ("ym", None, "Year-month"),
+    ("len_ubar_spell", "Int64", "Length of the E(UBAR)E spell"),
+    ("ubar_spell_no", "Int64", "E(UBAR)E spell id"),
+    ("ustar_spell_no", "Int64", "E(USTAR)E spell id"),
+    ("u_spell_no", "Int64", "E(U)E spell id"),
+    ("source_occ_raw", "Int64", "Raw occupation before the E(UBAR)E spell"),
+    ("destination_occ_raw", "Int64", "Raw occupation after the E(UBAR)E spell"),
+    ("tpearn", None, "Total person earned income"),
+    ("occ_raw", "Int64", "Raw occupation of the main job"),
+    ("empl", "Int64", "Employed"),
+    ("unempl", "Int64", "Unemployed"),
+    ("outlf", "Int64", "Out of labor force"),
+    ("panel", "Int64", "SIPP panel"),
+    ("swave", None, "Wave"),
+    ("year", None, "Reference year"),
+    ("month", None, "Reference month"),
+    ("age", None, "Age"),
+    ("tbyear", None, "Year of birth"),
+    ("male", "Int64", "Male"),
+    ("edu", "Int64", "Education"),
+    ("ems", None, "Marital status"),
+    ("race", "Int64", "Race"),
+    ("rmesr", "Int64", "Employment status recode for the month"),
+    ("rwkesr1", "Int64", "Employment status recode for week 1"),
+    ("rwkesr2", "Int64", "Employment status recode for week 2"),
+    ("rwkesr3", "Int64", "Employment status recode for week 3"),
+    ("rwkesr4", "Int64", "Employment status recode for week 4"),
+    ("rwkesr5", "Int64", "Employment status recode for week 5"),
+    ("lgtkey", None, "Person longitudinal key"),
+    ("ssuid", None, "Sample unit identifier"),
+    ("eentaid", None, "Address id of the household at entry"),
+    ("epppnum", None, "Person number"),
+    ("cont_spell_no", "int64", "Continuous spell id within the individual"),
+    ("len_cont_spell", "Int64", "Length of the continuous spell"),
+    ("len_ustar_spell", "Int64", "Length of the E(USTAR)E spell"),
+    ("len_u_spell", "Int64", "Length of the E(U)E spell"),
+    ("start_of_ubar", "Int64", "First month of a non-employment spell"),
+    ("end_of_ubar", "Int64", "Last month of a non-employment spell"),
+    ("occurrence", "int64", "Occurrence count of the individual"),
+    ("inlf", "Int64", "In labor force"),
+    ("retired", "Int64", "Retired"),
+    ("mn_empl", "Int64", "Employed, monthly indicator only"),
+    ("mn_unempl", "Int64", "Unemployed, monthly indicator only"),
+    ("mn_outlf", "Int64", "Out of labor force, monthly indicator only"),
+    ("srotaton", None, "Rotation group"),
+    ("ebmnth", None, "Month of birth"),
+    ("eppintvw", None, "Person's interview status"),
+    ("ersend1", None, "Main reason stopped working for employer 1"),
+    ("ersend2", None, "Main reason stopped working for employer 2"),
+    ("ersnowrk", None, "Main reason for not working"),
+    ("eeno1", None, "Employer 1 number"),
+    ("eeno2", None, "Employer 2 number"),
+    ("tsjdate1", None, "Starting date of job 1"),
+    ("tsjdate2", None, "Starting date of job 2"),
+    ("tejdate1", None, "Ending date of job 1"),
+    ("tejdate2", None, "Ending date of job 2"),
+    ("ejbhrs1", None, "Usual hours worked per week at job 1"),
+    ("ejbhrs2", None, "Usual hours worked per week at job 2"),
+    ("tpmsum1", None, "Earnings from job 1 this month"),
+    ("tpmsum2", None, "Earnings from job 2 this month"),
+    ("eclwrk1", None, "Class of worker, job 1"),
+    ("eclwrk2", None, "Class of worker, job 2"),
+    ("tjbocc1", None, "Occupation, job 1"),
+    ("ajbocc1", None, "Allocation flag for tjbocc1"),
+    ("tjbocc2", None, "Occupation, job 2"),
+    ("ajbocc2", None, "Allocation flag for tjbocc2"),
+    ("tptrninc", None, "Total person transfer income"),
+    ("tptotinc", None, "Total person income"),
+    ("tpothinc", None, "Total person other income"),
+    ("tpprpinc", None, "Total person property income"),
+    ("wpfinwgt", None, "Person weight"),
+    ("selfemp", "Int64", "Self-employed in the month"),
+    ("ind_selfemp", "Int64", "Ever self-employed in the panel"),
+    ("armed", "Int64", "Ever in the armed forces (reported)"),
+    ("ind_armed", "Int64", "Ever in the armed forces in the panel"),
+    ("ind_gov", "Int64", "Ever employed by the government in the panel"),
+    ("disc_spell", "int64", "Last month before a gap in the individual's months"),
+    ("firmid", "Int64", "Employer number of the main job"),
+    ("sum_weights", "float64", "Panel sum of wpfinwgt"),
+]
+
+output_schema = [
+    {
+        "name": name,
+        "dtype": dtype,
+        "label": label,
+        "description": descriptions.get(name),
+    }
+    for name, dtype, label in schema_temp
+]
+
+output_columns = [column["name"] for column in output_schema]
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. apply the schema
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def apply_schema(temp: pd.DataFrame, columns: list = None) -> pd.DataFrame:
+    """
+    This function keeps the columns of the output schema (or only those in
+    columns) in schema order and casts them to the schema dtypes. Columns not
+    in the schema are dropped.
+    """
+
+    names = output_columns
+    if columns is not None:
+        names = [col for col in output_columns if col in columns]
+
+    missing = [col for col in names if col not in temp.columns]
+    if missing:
+        raise ValueError(f"Columns missing from the output schema: {missing}")
+
+    temp = temp[names]
+    dtypes = {
+        column["name"]: column["dtype"]
+        for column in output_schema
+        if column["name"] in names
+        and column["dtype"] is not None
+        and str(temp[column["name"]].dtype) != column["dtype"]
+    }
+
+    return temp.astype(dtypes) if dtypes else temp
+
+
+def stata_variable_labels() -> dict:
+    """
+    This function returns the variable labels of the output schema, in the
+    format of the variable_labels argument of DataFrame.to_stata.
+    """
+
+    return {column["name"]: column["label"] for column in output_schema}
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 3. column dependencies
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+# &? The stages of the cleaning procedures (pandas backend), in order, with the
+# &? raw variables and earlier columns each of them uses:
+# &?     "sample":  step 2 to step 3 (SIPP_sample), including the raw variables
+# &?                dropped in s-3-7,
+# &?     "spells":  step 4 to step 7 (SIPP_spells),
+# &?     "weights": step 8 to step x (SIPP_weights),
+# &?     "checks":  integrity checks and the printed summary (step y).
+# &? Columns are created by the stage that needs them. All other raw
+# &? variables are only carried to the output. A column not used by later
+# &? stages and not requested as output is dead after a stage (see prune).
+
+stage_inputs = {
+    "sample": [
+        "lgtkey",
+        "rhcalmn",
+        "rhcalyr",
+        "tbyear",
+        "esex",
+        "eeducate",
+        "eafnow",
+        "eafever",
+        "erace",
+        "ebuscntr",
+        "ebno1",
+        "ebno2",
+        "eppintvw",
+    ],
+    "spells": [
+        "indid",
+        "ym",
+        "rmesr",
+        "rwkesr1",
+        "rwkesr2",
+        "rwkesr3",
+        "rwkesr4",
+        "rwkesr5",
+        "ersend1",
+        "ersend2",
+        "ersnowrk",
+        "eclwrk1",
+        "eclwrk2",
+        "eeno1",
+        "eeno2",
+        "tsjdate1",
+        "tsjdate2",
+        "tejdate1",
+        "tejdate2",
+        "ejbhrs1",
+        "ejbhrs2",
+        "tpmsum1",
+        "tpmsum2",
+        "tjbocc1",
+        "ajbocc1",
+        "tjbocc2",
+        "ajbocc2",
+    ],
+    "weights": [
+        "panel",
+        "wpfinwgt",
+        "ubar_spell_no",
+        "ustar_spell_no",
+        "u_spell_no",
+    ],
+    "checks": [
+        "indid",
+        "ym",
+        "ubar_spell_no",
+        "ustar_spell_no",
+        "u_spell_no",
+        "cont_spell_no",
+        "empl",
+        "unempl",
+        "outlf",
+        "firmid",
+        "occ_raw",
+        "source_occ_raw",
+        "destination_occ_raw",
+    ],
+}
+
+stages = list(stage_inputs)
+
+
+def raw_columns(outputs: list = None) -> list:
+    """
+    This function returns the raw variables to read (in the order of
+    vars_all) for the output columns in outputs (all by default): those used
+    by any stage, and those requested as output.
+    """
+
+    if outputs is None:
+        return vars_all
+
+    unknown = [col for col in outputs if col not in output_columns]
+    if unknown:
+        raise ValueError(f"Columns not in the output schema: {unknown}")
+
+    needed = set(outputs).union(*stage_inputs.values())
+
+    return [col for col in vars_all if col in needed]
+
+
+def prune(
+    temp: pd.DataFrame, stage: str, outputs: list = None
+) -> pd.DataFrame:
+    """
+    This function drops the columns of temp that are dead after a stage: not
+    used by any later stage, and not in outputs. With outputs=None (all
+    output columns), temp is returned as is.
+    """
+
+    if outputs is None:
+        return temp
+
+    later = stages[stages.index(stage) + 1 :]
+    live = set(outputs).union(*(stage_inputs[name] for name in later))
+    dead = [col for col in temp.columns if col not in live]
+
+    return temp.drop(columns=dead) if dead else temp
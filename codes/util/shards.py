@@ -0,0 +1,56 @@
+#! python3
+
+# ?? This script stores functions to split a SIPP panel into shards of
+# ?? individuals, so that individual-level procedures can run shard by shard.
+
+# &? A shard is a contiguous range of rows [bounds[i], bounds[i + 1]) of a
+# &? DataFrame, and all rows of an individual are in the same shard.
+
+import numpy as np
+import pandas as pd
+
+
+def shard_ids(keys: pd.Series, n_shards: int) -> np.ndarray:
+    """
+    This function assigns each row to one of n_shards shards by a hash of the
+    individual key (e.g., "lgtkey"), so that all rows of an individual are in
+    the same shard. The hash is stable across runs and machines.
+    """
+
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+    return (hashes % np.uint64(n_shards)).astype(np.int64)
+
+
+def sort_shards(temp: pd.DataFrame, key: str, n_shards: int) -> tuple:
+    """
+    This function reorders the rows of a DataFrame so that the shards (by a
+    hash of the variable key) are contiguous, and returns the reordered
+    DataFrame and the bounds of the shards. Rows keep their original order
+    within each shard.
+    """
+
+    ids = shard_ids(temp[key], n_shards)
+    order = np.argsort(ids, kind="stable")
+    bounds = np.searchsorted(ids[order], np.arange(n_shards + 1))
+
+    return temp.iloc[order, :], bounds
+
+
+def range_bounds(keys: pd.Series, n_shards: int) -> np.ndarray:
+    """
+    This function splits a DataFrame sorted by the individual key into at most
+    n_shards contiguous ranges of similar numbers of rows, without splitting
+    any individual, and returns the bounds of the ranges.
+    """
+
+    keys = keys.to_numpy()
+    n_rows = len(keys)
+    if n_rows == 0:
+        return np.array([0, 0])
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    targets = np.arange(1, n_shards) * n_rows // n_shards
+    cuts = starts[np.minimum(np.searchsorted(starts, targets), len(starts) - 1)]
+
+    return np.unique(np.r_[0, cuts, n_rows])
@@ -0,0 +1,274 @@
+#! python3
+
+# ?? This script stores functions to place the columns of a DataFrame in shared
+# ?? memory blocks, so that worker processes can attach to them (or to a range
+# ?? of rows of them) from a small descriptor, without pickling the data.
+
+# &? A descriptor is a dictionary {"n_rows": ..., "columns": [...]}, with one
+# &? entry per column: its name, its pandas dtype, and the names of the shared
+# &? memory blocks storing its values ("data") and missing flags ("mask").
+# &? Numeric and datetime columns are attached without copying. String columns
+# &? are stored as fixed-width arrays and converted back when attached.
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. column specifications
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def _column_spec(name: str, col: pd.Series) -> dict:
+    """
+    This function returns how a column is stored in shared memory:
+        "numpy":  numpy dtypes (e.g., int32, float64, datetime64), stored as is,
+        "masked": nullable dtypes (e.g., Int64), values and missing flags,
+        "string": string dtypes, fixed-width values and missing flags.
+    """
+
+    dtype = col.dtype
+    if isinstance(dtype, pd.StringDtype) or dtype == object:
+        width = col.dropna().astype(str).str.len().max()
+        width = 1 if pd.isna(width) else max(int(width), 1)
+        return {
+            "name": name,
+            "kind": "string",
+            "dtype": str(dtype),
+            "data_dtype": f"<U{width}",
+        }
+    if isinstance(dtype, np.dtype):
+        return {
+            "name": name,
+            "kind": "numpy",
+            "dtype": dtype.str,
+            "data_dtype": dtype.str,
+        }
+    if hasattr(dtype, "numpy_dtype"):
+        return {
+            "name": name,
+            "kind": "masked",
+            "dtype": dtype.name,
+            "data_dtype": dtype.numpy_dtype.str,
+        }
+
+    raise TypeError(f"Column {name} of dtype {dtype} cannot be shared.")
+
+
+def frame_spec(temp: pd.DataFrame) -> list:
+    """
+    This function returns the storage specification of all columns of a
+    DataFrame (see _column_spec).
+    """
+
+    return [_column_spec(name, temp[name]) for name in temp.columns]
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. create, attach and release shared memory blocks
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def _create_block(dtype: str, n_rows: int) -> shared_memory.SharedMemory:
+    size = max(np.dtype(dtype).itemsize * n_rows, 1)
+    return shared_memory.SharedMemory(create=True, size=size)
+
+
+def allocate_frame(spec: list, n_rows: int) -> tuple:
+    """
+    This function creates (uninitialized) shared memory blocks for n_rows rows
+    of the columns in spec, and returns the descriptor and the blocks.
+
+    The blocks are owned by the calling process, which should call
+    release(blocks, unlink=True) once all workers are done.
+    """
+
+    columns, blocks = [], []
+    for column in spec:
+        column = dict(column)
+        data = _create_block(column["data_dtype"], n_rows)
+        blocks.append(data)
+        column["data"] = data.name
+        column["mask"] = None
+        if column["kind"] != "numpy":
+            mask = _create_block("|b1", n_rows)
+            blocks.append(mask)
+            column["mask"] = mask.name
+        columns.append(column)
+
+    return {"n_rows": n_rows, "columns": columns}, blocks
+
+
+def release(blocks: list, unlink: bool = False):
+    """
+    This function closes the shared memory blocks in this process, and frees
+    them if unlink is True (only by the process which created them).
+    """
+
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
+
+
+def discard(blocks: list):
+    """
+    This function closes and frees the shared memory blocks created by this
+    process, skipping those already freed (e.g., after a failed run).
+    """
+
+    for block in blocks:
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _view(block, dtype: str, n_rows: int, start: int, stop: int) -> np.ndarray:
+    array = np.ndarray((n_rows,), dtype=np.dtype(dtype), buffer=block.buf)
+    return array[start:stop]
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 3. read and write DataFrames
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def write_frame(desc: dict, temp: pd.DataFrame, start: int = 0, blocks=None):
+    """
+    This function writes the columns of temp into rows start to
+    start + len(temp) of the shared memory described by desc.
+
+    The blocks are attached (and closed afterwards) unless the caller passes
+    the already opened blocks, e.g., those returned by allocate_frame.
+    """
+
+    opened = blocks is None
+    if opened:
+        blocks = _open_blocks(desc)
+    named = {block.name: block for block in blocks}
+    stop = start + len(temp)
+
+    for column in desc["columns"]:
+        col = temp[column["name"]]
+        data = _view(
+            named[column["data"]], column["data_dtype"], desc["n_rows"], start, stop
+        )
+        if column["kind"] == "numpy":
+            data[:] = col.to_numpy(dtype=column["data_dtype"])
+            continue
+        mask = _view(named[column["mask"]], "|b1", desc["n_rows"], start, stop)
+        mask[:] = col.isna().to_numpy()
+        if column["kind"] == "masked":
+            data[:] = col.to_numpy(dtype=column["data_dtype"], na_value=0)
+        else:
+            data[:] = col.astype(object).where(~mask, "").to_numpy(dtype=str)
+        del mask
+    del data
+
+    if opened:
+        release(blocks)
+
+
+def share_frame(temp: pd.DataFrame) -> tuple:
+    """
+    This function copies a DataFrame into new shared memory blocks, and
+    returns the descriptor and the blocks (see allocate_frame).
+    """
+
+    desc, blocks = allocate_frame(frame_spec(temp), len(temp))
+    write_frame(desc, temp, blocks=blocks)
+
+    return desc, blocks
+
+
+def _open_blocks(desc: dict) -> list:
+    names = []
+    for column in desc["columns"]:
+        names.append(column["data"])
+        if column["mask"] is not None:
+            names.append(column["mask"])
+
+    return [shared_memory.SharedMemory(name=name) for name in names]
+
+
+def _attach_column(
+    column: dict, named: dict, n_rows: int, start: int, stop: int
+):
+    data = _view(
+        named[column["data"]], column["data_dtype"], n_rows, start, stop
+    )
+    if column["kind"] == "numpy":
+        return data
+    mask = _view(named[column["mask"]], "|b1", n_rows, start, stop)
+    if column["kind"] == "masked":
+        array_type = pd.api.types.pandas_dtype(
+            column["dtype"]
+        ).construct_array_type()
+        return array_type(data, mask)
+
+    values = np.where(mask, None, data.astype(object))
+    return pd.array(values, dtype=column["dtype"])
+
+
+def attach_frame(desc: dict, start: int = 0, stop: int = None) -> tuple:
+    """
+    This function attaches to the shared memory described by desc, and returns
+    rows start to stop as a DataFrame (backed by the shared memory) and the
+    opened blocks.
+
+    The DataFrame is only valid until release(blocks) is called; copy it (or
+    delete all references to it) before releasing.
+    """
+
+    n_rows = desc["n_rows"]
+    stop = n_rows if stop is None else stop
+    blocks = _open_blocks(desc)
+    named = {block.name: block for block in blocks}
+
+    columns = {
+        column["name"]: _attach_column(column, named, n_rows, start, stop)
+        for column in desc["columns"]
+    }
+    temp = pd.DataFrame(columns, copy=False)
+
+    return temp, blocks
+
+
+def take_frame(desc: dict, blocks: list, ranges: list = None) -> pd.DataFrame:
+    """
+    This function copies the shared memory described by desc (or its row
+    ranges [(start, stop), ...], stacked) into a DataFrame, and frees the
+    blocks (as returned by allocate_frame) column by column: a column's
+    blocks are freed once it is copied, so that the process never holds more
+    than one column twice.
+    """
+
+    n_rows = desc["n_rows"]
+    ranges = [(0, n_rows)] if ranges is None else ranges
+    named = {block.name: block for block in blocks}
+
+    columns = {}
+    for column in desc["columns"]:
+        pieces = [
+            _attach_column(column, named, n_rows, start, stop)
+            for start, stop in ranges
+        ]
+        if column["kind"] == "numpy":
+            columns[column["name"]] = np.concatenate(pieces)
+        else:
+            columns[column["name"]] = type(pieces[0])._concat_same_type(
+                pieces
+            )
+        del pieces
+        discard(
+            [
+                named[name]
+                for name in [column["data"], column["mask"]]
+                if name is not None
+            ]
+        )
+
+    return pd.DataFrame(columns, copy=False)
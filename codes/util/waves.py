@@ -0,0 +1,309 @@
+#! python3
+
+# ?? This script stores the raw SIPP variables used in the cleaning procedures
+# ?? and functions to read the raw wave files of a panel.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from util.paths import rawdata
+
+# -? rows per chunk when a wave file is read with a person subsample
+sample_chunk_rows = 250_000
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. number of waves in each panel
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+panel_waves = {
+    1996: 12,
+    2001: 9,
+    2004: 12,
+    2008: 16,
+    2014: 4,
+    2018: 1,
+}
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. relevant variables
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+vars_id = [
+    "lgtkey",
+    "rhcalmn",
+    "rhcalyr",
+    "swave",
+    "ssuid",
+    "eentaid",
+    "epppnum",
+    "srotaton",
+]
+
+vars_demogr = [
+    "tbyear",
+    "ebmnth",
+    "esex",
+    "ems",
+    "eeducate",
+    "eafnow",
+    "eafever",
+    "erace",
+    "ebuscntr",
+    "ebno1",
+    "ebno2",
+    "eppintvw",
+]
+
+vars_emp = [
+    "rmesr",
+    "rwkesr1",
+    "rwkesr2",
+    "rwkesr3",
+    "rwkesr4",
+    "rwkesr5",
+    "ersend1",
+    "ersend2",
+    "ersnowrk",
+]
+
+vars_occ = [
+    "eeno1",
+    "eeno2",
+    "tsjdate1",
+    "tsjdate2",
+    "tejdate1",
+    "tejdate2",
+    "ejbhrs1",
+    "ejbhrs2",
+    "tpmsum1",
+    "tpmsum2",
+    "eclwrk1",
+    "eclwrk2",
+    "tjbocc1",
+    "ajbocc1",
+    "tjbocc2",
+    "ajbocc2",
+]
+
+vars_earn = ["tpearn", "tptrninc", "tptotinc", "tpothinc", "tpprpinc"]
+
+vars_wgt = ["wpfinwgt"]
+
+vars_all = vars_id + vars_demogr + vars_emp + vars_occ + vars_earn + vars_wgt
+
+# -? variables stored as strings in the wave files (all others are numeric)
+vars_string = ["lgtkey", "ssuid"]
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 3. read wave files
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def find_file(path: str) -> str:
+    """
+    This function returns the path of a raw .dta file if it exists, or else
+    the path of its first compressed copy that exists (path.gz, path.zst, or
+    the .zip archive of the same name), or else path.
+    """
+
+    stem = path[: -len(".dta")]
+    for candidate in [path, path + ".gz", path + ".zst", stem + ".zip"]:
+        if os.path.exists(candidate):
+            return candidate
+
+    return path
+
+
+def wave_files(panel: int) -> list:
+    """
+    This function returns the paths of all raw wave files of a SIPP panel,
+    e.g., rawdata/sipp96w1.dta, ..., rawdata/sipp96w12.dta for panel 1996.
+    For the redesigned panels, these are the person-month files, e.g.,
+    rawdata/pu2014w1.dta, ..., rawdata/pu2014w4.dta for panel 2014. Wave
+    files stored compressed are found as well (see find_file).
+    """
+
+    from util.adapters import redesign_files
+
+    if panel in redesign_files:
+        names = [
+            redesign_files[panel].format(wave=wave)
+            for wave in range(1, panel_waves[panel] + 1)
+        ]
+    else:
+        panel_short = str(panel)[2:]
+        names = [
+            f"sipp{panel_short}w{wave}.dta"
+            for wave in range(1, panel_waves[panel] + 1)
+        ]
+
+    return [find_file(rawdata(name)) for name in names]
+
+
+def sample_mask(lgtkey, fraction: float, seed: int = 0) -> np.ndarray:
+    """
+    This function flags the rows of the persons kept in a subsample of about
+    fraction of all persons. A person is kept if the hash of its "lgtkey"
+    (salted by seed) falls below fraction, so the same persons are kept in
+    every wave file and every run with the same seed.
+    """
+
+    keys = np.asarray(pd.Series(lgtkey).astype("str"), dtype=object)
+    hashes = pd.util.hash_array(keys, hash_key=f"{seed:016x}"[-16:])
+
+    return (hashes >> np.uint64(11)) < fraction * 2.0**53
+
+
+def read_mapped(
+    path: str, columns: list = vars_all, sample: tuple = None
+) -> pd.DataFrame:
+    """
+    This function reads one raw wave file through a memory map of its
+    fixed-width records (see codes/util/dta.py), copying only the variables
+    in columns, and with sample=(fraction, seed) only the rows of the
+    persons in the subsample. It raises ValueError for files it cannot map
+    (e.g., compressed files or strL variables).
+    """
+
+    from util.dta import read_columns
+
+    if sample is None:
+        return read_columns(path, columns)
+
+    lgtkey = read_columns(path, ["lgtkey"])["lgtkey"]
+
+    return read_columns(path, columns, rows=sample_mask(lgtkey, *sample))
+
+
+def read_streamed(
+    path: str,
+    columns: list = vars_all,
+    sample: tuple = None,
+    n_rows: int = None,
+) -> pd.DataFrame:
+    """
+    This function reads one raw wave file in chunks of records, streamed from
+    the file, so that a compressed file (.dta.gz, .dta.zst, or .zip) is
+    decompressed on the fly and never written to disk (see iter_columns in
+    codes/util/dta.py), of n_rows rows (sample_chunk_rows by default). With
+    sample=(fraction, seed), only the rows of a subsample of persons are
+    kept, chunk by chunk.
+    """
+
+    from util.dta import iter_columns
+
+    n_rows = n_rows or sample_chunk_rows
+
+    read_cols = columns
+    if sample is not None and "lgtkey" not in columns:
+        read_cols = columns + ["lgtkey"]
+
+    chunks = []
+    for chunk in iter_columns(path, read_cols, n_rows):
+        if sample is not None:
+            chunk = chunk.loc[sample_mask(chunk["lgtkey"], *sample), columns]
+        chunks.append(chunk)
+
+    return pd.concat(chunks, axis=0, ignore_index=True)
+
+
+def read_wave(
+    path: str,
+    columns: list = vars_all,
+    sample: tuple = None,
+    n_rows: int = None,
+) -> pd.DataFrame:
+    """
+    This function reads one raw wave file, keeping only the variables listed in
+    columns (in that order). Person-month files of the redesigned panels are
+    read in chunks and mapped to the same variables (see
+    codes/util/adapters.py). With sample=(fraction, seed), only the rows of
+    a subsample of persons are kept (see sample_mask), chunk by chunk. Files
+    are read through a memory map of their records (see read_mapped) when
+    possible, and by pd.read_stata otherwise. Compressed files are streamed
+    (see read_streamed). Files read in chunks are read n_rows rows at a time
+    (by default, sample_chunk_rows, or chunk_rows for redesigned files), but
+    the chunks are stacked: the rows kept of the whole file are returned at
+    once (see iter_wave to process a redesigned file chunk by chunk).
+    """
+
+    from util.adapters import is_redesign_file, read_redesign
+    from util.dta import is_compressed
+
+    if is_redesign_file(path):
+        if n_rows is None:
+            return read_redesign(path, columns, sample=sample)
+        return read_redesign(path, columns, n_rows, sample)
+
+    if is_compressed(path):
+        return read_streamed(path, columns, sample, n_rows)
+
+    try:
+        return read_mapped(path, columns, sample)
+    except ValueError:
+        pass
+
+    if sample is None:
+        return pd.read_stata(path, columns=columns, convert_categoricals=False)
+
+    n_rows = n_rows or sample_chunk_rows
+    read_cols = columns if "lgtkey" in columns else columns + ["lgtkey"]
+    chunks = []
+    with pd.read_stata(
+        path, convert_categoricals=False, chunksize=n_rows
+    ) as reader:
+        while True:
+            try:
+                chunk = reader.read(n_rows, columns=read_cols)
+            except StopIteration:
+                break
+            keep = sample_mask(chunk["lgtkey"], *sample)
+            chunks.append(chunk.loc[keep, columns])
+
+    return pd.concat(chunks, axis=0, ignore_index=True)
+
+
+def iter_wave(
+    path: str,
+    columns: list = vars_all,
+    sample: tuple = None,
+    n_rows: int = None,
+):
+    """
+    This function yields the rows of one raw wave file as read_wave returns
+    them, in chunks: a redesigned file in its mapped chunks of n_rows rows
+    (see iter_redesign in codes/util/adapters.py), so that it is never held
+    in memory at once, and any other wave file in one chunk.
+    """
+
+    from util.adapters import is_redesign_file, iter_redesign
+
+    if not is_redesign_file(path):
+        yield read_wave(path, columns, sample, n_rows)
+    elif n_rows is None:
+        yield from iter_redesign(path, columns, sample=sample)
+    else:
+        yield from iter_redesign(path, columns, n_rows, sample)
+
+
+def read_panel(
+    panel: int,
+    columns: list = vars_all,
+    sample: tuple = None,
+    n_rows: int = None,
+) -> pd.DataFrame:
+    """
+    This function reads all raw wave files of a SIPP panel and stacks them in
+    wave order (with sample=(fraction, seed), for a subsample of persons, and
+    files read in chunks n_rows rows at a time, see read_wave).
+    """
+
+    return pd.concat(
+        [
+            read_wave(path, columns, sample, n_rows)
+            for path in wave_files(panel)
+        ],
+        axis=0,
+    )
@@ -0,0 +1,330 @@
+#! python3
+
+# ?? This script stores a work queue kept in a folder on a shared filesystem,
+# ?? so that worker processes on any number of machines can share the tasks
+# ?? of a run without a scheduler service (e.g., the (panel, shard) tasks of
+# ?? the distributed cleaning, see SIPP_submit in codes/clean/aSIPP.py).
+# ?? A worker is started on each machine by
+# ??     python codes/util/workqueue.py <queue folder>
+
+# &? A task is a JSON file, named by the task, that moves between the
+# &? subfolders of the queue folder:
+# &?     pending: waiting to be claimed,
+# &?     claimed: claimed by a worker, which touches the file every
+# &?              heartbeat_seconds while the task runs,
+# &?     done:    finished, with its output in the output subfolder,
+# &?     failed:  raised an error (or depends on a failed task), with the
+# &?              traceback stored in the file.
+# &? A worker claims a task by renaming it from pending to claimed: the
+# &? rename is atomic, so exactly one worker claims each task. A task is
+# &? ready once all tasks in its "after" list are done. A claimed task not
+# &? touched for stale_seconds (e.g., its machine went down) is moved back to
+# &? pending, and a task claimed max_attempts times without finishing (e.g.,
+# &? its worker is killed by the OOM killer every time) is failed. A task
+# &? runs the function named by its "func", as
+# &? "module:function", with the queue folder, the task name and the task,
+# &? and stores its output with save_output.
+
+import importlib
+import json
+import os
+import pickle
+import socket
+import sys
+import threading
+import time
+import traceback
+
+states = ["pending", "claimed", "done", "failed"]
+
+heartbeat_seconds = 30
+stale_seconds = 600
+poll_seconds = 5
+max_attempts = 3
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 1. queue folder
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def task_path(queue_dir: str, state: str, name: str) -> str:
+    return os.path.join(queue_dir, state, f"{name}.json")
+
+
+def output_path(queue_dir: str, name: str) -> str:
+    return os.path.join(queue_dir, "output", f"{name}.pkl")
+
+
+def _write_atomic(path: str, data: bytes):
+    # &? written under a temporary name (unique to the process) and renamed,
+    # &? so that readers never see a partly written file
+    tmp = f"{path}.{socket.gethostname()}-{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def task_names(queue_dir: str, state: str) -> list:
+    """
+    This function returns the names of the tasks in a state, in order.
+    """
+
+    folder = os.path.join(queue_dir, state)
+    if not os.path.isdir(folder):
+        return []
+
+    return sorted(
+        file[: -len(".json")]
+        for file in os.listdir(folder)
+        if file.endswith(".json")
+    )
+
+
+def submit(queue_dir: str, tasks: dict, force: bool = False) -> list:
+    """
+    This function adds the tasks in tasks, {name: task}, to the pending
+    tasks of a queue folder (created if needed), and returns the names of the
+    tasks added. A task is a dictionary with the function to run, "func",
+    the names of the tasks it depends on, "after", and any other arguments
+    of the function (e.g., fingerprints of its input files). Tasks must be
+    listed after the tasks they depend on. A task already done is only added
+    again with force=True, if it differs from the task done (e.g., an input
+    file changed), or if a task it depends on is added again. Failed tasks
+    are added back.
+    """
+
+    for folder in states + ["output"]:
+        os.makedirs(os.path.join(queue_dir, folder), exist_ok=True)
+
+    done = set(task_names(queue_dir, "done"))
+    failed = set(task_names(queue_dir, "failed"))
+    added = []
+    for name, task in tasks.items():
+        if name in done:
+            old = _read_task(task_path(queue_dir, "done", name))
+            old.pop("attempts", None)
+            rerun = force or old != task
+            if not rerun and not set(task.get("after", [])) & set(added):
+                continue
+            os.remove(task_path(queue_dir, "done", name))
+        if name in failed:
+            os.remove(task_path(queue_dir, "failed", name))
+        _write_atomic(
+            task_path(queue_dir, "pending", name),
+            json.dumps(task, indent=2).encode(),
+        )
+        added.append(name)
+
+    return added
+
+
+def status(queue_dir: str) -> dict:
+    """
+    This function returns the number of tasks in each state.
+    """
+
+    return {state: len(task_names(queue_dir, state)) for state in states}
+
+
+def save_output(queue_dir: str, name: str, obj):
+    _write_atomic(
+        output_path(queue_dir, name),
+        pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL),
+    )
+
+
+def load_output(queue_dir: str, name: str):
+    with open(output_path(queue_dir, name), "rb") as f:
+        return pickle.load(f)
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 2. task states
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def _move(queue_dir: str, name: str, source: str, target: str) -> bool:
+    try:
+        os.rename(
+            task_path(queue_dir, source, name),
+            task_path(queue_dir, target, name),
+        )
+    except FileNotFoundError:
+        # &? moved by another worker first
+        return False
+
+    return True
+
+
+def _read_task(path: str) -> dict:
+    with open(path, "rb") as f:
+        return json.loads(f.read())
+
+
+def fail(queue_dir: str, name: str, state: str, error: str):
+    """
+    This function moves a task from state to failed, storing error in it.
+    """
+
+    try:
+        task = _read_task(task_path(queue_dir, state, name))
+    except FileNotFoundError:
+        return
+    task["error"] = error
+    _write_atomic(
+        task_path(queue_dir, "failed", name),
+        json.dumps(task, indent=2).encode(),
+    )
+    try:
+        os.remove(task_path(queue_dir, state, name))
+    except FileNotFoundError:
+        pass
+
+
+def requeue_stale(queue_dir: str, seconds: float = stale_seconds) -> list:
+    """
+    This function moves the claimed tasks not touched for seconds back to
+    pending (their workers are presumed dead), and returns their names.
+    """
+
+    stale = []
+    for name in task_names(queue_dir, "claimed"):
+        try:
+            age = time.time() - os.path.getmtime(
+                task_path(queue_dir, "claimed", name)
+            )
+        except FileNotFoundError:
+            continue
+        if age > seconds and _move(queue_dir, name, "claimed", "pending"):
+            stale.append(name)
+
+    return stale
+
+
+def claim_next(queue_dir: str):
+    """
+    This function claims the first ready pending task, and returns its name
+    and the task, or None if no pending task is ready. Pending tasks that
+    depend on a failed task, or that were claimed max_attempts times
+    already, are moved to failed. The number of claims of a task is kept in
+    its "attempts".
+    """
+
+    done = set(task_names(queue_dir, "done"))
+    failed = set(task_names(queue_dir, "failed"))
+    for name in task_names(queue_dir, "pending"):
+        try:
+            task = _read_task(task_path(queue_dir, "pending", name))
+        except FileNotFoundError:
+            continue
+        after = task.get("after", [])
+        if any(dep in failed for dep in after):
+            fail(queue_dir, name, "pending", "a task it depends on failed")
+            failed.add(name)
+            continue
+        if not all(dep in done for dep in after):
+            continue
+        # &? a rename keeps the modification time: touch the task first, so
+        # &? that the claim is not stale
+        try:
+            os.utime(task_path(queue_dir, "pending", name))
+        except FileNotFoundError:
+            continue
+        if not _move(queue_dir, name, "pending", "claimed"):
+            continue
+        task["attempts"] = task.get("attempts", 0) + 1
+        if task["attempts"] > max_attempts:
+            fail(
+                queue_dir,
+                name,
+                "claimed",
+                f"claimed {max_attempts} times without finishing",
+            )
+            failed.add(name)
+            continue
+        _write_atomic(
+            task_path(queue_dir, "claimed", name),
+            json.dumps(task, indent=2).encode(),
+        )
+        return name, task
+
+    return None
+
+
+def _heartbeat(path: str, stop: threading.Event):
+    while not stop.wait(heartbeat_seconds):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+
+
+def run_task(queue_dir: str, name: str, task: dict) -> bool:
+    """
+    This function runs a claimed task, and moves it to done, or to failed
+    if it raises an error. It returns whether the task succeeded.
+    """
+
+    stop = threading.Event()
+    beat = threading.Thread(
+        target=_heartbeat,
+        args=(task_path(queue_dir, "claimed", name), stop),
+        daemon=True,
+    )
+    beat.start()
+    try:
+        module, func = task["func"].split(":")
+        getattr(importlib.import_module(module), func)(queue_dir, name, task)
+    except Exception:
+        fail(queue_dir, name, "claimed", traceback.format_exc())
+        return False
+    finally:
+        stop.set()
+        beat.join()
+
+    _move(queue_dir, name, "claimed", "done")
+
+    return True
+
+
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+# ?? part 3. workers
+# ??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??#??
+
+
+def run_worker(queue_dir: str, verbose: bool = True) -> int:
+    """
+    This function runs the ready tasks of a queue folder, waiting
+    poll_seconds whenever the pending tasks wait for tasks claimed by other
+    workers, until no task is ready or claimed, and returns the number of
+    tasks it ran.
+    """
+
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    n_tasks = 0
+    while True:
+        requeue_stale(queue_dir)
+        claimed = claim_next(queue_dir)
+        if claimed is None:
+            # &? with no task running, no pending task can become ready
+            if not task_names(queue_dir, "claimed"):
+                return n_tasks
+            time.sleep(poll_seconds)
+            continue
+
+        name, task = claimed
+        start = time.time()
+        ok = run_task(queue_dir, name, task)
+        n_tasks += 1
+        if verbose:
+            print(
+                f"Worker {worker}: {name} "
+                f"{'done' if ok else 'failed'} in {time.time() - start:.1f}s"
+            )
+
+
+if __name__ == "__main__":
+    # &? codes folder, so that the functions of the tasks can be imported
+    codes_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.append(codes_path)
+    run_worker(sys.argv[1])